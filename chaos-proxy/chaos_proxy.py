@@ -0,0 +1,334 @@
+import argparse
+import asyncio
+import json
+import random
+import socket
+import struct
+
+DEFAULT_RULES = {
+    "latency_distribution": "fixed", # fixed, uniform, normal or exponential
+    "latency_ms": 0,                 # fixed delay, or the mean of the other distributions
+    "latency_jitter_ms": 0,          # half-width for uniform, standard deviation for normal
+    "latency_percent": 100,          # share of requests that get the delay
+    "error_percent": 0,              # share of requests answered by the proxy with error_status
+    "error_status": 503,
+    "reset_percent": 0,              # share of requests whose connection is reset instead
+    "bandwidth_bytes_per_s": 0,      # per-connection cap on response bytes (0 = unlimited)
+}
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "normal", "exponential")
+REASONS = {500: "Internal Server Error", 502: "Bad Gateway", 503: "Service Unavailable", 504: "Gateway Timeout", 429: "Too Many Requests"}
+MAX_HEAD_BYTES = 64 * 1024
+READ_SIZE = 64 * 1024
+
+def validate_rules(rules):
+    """Checks a (possibly partial) rules update and returns it with numbers normalized. Raises ValueError."""
+    unknown = set(rules) - set(DEFAULT_RULES)
+    if unknown:
+        raise ValueError(f"Unknown rule(s): {', '.join(sorted(unknown))}.")
+    validated = {}
+    for name, value in rules.items():
+        if name == "latency_distribution":
+            if value not in LATENCY_DISTRIBUTIONS:
+                raise ValueError(f"latency_distribution must be one of {', '.join(LATENCY_DISTRIBUTIONS)}.")
+        elif name == "error_status":
+            if not isinstance(value, int) or not 100 <= value <= 599:
+                raise ValueError("error_status must be an HTTP status code.")
+        else:
+            if not isinstance(value, (int, float)) or isinstance(value, bool) or value < 0:
+                raise ValueError(f"{name} must be a number of at least zero.")
+            if name.endswith("_percent") and value > 100:
+                raise ValueError(f"{name} must be at most 100.")
+        validated[name] = value
+    return validated
+
+class Route:
+    """One listening port forwarded to one upstream, with its own fault rules and counters."""
+
+    def __init__(self, listen_port, upstream_host, upstream_port, rng):
+        self.listen_port = listen_port
+        self.upstream_host = upstream_host
+        self.upstream_port = upstream_port
+        self.rules = dict(DEFAULT_RULES)
+        self.rng = rng
+        self.stats = {
+            "connections": 0,
+            "requests": 0,
+            "delayed_requests": 0,
+            "injected_errors": 0,
+            "injected_resets": 0,
+            "upstream_failures": 0,
+            "response_bytes": 0,
+        }
+
+    @property
+    def name(self):
+        return str(self.listen_port)
+
+    def sample_delay_s(self):
+        """Returns the delay to add to one request, drawn from the configured distribution."""
+        rules = self.rules
+        mean_ms = rules["latency_ms"]
+        if mean_ms <= 0 or self.rng.random() * 100 >= rules["latency_percent"]:
+            return 0.0
+        distribution = rules["latency_distribution"]
+        if distribution == "uniform":
+            delay_ms = self.rng.uniform(mean_ms - rules["latency_jitter_ms"], mean_ms + rules["latency_jitter_ms"])
+        elif distribution == "normal":
+            delay_ms = self.rng.gauss(mean_ms, rules["latency_jitter_ms"])
+        elif distribution == "exponential":
+            delay_ms = self.rng.expovariate(1 / mean_ms)
+        else:
+            delay_ms = mean_ms
+        return max(0.0, delay_ms) / 1000
+
+    def pick_fault(self):
+        """Returns "reset", "error" or None for one request."""
+        roll = self.rng.random() * 100
+        if roll < self.rules["reset_percent"]:
+            return "reset"
+        if roll < self.rules["reset_percent"] + self.rules["error_percent"]:
+            return "error"
+        return None
+
+async def _read_request(reader):
+    """
+    Reads one HTTP/1.x request and returns (raw bytes, chunked), or (None, False) at end of stream.
+
+    A chunked request body is not read here: only the head is returned, and the caller falls
+    back to plain byte forwarding for the rest of the connection.
+    """
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError:
+        return None, False
+    except asyncio.LimitOverrunError:
+        raise ValueError("Request head too large.")
+    content_length = 0
+    chunked = False
+    for line in head.split(b"\r\n")[1:]:
+        name, _, value = line.partition(b":")
+        name = name.strip().lower()
+        if name == b"content-length":
+            content_length = int(value.strip())
+        elif name == b"transfer-encoding" and b"chunked" in value.lower():
+            chunked = True
+    if chunked:
+        return head, True
+    body = await reader.readexactly(content_length) if content_length else b""
+    return head + body, False
+
+def _reset(writer):
+    """Closes the client connection with a TCP RST instead of a normal close."""
+    sock = writer.get_extra_info("socket")
+    if sock is not None:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+    writer.transport.abort()
+
+def _error_response(status):
+    body = json.dumps({"error": "Injected by chaos-proxy", "status": status}).encode()
+    return (
+        f"HTTP/1.1 {status} {REASONS.get(status, 'Error')}\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+        "X-Chaos-Proxy: injected\r\n\r\n"
+    ).encode() + body
+
+async def _pipe(route, reader, writer, is_response):
+    """Copies bytes from reader to writer until EOF. Responses are held to the route's bandwidth cap."""
+    try:
+        while True:
+            bandwidth = route.rules["bandwidth_bytes_per_s"] if is_response else 0
+            # Under a cap, move at most 1/20 s worth of bytes at a time so the stream stays smooth
+            data = await reader.read(max(1, min(READ_SIZE, int(bandwidth / 20))) if bandwidth > 0 else READ_SIZE)
+            if not data:
+                break
+            if bandwidth > 0:
+                # Pace each chunk so the connection never exceeds the cap, without credit for idle time
+                await asyncio.sleep(len(data) / bandwidth)
+            writer.write(data)
+            if is_response:
+                route.stats["response_bytes"] += len(data)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+async def handle_client(route, client_reader, client_writer):
+    """
+    Forwards one client connection to the route's upstream, applying the fault rules per request.
+
+    Requests are parsed just far enough to find their boundaries, so faults apply per request
+    even on keep-alive connections. Responses stream back untouched (apart from the bandwidth
+    cap). An upstream connection is opened on the first forwarded request and reused after that.
+    """
+    route.stats["connections"] += 1
+    upstream_writer = None
+    response_task = None
+    try:
+        while True:
+            request, chunked = await _read_request(client_reader)
+            if request is None:
+                break
+            route.stats["requests"] += 1
+            fault = route.pick_fault()
+            if fault == "reset":
+                route.stats["injected_resets"] += 1
+                _reset(client_writer)
+                return
+            delay_s = route.sample_delay_s()
+            if delay_s > 0:
+                route.stats["delayed_requests"] += 1
+                await asyncio.sleep(delay_s)
+            if fault == "error":
+                route.stats["injected_errors"] += 1
+                client_writer.write(_error_response(route.rules["error_status"]))
+                await client_writer.drain()
+                continue
+
+            if upstream_writer is None or upstream_writer.is_closing():
+                try:
+                    upstream_reader, upstream_writer = await asyncio.open_connection(route.upstream_host, route.upstream_port)
+                except OSError:
+                    route.stats["upstream_failures"] += 1
+                    client_writer.write(_error_response(502))
+                    await client_writer.drain()
+                    continue
+                upstream_writer.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                response_task = asyncio.ensure_future(_pipe(route, upstream_reader, client_writer, is_response=True))
+            upstream_writer.write(request)
+            await upstream_writer.drain()
+            if chunked:
+                # Streamed request bodies are passed through as-is; no more faults on this connection
+                await _pipe(route, client_reader, upstream_writer, is_response=False)
+                break
+    except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        # The client is gone, so there is no one left to receive a response still in progress
+        if response_task is not None:
+            response_task.cancel()
+        if upstream_writer is not None:
+            upstream_writer.close()
+        if not client_writer.is_closing():
+            client_writer.close()
+
+class ControlApi:
+    """
+    Small HTTP API for changing rules at runtime:
+
+        GET    /rules           rules of every route
+        PUT    /rules           update rules of every route (JSON object with the rules to change)
+        PUT    /rules/<port>    update rules of one route
+        DELETE /rules[/<port>]  reset rules to the defaults (no faults)
+        GET    /stats           per-route counters
+        GET    /health          liveness check
+    """
+
+    def __init__(self, routes):
+        self.routes = {route.name: route for route in routes}
+
+    def handle(self, method, path, body):
+        """Returns (status, response object) for one control request."""
+        parts = [part for part in path.split("?")[0].split("/") if part]
+        if parts == ["health"] and method == "GET":
+            return 200, {"status": "ok"}
+        if parts == ["stats"] and method == "GET":
+            return 200, {name: route.stats for name, route in self.routes.items()}
+        if not parts or parts[0] != "rules" or len(parts) > 2:
+            return 404, {"error": "Not found."}
+        if len(parts) == 2:
+            if parts[1] not in self.routes:
+                return 404, {"error": f"No route listening on port {parts[1]}."}
+            targets = [self.routes[parts[1]]]
+        else:
+            targets = list(self.routes.values())
+
+        if method == "GET":
+            return 200, {route.name: route.rules for route in targets}
+        if method in ("PUT", "POST"):
+            try:
+                update = json.loads(body or b"{}")
+                if not isinstance(update, dict):
+                    raise ValueError("Rules must be a JSON object.")
+                update = validate_rules(update)
+            except ValueError as e:
+                return 400, {"error": str(e)}
+            for route in targets:
+                route.rules = {**route.rules, **update}
+                print(f"Rules for port {route.name} updated: {json.dumps(update)}")
+        elif method == "DELETE":
+            for route in targets:
+                route.rules = dict(DEFAULT_RULES)
+                print(f"Rules for port {route.name} reset.")
+        else:
+            return 405, {"error": "Method not allowed."}
+        return 200, {route.name: route.rules for route in targets}
+
+    async def handle_connection(self, reader, writer):
+        try:
+            request, _ = await _read_request(reader)
+            if request is None:
+                return
+            head, _, body = request.partition(b"\r\n\r\n")
+            method, path = head.split(b"\r\n")[0].decode("latin-1").split(" ")[:2]
+            status, payload = self.handle(method, path, body)
+            response = json.dumps(payload, indent=2).encode()
+            writer.write(
+                f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(response)}\r\nConnection: close\r\n\r\n".encode()
+                + response
+            )
+            await writer.drain()
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+def parse_route(value):
+    """Parses LISTEN_PORT=HOST:PORT."""
+    try:
+        listen, _, upstream = value.partition("=")
+        host, _, port = upstream.rpartition(":")
+        return int(listen), host, int(port)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Routes look like 8090=url-anvil:8080, got '{value}'.")
+
+async def serve(routes, host, control_port):
+    servers = []
+    for route in routes:
+        server = await asyncio.start_server(
+            lambda reader, writer, route=route: handle_client(route, reader, writer), host, route.listen_port, limit=MAX_HEAD_BYTES, backlog=4096
+        )
+        for sock in server.sockets:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        servers.append(server)
+        print(f"Proxying {host}:{route.listen_port} -> {route.upstream_host}:{route.upstream_port}")
+    control = ControlApi(routes)
+    servers.append(await asyncio.start_server(control.handle_connection, host, control_port))
+    print(f"Control API on {host}:{control_port} (GET/PUT/DELETE /rules, GET /stats)")
+    await asyncio.gather(*(server.serve_forever() for server in servers))
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP proxy that injects latency, bandwidth limits, connection resets and errors.")
+    parser.add_argument("--route", action="append", type=parse_route, required=True, help="LISTEN_PORT=UPSTREAM_HOST:PORT, e.g. 8090=url-anvil:8080. Repeat for several upstreams.")
+    parser.add_argument("--host", default="0.0.0.0", help="Address to listen on.")
+    parser.add_argument("--control-port", type=int, default=8091, help="Port of the control API.")
+    parser.add_argument("--rules", help="JSON file with the initial rules for every route.")
+    parser.add_argument("--seed", type=int, help="Seed the fault decisions so a run can be reproduced request for request.")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    routes = [Route(listen_port, host, port, rng) for listen_port, host, port in args.route]
+    if args.rules:
+        with open(args.rules) as f:
+            initial_rules = validate_rules(json.load(f))
+        for route in routes:
+            route.rules.update(initial_rules)
+
+    try:
+        asyncio.run(serve(routes, args.host, args.control_port))
+    except KeyboardInterrupt:
+        print("Chaos proxy stopped.")
+
+if __name__ == "__main__":
+    main()
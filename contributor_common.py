@@ -0,0 +1,54 @@
+import csv
+import re
+
+# Helpers shared by the onboarding scripts. Importing this module has no side effects
+# (no .env loading, no database or network access), unlike importing the scripts themselves.
+
+GITHUB_USERNAME_PATTERN = re.compile(r"^[A-Za-z0-9](?:[A-Za-z0-9-]{0,37}[A-Za-z0-9])?$")
+
+def read_usernames(batch_file=None, users=None):
+    """
+    Collects usernames from a CSV file and/or a comma-separated list, in order and without duplicates.
+
+    The CSV's first column holds the GitHub username; a header row named github_username or
+    username is skipped, as are blank lines and lines starting with #.
+    """
+    usernames = []
+    if batch_file:
+        with open(batch_file, newline='') as f:
+            for row in csv.reader(f):
+                if not row or not row[0].strip() or row[0].strip().startswith('#'):
+                    continue
+                username = row[0].strip()
+                if username.lower() in ("github_username", "username"):
+                    continue
+                usernames.append(username)
+    if users:
+        usernames.extend(user.strip() for user in users.split(',') if user.strip())
+    return list(dict.fromkeys(usernames))
+
+def prometheus_target(github_username):
+    """The Prometheus file_sd target of a contributor's exporter."""
+    return {
+        "targets": [f"{github_username}-app-exporter:9113"],
+        "labels": {
+            "job": "contributor-apps",
+            "instance": f"{github_username}"
+        }
+    }
+
+def register_influencer(session, backend_url, api_key, challenge_type):
+    """
+    Makes the key's user the active influencer for challenge_type. Raises requests.exceptions.RequestException on failure.
+
+    The backend keeps one active influencer per challenge, so this replaces whoever held it.
+    """
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    payload = {
+        "challenge_type": challenge_type
+    }
+    response = session.post(f"{backend_url}/api/v1/register-influencer", headers=headers, json=payload, timeout=30)
+    response.raise_for_status() # Raise an exception for HTTP errors
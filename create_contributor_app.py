@@ -3,13 +3,22 @@ import shutil
 import uuid
 import psycopg2
 import sys
-import json
 import requests
-import shutil
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2.extras import execute_values
 from dotenv import load_dotenv, dotenv_values, set_key
+from target_registry import TargetRegistry
+from contributor_common import GITHUB_USERNAME_PATTERN, read_usernames, prometheus_target, register_influencer
 
 load_dotenv() # Load environment variables from .env
 
+SOURCE_DIR = os.path.join("contributors", "contributor-app")
+COMPOSE_FILES_DIR = 'compose-files'
+TARGETS_FILE = 'prometheus/targets.json'
+TARGET_SHARDS = int(os.getenv("PROMETHEUS_TARGET_SHARDS", "1")) # Spread the targets over this many file_sd files
+DEFAULT_CHALLENGE = 'robust-service' # Default challenge for new users
+
 def get_db_connection():
     """Establishes a connection to the PostgreSQL database using environment variables."""
     db_password = os.getenv("POSTGRES_PASSWORD")
@@ -31,6 +40,85 @@ def get_db_connection():
         print(f"Details: {e}")
         sys.exit(1)
 
+def render_contributor_app(github_username, api_key, source_dir=SOURCE_DIR):
+    """
+    Creates contributors/<github_username> from the template app and its compose file.
+
+    Copies the template, saves the API key and run command to its private folder, points the
+    Dockerfile and nginx.conf at the user's path, and writes compose-files/docker-compose.<user>.yml.
+    """
+    destination_dir = os.path.join("contributors", github_username)
+    shutil.copytree(source_dir, destination_dir)
+
+    private_dir = os.path.join(destination_dir, 'private')
+    os.makedirs(private_dir, exist_ok=True)
+    with open(os.path.join(private_dir, 'api_key.txt'), 'w') as f:
+        f.write(api_key)
+    with open(os.path.join(private_dir, 'run_command.txt'), 'w') as f:
+        f.write(f"docker-compose -f docker-compose.yml -f compose-files/docker-compose.{github_username}.yml up --build -d")
+
+    # --- Configure Dockerfile and nginx.conf with correct user path ---
+    dockerfile_path = os.path.join(destination_dir, 'Dockerfile')
+    with open(dockerfile_path, 'r') as f:
+        dockerfile_content = f.read()
+    dockerfile_content = dockerfile_content.replace(
+        "/usr/share/nginx/html/contributor-app",
+        f"/usr/share/nginx/html/{github_username}"
+    )
+    with open(dockerfile_path, 'w') as f:
+        f.write(dockerfile_content)
+
+    nginx_conf_path = os.path.join(destination_dir, 'nginx.conf')
+    with open(nginx_conf_path, 'r') as f:
+        nginx_conf_content = f.read()
+    nginx_conf_content = nginx_conf_content.replace(
+        "root /usr/share/nginx/html/contributor-app;",
+        f"root /usr/share/nginx/html/{github_username};"
+    )
+    with open(nginx_conf_path, 'w') as f:
+        f.write(nginx_conf_content)
+
+    # --- Create a dedicated Docker Compose file for the new user ---
+    compose_content = f"""
+services:
+  {github_username}-app:
+    build:
+      context: ./contributors/{github_username}
+    image: sre-chaos-challenge-{github_username}-app:latest
+    networks:
+      - default
+
+  {github_username}-app-exporter:
+    image: nginx/nginx-prometheus-exporter:0.10.0
+    command: -nginx.scrape-uri http://{github_username}-app/stub_status
+    networks:
+      - default
+    depends_on:
+      - {github_username}-app
+"""
+    os.makedirs(COMPOSE_FILES_DIR, exist_ok=True)
+    with open(compose_file_path_for(github_username), 'w') as f:
+        f.write(compose_content)
+
+def compose_file_path_for(github_username):
+    return os.path.join(COMPOSE_FILES_DIR, f'docker-compose.{github_username}.yml')
+
+def remove_contributor_app(github_username):
+    """Deletes whatever render_contributor_app() created for a user, so a failed onboarding leaves nothing behind."""
+    shutil.rmtree(os.path.join("contributors", github_username), ignore_errors=True)
+    compose_file_path = compose_file_path_for(github_username)
+    if os.path.exists(compose_file_path):
+        os.remove(compose_file_path)
+
+def add_prometheus_targets(github_usernames, targets_file=TARGETS_FILE):
+    """
+    Registers a target per user with Prometheus file_sd and returns how many were new or changed.
+
+    Goes through TargetRegistry, so the update is locked against concurrent onboardings,
+    written atomically and skipped entirely for users that are already registered.
+    """
+    return TargetRegistry(targets_file, TARGET_SHARDS).upsert(prometheus_target(username) for username in github_usernames)
+
 def create_contributor_app():
     # --- Ensure .env file exists before loading environment variables ---
     dotenv_path = os.path.join(os.getcwd(), '.env')
@@ -51,10 +139,10 @@ def create_contributor_app():
     github_username = input("Enter the new contributor's GitHub username: ")
 
     # Define paths early for cleanup
-    source_dir = os.path.join("contributors", "contributor-app")
+    source_dir = SOURCE_DIR
     destination_dir = os.path.join("contributors", github_username)
     private_dir = os.path.join(destination_dir, 'private')
-    compose_file_path = os.path.join('compose-files', f'docker-compose.{github_username}.yml')
+    compose_file_path = compose_file_path_for(github_username)
 
     if not os.path.exists(source_dir):
         print(f"Error: Source directory '{source_dir}' not found. Make sure 'contributor-app' exists inside 'contributors'.")
@@ -72,7 +160,7 @@ def create_contributor_app():
         cur = conn.cursor()
         cur.execute(
             "INSERT INTO api_keys (key, user_id, challenge_type) VALUES (%s, %s, %s)",
-            (api_key, github_username, 'robust-service') # Default to robust-service
+            (api_key, github_username, DEFAULT_CHALLENGE)
         )
         conn.commit()
         cur.close()
@@ -89,21 +177,11 @@ def create_contributor_app():
 
     # --- Copy files after successful DB operation ---
     try:
-        shutil.copytree(source_dir, destination_dir)
+        render_contributor_app(github_username, api_key, source_dir)
         print(f"Successfully created contributor app for '{github_username}' at '{destination_dir}'.")
-
-        # --- Create private folder and save API key/run command ---
-        private_dir = os.path.join(destination_dir, 'private')
-        os.makedirs(private_dir, exist_ok=True)
-
-        with open(os.path.join(private_dir, 'api_key.txt'), 'w') as f:
-            f.write(api_key)
-        print(f"Saved API key to '{private_dir}/api_key.txt'.")
-
-        run_command = f"docker-compose -f docker-compose.yml -f compose-files/docker-compose.{github_username}.yml up --build -d"
-        with open(os.path.join(private_dir, 'run_command.txt'), 'w') as f:
-            f.write(run_command)
-        print(f"Saved run command to '{private_dir}/run_command.txt'.")
+        print(f"Saved API key and run command to '{private_dir}'.")
+        print("Configured 'Dockerfile' and 'nginx.conf' with the correct user path.")
+        print(f"Created dedicated Docker Compose file at '{compose_file_path}'.")
 
         # --- Register as active influencer for default challenge ---
         backend_url = os.getenv("BACKEND_URL")
@@ -111,20 +189,8 @@ def create_contributor_app():
             print("Error: BACKEND_URL environment variable is not set.")
             sys.exit(1)
 
-        register_influencer_url = f"{backend_url}/api/v1/register-influencer"
-        default_challenge = 'robust-service' # Default challenge for new users
-
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        payload = {
-            "challenge_type": default_challenge
-        }
-
         try:
-            response = requests.post(register_influencer_url, headers=headers, json=payload)
-            response.raise_for_status() # Raise an exception for HTTP errors
+            register_influencer(requests.Session(), backend_url, api_key, DEFAULT_CHALLENGE)
             dotenv_path = os.path.join(os.getcwd(), '.env')
             dotenv_example_path = os.path.join(os.getcwd(), '.env.example')
 
@@ -147,77 +213,9 @@ def create_contributor_app():
             print(f"CRITICAL: Contributor '{github_username}' created, but failed to register as active influencer.")
             sys.exit(1)
 
-        # ... existing final print block ...
-
-
-
-
-        # --- Configure Dockerfile and nginx.conf with correct user path ---
-        dockerfile_path = os.path.join(destination_dir, 'Dockerfile')
-        with open(dockerfile_path, 'r') as f:
-            dockerfile_content = f.read()
-        dockerfile_content = dockerfile_content.replace(
-            "/usr/share/nginx/html/contributor-app",
-            f"/usr/share/nginx/html/{github_username}"
-        )
-        with open(dockerfile_path, 'w') as f:
-            f.write(dockerfile_content)
-        print("Configured 'Dockerfile' with the correct user path.")
-
-        nginx_conf_path = os.path.join(destination_dir, 'nginx.conf')
-        with open(nginx_conf_path, 'r') as f:
-            nginx_conf_content = f.read()
-        nginx_conf_content = nginx_conf_content.replace(
-            "root /usr/share/nginx/html/contributor-app;",
-            f"root /usr/share/nginx/html/{github_username};"
-        )
-        with open(nginx_conf_path, 'w') as f:
-            f.write(nginx_conf_content)
-        print("Configured 'nginx.conf' with the correct user path.")
-
-        # --- Create a dedicated Docker Compose file for the new user ---
-        compose_file_path = os.path.join('compose-files', f'docker-compose.{github_username}.yml')
-        compose_content = f"""
-services:
-  {github_username}-app:
-    build:
-      context: ./contributors/{github_username}
-    image: sre-chaos-challenge-{github_username}-app:latest
-    networks:
-      - default
-
-  {github_username}-app-exporter:
-    image: nginx/nginx-prometheus-exporter:0.10.0
-    command: -nginx.scrape-uri http://{github_username}-app/stub_status
-    networks:
-      - default
-    depends_on:
-      - {github_username}-app
-"""
-        with open(compose_file_path, 'w') as f:
-            f.write(compose_content)
-        print(f"Created dedicated Docker Compose file at '{compose_file_path}'.")
-
         # --- Update Prometheus targets file ---
-        targets_file = 'prometheus/targets.json'
-        new_target = {
-            "targets": [f"{github_username}-app-exporter:9113"],
-            "labels": {
-                "job": "contributor-apps",
-                "instance": f"{github_username}"
-            }
-        }
-        
-        targets_data = []
-        if os.path.exists(targets_file):
-            with open(targets_file, 'r') as f:
-                targets_data = json.load(f)
-        
-        targets_data.append(new_target)
-        
-        with open(targets_file, 'w') as f:
-            json.dump(targets_data, f, indent=2)
-        print(f"Updated Prometheus targets file at '{targets_file}'.")
+        add_prometheus_targets([github_username])
+        print(f"Updated Prometheus targets file at '{TARGETS_FILE}'.")
 
         print("\n" + "="*60)
         print("Contributor Setup Complete".center(60))
@@ -236,5 +234,141 @@ services:
         # If file copy fails, we should ideally roll back the DB change, but for this script, we'll just notify the user.
         print(f"CRITICAL: An API key was created for '{github_username}' but the application directory could not be created.")
 
+def create_contributor_apps(github_usernames, parallelism=8, challenge_type=DEFAULT_CHALLENGE):
+    """
+    Onboards many contributors in one pass and returns {username: error or None}.
+
+    All API keys are inserted with one multi-row INSERT; users who already have a key are
+    skipped (ON CONFLICT DO NOTHING) and reported. App directories are then rendered in
+    parallel, and the Prometheus targets file is written once for every user that made it. A
+    user whose files fail is rolled back on their own: their directory, compose file and API
+    key are removed, and the rest of the batch is unaffected. The backend keeps one active
+    influencer per challenge, so only the last user onboarded is registered as influencer,
+    as when onboarding the users one by one.
+
+    Unlike the interactive mode, the local .env is left alone, since it identifies a single user.
+    """
+    results = {}
+    backend_url = os.getenv("BACKEND_URL")
+    if not backend_url:
+        print("Error: BACKEND_URL environment variable is not set.")
+        sys.exit(1)
+    if not os.path.exists(SOURCE_DIR):
+        print(f"Error: Source directory '{SOURCE_DIR}' not found. Make sure 'contributor-app' exists inside 'contributors'.")
+        sys.exit(1)
+
+    candidates = []
+    for username in github_usernames:
+        if not GITHUB_USERNAME_PATTERN.match(username):
+            results[username] = "not a valid GitHub username"
+        elif os.path.exists(os.path.join("contributors", username)):
+            results[username] = "contributor app directory already exists"
+        else:
+            candidates.append(username)
+    if not candidates:
+        return results
+
+    # --- Generate API keys and insert them in one statement ---
+    api_keys = {username: str(uuid.uuid4()) for username in candidates}
+    rows = [(api_keys[username], username, challenge_type) for username in candidates]
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            inserted = execute_values(
+                cur,
+                "INSERT INTO api_keys (key, user_id, challenge_type) VALUES %s ON CONFLICT (user_id) DO NOTHING RETURNING user_id",
+                rows,
+                page_size=len(rows), # One statement for the whole batch, not one per 100 rows
+                fetch=True
+            )
+        conn.commit()
+    except psycopg2.Error as e:
+        conn.rollback()
+        conn.close()
+        print("Error: Could not insert API keys into the database. No contributors were created.")
+        print(f"Details: {e}")
+        sys.exit(1)
+    inserted = {row[0] for row in inserted}
+    for username in candidates:
+        if username not in inserted:
+            results[username] = "user already has an API key"
+    candidates = [username for username in candidates if username in inserted]
+    print(f"Created {len(candidates)} API keys in one INSERT.")
+
+    def onboard(username):
+        try:
+            render_contributor_app(username, api_keys[username])
+            return None
+        except OSError as e:
+            return str(e)
+
+    # --- Render app directories in parallel ---
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        errors = dict(zip(candidates, executor.map(onboard, candidates)))
+
+    # --- Roll back failed users one by one ---
+    failed = [username for username in candidates if errors[username]]
+    for username in failed:
+        remove_contributor_app(username)
+        results[username] = errors[username]
+        try:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM api_keys WHERE user_id = %s", (username,))
+            conn.commit()
+        except psycopg2.Error as e:
+            conn.rollback()
+            print(f"Warning: Could not remove the API key of failed user '{username}': {e}")
+    conn.close()
+
+    succeeded = [username for username in candidates if not errors[username]]
+
+    # --- Register the last user as active influencer, as sequential onboarding would leave it ---
+    if succeeded:
+        influencer = succeeded[-1]
+        try:
+            register_influencer(requests.Session(), backend_url, api_keys[influencer], challenge_type)
+            print(f"Registered '{influencer}' as active influencer for '{challenge_type}'.")
+        except requests.exceptions.RequestException as e:
+            print(f"Warning: Could not register '{influencer}' as active influencer for '{challenge_type}': {e}")
+
+    # --- One atomic update of the Prometheus targets file ---
+    if succeeded:
+        added = add_prometheus_targets(succeeded)
+        print(f"Registered {added} new Prometheus targets in one update.")
+    for username in succeeded:
+        results[username] = None
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Create contributor apps. Without arguments, asks for one GitHub username interactively.")
+    parser.add_argument("--batch", help="CSV file whose first column lists the GitHub usernames to onboard.")
+    parser.add_argument("--users", help="Comma-separated GitHub usernames to onboard.")
+    parser.add_argument("--parallelism", type=int, default=8, help="Batch mode: how many users to set up at the same time.")
+    parser.add_argument("--challenge", default=DEFAULT_CHALLENGE, help="Batch mode: challenge to register the new users for.")
+    args = parser.parse_args()
+
+    if not args.batch and not args.users:
+        create_contributor_app()
+        return
+    if args.parallelism < 1:
+        parser.error("--parallelism must be at least 1.")
+
+    usernames = read_usernames(args.batch, args.users)
+    print(f"Onboarding {len(usernames)} contributors...")
+    results = create_contributor_apps(usernames, args.parallelism, args.challenge)
+
+    failed = {username: error for username, error in results.items() if error}
+    print("\n" + "="*60)
+    print("Batch Contributor Setup Complete".center(60))
+    print("="*60)
+    print(f"Created: {len(results) - len(failed)}    Failed: {len(failed)}")
+    for username, error in failed.items():
+        print(f"  {username}: {error}")
+    print("-"*60)
+    print("Each new contributor's API key and run command are in contributors/<username>/private/")
+    print("="*60 + "\n")
+    if failed:
+        sys.exit(1)
+
 if __name__ == "__main__":
-    create_contributor_app()
+    main()
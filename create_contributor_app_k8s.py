@@ -4,9 +4,21 @@ import json
 import uuid
 import psycopg2
 import sys
+import time
+import argparse
+import re
+from psycopg2.extras import execute_values
+from contributor_common import GITHUB_USERNAME_PATTERN, read_usernames
 
 NAMESPACE = "sre-chaos"
 PROJECT_ID = "artful-winter-473414-q1" # Replace with your actual GCP Project ID
+MANIFEST_DIR = os.path.join("k8s", "contributors")
+CONTRIBUTORS_DIR = "contributors" # API keys go to contributors/<username>/private/, as with create_contributor_app.py
+CONTRIBUTOR_LABEL = "sre-chaos/contributor" # Set on every contributor Deployment so one `kubectl get` lists them all
+DEFAULT_CHALLENGE = 'robust-service'
+READINESS_POLL_INTERVAL_S = 2
+# Usernames become parts of resource names, so they must also be lowercase RFC 1123 labels
+RFC1123_LABEL_PATTERN = re.compile(r"^[a-z0-9](?:[a-z0-9-]*[a-z0-9])?$")
 
 def get_db_connection():
     try:
@@ -26,38 +38,38 @@ def get_db_connection():
         print(f"Details: {e}")
         sys.exit(1)
 
-def create_contributor_app_k8s(username):
-    if not username:
-        print("GitHub username cannot be empty. Exiting.")
-        return
+def upsert_api_keys(usernames, challenge_type=DEFAULT_CHALLENGE):
+    """
+    Creates or replaces the API keys of all usernames in one transaction and returns {username: api_key}.
 
-    # --- Generate API Key and insert into DB ---
-    api_key = str(uuid.uuid4())
+    Either every key is written or, on a database error, none is and None is returned.
+    """
+    api_keys = {username: str(uuid.uuid4()) for username in usernames}
     conn = None
     try:
         conn = get_db_connection()
-        cur = conn.cursor()
-        # Set a default challenge type on creation
-        challenge_type = 'robust-service'
-        cur.execute(
-            "INSERT INTO api_keys (key, user_id, challenge_type) VALUES (%s, %s, %s) ON CONFLICT (user_id) DO UPDATE SET key = EXCLUDED.key, challenge_type = EXCLUDED.challenge_type",
-            (api_key, username, challenge_type)
-        )
+        with conn.cursor() as cur:
+            execute_values(
+                cur,
+                "INSERT INTO api_keys (key, user_id, challenge_type) VALUES %s ON CONFLICT (user_id) DO UPDATE SET key = EXCLUDED.key, challenge_type = EXCLUDED.challenge_type",
+                [(api_key, username, challenge_type) for username, api_key in api_keys.items()]
+            )
         conn.commit()
-        cur.close()
-        print(f"Successfully created/updated API key for '{username}' with default challenge type '{challenge_type}'.")
+        print(f"Successfully created/updated API keys for {len(api_keys)} users with default challenge type '{challenge_type}'.")
+        return api_keys
     except psycopg2.Error as e:
-        print(f"Error: Could not insert/update API key into the database for '{username}'.")
+        print(f"Error: Could not insert/update API keys into the database.")
         print(f"Details: {e}")
         if conn:
             conn.rollback()
-        return # Stop execution if DB operation fails
+        return None
     finally:
         if conn:
             conn.close()
 
-    # --- Generate Kubernetes Deployment YAML ---
-    deployment_yaml = f"""
+def render_manifest(username):
+    """Returns the Deployment, Service and exporter Deployment of one contributor as a multi-document YAML string."""
+    return f"""
 apiVersion: apps/v1
 kind: Deployment
 metadata:
@@ -65,6 +77,7 @@ metadata:
   namespace: {NAMESPACE}
   labels:
     app: {username}-app
+    {CONTRIBUTOR_LABEL}: "{username}"
 spec:
   replicas: 1
   selector:
@@ -86,6 +99,8 @@ kind: Service
 metadata:
   name: {username}-app-service
   namespace: {NAMESPACE}
+  labels:
+    {CONTRIBUTOR_LABEL}: "{username}"
 spec:
   selector:
     app: {username}-app
@@ -102,6 +117,7 @@ metadata:
   namespace: {NAMESPACE}
   labels:
     app: {username}-app-exporter
+    {CONTRIBUTOR_LABEL}: "{username}"
 spec:
   replicas: 1
   selector:
@@ -118,7 +134,7 @@ spec:
       initContainers:
       - name: wait-for-{username}-app
         image: busybox
-        command: ['sh', '-c', 'until wget -q -O - http://{username}-app-service:80/stub_status; do echo waiting for {username}-app; sleep 2; done']
+        command: ['sh', '-c', 'until wget -q -T 2 -O - http://{username}-app-service:80/stub_status; do echo waiting for {username}-app; sleep 1; done']
       containers:
       - name: {username}-app-exporter
         image: nginx/nginx-prometheus-exporter:0.10.0
@@ -127,10 +143,100 @@ spec:
         - containerPort: 9113
 """
 
-    # Write temporary YAML file
-    manifest_file = f"k8s/contributors/{username}-app.yaml"
+def write_manifest(username, manifest):
+    """Keeps a copy of a contributor's manifest under k8s/contributors/ and returns its path."""
+    os.makedirs(MANIFEST_DIR, exist_ok=True)
+    manifest_file = os.path.join(MANIFEST_DIR, f"{username}-app.yaml")
     with open(manifest_file, "w") as f:
-        f.write(deployment_yaml)
+        f.write(manifest)
+    return manifest_file
+
+def apply_manifests(manifests, chunk_size=50):
+    """
+    Applies {username: manifest} with one `kubectl apply -f -` per chunk_size users.
+
+    Returns {username: error or None}. A failed chunk fails all of its users, since
+    kubectl does not report which documents of a failed apply were already applied.
+    """
+    usernames = list(manifests)
+    errors = {}
+    for start in range(0, len(usernames), chunk_size):
+        chunk = usernames[start:start + chunk_size]
+        combined = "---\n".join(manifests[username] for username in chunk)
+        result = subprocess.run(
+            ["kubectl", "apply", "-f", "-", "-n", NAMESPACE],
+            input=combined, capture_output=True, text=True
+        )
+        error = None
+        if result.returncode != 0:
+            error = result.stderr.strip() or "kubectl apply failed"
+            print(f"Error applying Kubernetes manifests for {len(chunk)} users: {error}")
+        for username in chunk:
+            errors[username] = error
+    return errors
+
+def deployment_ready(deployment):
+    """True once a Deployment's current generation is fully rolled out and available."""
+    status = deployment.get("status", {})
+    replicas = deployment.get("spec", {}).get("replicas", 1)
+    return (
+        status.get("observedGeneration", 0) >= deployment["metadata"].get("generation", 0)
+        and status.get("updatedReplicas", 0) >= replicas
+        and status.get("availableReplicas", 0) >= replicas
+    )
+
+def wait_for_rollouts(usernames, started_at, timeout_s=300):
+    """
+    Polls the rollout of every user's Deployments at once and returns {username: seconds until ready, or None}.
+
+    Each poll is a single `kubectl get deployments` over the contributor label, however many
+    users are waiting, and a user counts as ready once both their app and exporter are.
+    """
+    pending = set(usernames)
+    ready_after = {username: None for username in usernames}
+    deadline = started_at + timeout_s
+    while pending and time.monotonic() < deadline:
+        result = subprocess.run(
+            ["kubectl", "get", "deployments", "-n", NAMESPACE, "-l", CONTRIBUTOR_LABEL, "-o", "json"],
+            capture_output=True, text=True
+        )
+        if result.returncode == 0:
+            not_ready = set()
+            seen = {}
+            for deployment in json.loads(result.stdout).get("items", []):
+                username = deployment["metadata"].get("labels", {}).get(CONTRIBUTOR_LABEL)
+                if username in pending:
+                    seen[username] = seen.get(username, 0) + 1
+                    if not deployment_ready(deployment):
+                        not_ready.add(username)
+            now = time.monotonic()
+            for username in list(pending):
+                if seen.get(username, 0) >= 2 and username not in not_ready:
+                    ready_after[username] = now - started_at
+                    pending.discard(username)
+                    print(f"  {username}: ready after {ready_after[username]:.1f} s ({len(pending)} still rolling out)")
+        else:
+            print(f"Warning: could not list deployments: {result.stderr.strip()}")
+        if pending:
+            time.sleep(READINESS_POLL_INTERVAL_S)
+    return ready_after
+
+def create_contributor_app_k8s(username):
+    if not username:
+        print("GitHub username cannot be empty. Exiting.")
+        return
+    if not RFC1123_LABEL_PATTERN.match(username):
+        print(f"'{username}' cannot be used in Kubernetes resource names, which must be lowercase letters, digits and hyphens. Exiting.")
+        return
+
+    # --- Generate API Key and insert into DB ---
+    api_keys = upsert_api_keys([username])
+    if api_keys is None:
+        return # Stop execution if DB operation fails
+    api_key = api_keys[username]
+
+    # --- Generate Kubernetes Deployment YAML ---
+    manifest_file = write_manifest(username, render_manifest(username))
 
     # Apply deployment and service
     try:
@@ -150,10 +256,98 @@ spec:
     print("Prometheus will automatically discover and scrape its metrics.")
     print("="*60 + "\n")
 
-if __name__ == "__main__":
-    import sys
-    if len(sys.argv) != 2:
-        print("Usage: python create_contributor_app_k8s.py <username>")
+def create_contributor_apps_k8s(usernames, chunk_size=50, wait=True, timeout_s=300, challenge_type=DEFAULT_CHALLENGE):
+    """
+    Rolls out many contributors with O(1) process spawns and returns {username: error or None}.
+
+    All API keys are upserted in one transaction, every user's objects are applied as one
+    multi-document manifest per chunk_size users, and readiness is polled for all users at
+    once. API keys are written to contributors/<username>/private/api_key.txt, where
+    create_contributor_app.py and switch_challenge.py keep them, instead of being printed,
+    since a batch usually onboards other people.
+    """
+    errors = {}
+    valid = []
+    for username in usernames:
+        if not GITHUB_USERNAME_PATTERN.match(username):
+            errors[username] = "not a valid GitHub username"
+        elif not RFC1123_LABEL_PATTERN.match(username):
+            # One invalid name would fail every user in its `kubectl apply` chunk
+            errors[username] = "not a valid Kubernetes name (must be lowercase)"
+        else:
+            valid.append(username)
+    if not valid:
+        return errors
+
+    api_keys = upsert_api_keys(valid, challenge_type)
+    if api_keys is None:
+        errors.update({username: "database error" for username in valid})
+        return errors
+
+    manifests = {}
+    for username in valid:
+        manifests[username] = render_manifest(username)
+        write_manifest(username, manifests[username])
+        private_dir = os.path.join(CONTRIBUTORS_DIR, username, "private")
+        os.makedirs(private_dir, exist_ok=True)
+        with open(os.path.join(private_dir, "api_key.txt"), "w") as f:
+            f.write(api_keys[username])
+    print(f"Rendered {len(manifests)} manifests into {MANIFEST_DIR}/.")
+
+    started_at = time.monotonic()
+    apply_errors = apply_manifests(manifests, chunk_size)
+    errors.update({username: error for username, error in apply_errors.items() if error})
+    applied = [username for username in valid if not apply_errors[username]]
+    print(f"Applied {len(applied)} contributors in {time.monotonic() - started_at:.1f} s.")
+
+    if wait and applied:
+        print(f"Waiting up to {timeout_s:g} s for {len(applied)} rollouts...")
+        ready_after = wait_for_rollouts(applied, started_at, timeout_s)
+        for username in applied:
+            if ready_after[username] is None:
+                errors[username] = f"not ready after {timeout_s:g} s"
+            else:
+                errors[username] = None
+        latencies = sorted(latency for latency in ready_after.values() if latency is not None)
+        if latencies:
+            print(f"Rollout latency: min {latencies[0]:.1f} s, median {latencies[len(latencies) // 2]:.1f} s, max {latencies[-1]:.1f} s.")
+    else:
+        errors.update({username: None for username in applied})
+    return errors
+
+def main():
+    parser = argparse.ArgumentParser(description="Deploy contributor apps and exporters to Kubernetes.")
+    parser.add_argument("usernames", nargs="*", help="GitHub usernames to deploy.")
+    parser.add_argument("--batch", help="CSV file with one GitHub username per line in its first column.")
+    parser.add_argument("--chunk-size", type=int, default=50, help="Users per `kubectl apply` call in batch mode.")
+    parser.add_argument("--timeout", type=float, default=300, help="Seconds to wait for every rollout to become ready in batch mode.")
+    parser.add_argument("--no-wait", action="store_true", help="Apply the manifests without waiting for the rollouts.")
+    args = parser.parse_args()
+
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1.")
+    usernames = read_usernames(args.batch, ",".join(args.usernames))
+    if not usernames:
+        parser.error("Give at least one username, or --batch.")
+
+    if len(usernames) == 1 and not args.batch:
+        create_contributor_app_k8s(usernames[0])
+        return
+
+    print(f"Rolling out {len(usernames)} contributors to the '{NAMESPACE}' namespace...")
+    results = create_contributor_apps_k8s(usernames, args.chunk_size, not args.no_wait, args.timeout)
+    failed = {username: error for username, error in results.items() if error}
+    print("\n" + "="*60)
+    print("Batch Kubernetes Rollout Complete".center(60))
+    print("="*60)
+    print(f"Deployed: {len(results) - len(failed)}    Failed: {len(failed)}")
+    for username, error in failed.items():
+        print(f"  {username}: {error}")
+    print("-" * 60)
+    print(f"API keys are in {CONTRIBUTORS_DIR}/<username>/private/api_key.txt")
+    print("="*60 + "\n")
+    if failed:
         sys.exit(1)
-    username = sys.argv[1]
-    create_contributor_app_k8s(username)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import datetime
+import gzip
+import os
+import re
+
+# nginx's default "combined" format; anything after the status and size (referer, user agent) is ignored:
+# $remote_addr - $remote_user [$time_local] "$request" $status $body_bytes_sent ...
+LINE_PATTERN = re.compile(r'^\S+ \S+ \S+ \[(?P<time>[^\]]+)\] "(?P<method>[A-Z]+) (?P<path>\S+)(?: [^"]*)?" \d{3} ')
+TIME_FORMAT = "%d/%b/%Y:%H:%M:%S %z"
+
+def parse_line(line):
+    """Returns (epoch seconds, method, path) for one access log line, or None if it is not a request line."""
+    match = LINE_PATTERN.match(line)
+    if not match:
+        return None
+    try:
+        timestamp = datetime.datetime.strptime(match.group("time"), TIME_FORMAT).timestamp()
+    except ValueError:
+        return None
+    return timestamp, match.group("method"), match.group("path")
+
+def _rotation_number(name):
+    """access.log -> 0, access.log.1 -> 1, access.log.2.gz -> 2."""
+    match = re.search(r"\.(\d+)(?:\.gz)?$", name)
+    return int(match.group(1)) if match else 0
+
+def log_files(path):
+    """
+    Returns the files to replay, oldest first.
+
+    A directory is treated as one set of rotated logs (access.log, access.log.1,
+    access.log.2.gz, ...) and read from the highest rotation number down.
+    """
+    if not os.path.isdir(path):
+        return [path]
+    names = [name for name in os.listdir(path) if os.path.isfile(os.path.join(path, name))]
+    names.sort(key=lambda name: (-_rotation_number(name), name))
+    return [os.path.join(path, name) for name in names]
+
+def _open_log(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", errors="replace")
+    return open(path, errors="replace")
+
+def read_access_log(path, stats=None):
+    """
+    Lazily yields (epoch seconds, method, path) for every request in a log file or directory.
+
+    Lines are read one at a time, gzip-compressed files included, so logs of any size are
+    replayed in constant memory. Lines that do not parse are skipped and, if a stats dict is
+    given, counted under stats["skipped_lines"].
+    """
+    for file_path in log_files(path):
+        with _open_log(file_path) as f:
+            for line in f:
+                entry = parse_line(line)
+                if entry is None:
+                    if stats is not None:
+                        stats["skipped_lines"] = stats.get("skipped_lines", 0) + 1
+                    continue
+                yield entry
+
+def replay_schedule(entries, shard_index=0, shard_count=1):
+    """
+    Turns (epoch seconds, method, path) entries into (offset seconds, method, path) from the first entry.
+
+    $time_local only has one-second resolution, so the requests logged within the same
+    second are spread evenly across it instead of being sent in one burst. Only one second's
+    worth of entries is held at a time. With shard_count > 1, only every shard_count-th
+    request (starting at shard_index) is yielded, so worker processes split the log between them.
+    """
+    first = None
+    second = None
+    group = []
+    index = 0
+
+    def flush():
+        for i, (method, path) in enumerate(group):
+            yield second - first + i / len(group), method, path
+
+    for timestamp, method, path in entries:
+        if first is None:
+            first = second = timestamp
+        if timestamp != second:
+            yield from flush()
+            group = []
+            second = timestamp
+        if index % shard_count == shard_index:
+            group.append((method, path))
+        index += 1
+    if group:
+        yield from flush()
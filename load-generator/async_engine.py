@@ -0,0 +1,299 @@
+import asyncio
+import random
+import time
+
+import aiohttp
+
+from access_log import read_access_log, replay_schedule
+from load_profile import arrival_offset, concurrency_at
+from connections import create_client_session, create_virtual_user_session
+from phase_timing import trace_phases
+from run_stats import RunStats
+from workload import next_request, think_time
+
+try:
+    import resource
+except ImportError: # Not available on Windows
+    resource = None
+
+CONCURRENCY_ADJUST_INTERVAL_S = 0.1 # How often a linear concurrency ramp adds or stops virtual users
+MAX_REPLAY_PENDING = 10000 # Cap on pending replayed requests when --max-in-flight is unlimited
+
+def raise_open_file_limit():
+    """Raises the soft open-file limit to the hard limit so thousands of sockets can be open at once."""
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError) as e:
+            print(f"Warning: Could not raise open file limit from {soft}: {e}")
+
+async def send_request_async(session, url, method, payload_urls=None, intended_time=None, verbose=False, body=None):
+    """
+    Sends a single HTTP request on the event loop and returns the same metrics dict as send_request().
+
+    A POST sends body as JSON if given, otherwise {"urls": payload_urls}.
+    Phases and the connection event are only traced on sessions created with
+    phase_timing.create_trace_config(), as connections.py does.
+    """
+    start_time = time.time()
+    status_code = None
+    success = False
+    response_bytes = 0
+    marks = {}
+    start = time.perf_counter()
+    try:
+        if method.upper() == 'POST':
+            request = session.post(url, json=body if body is not None else {'urls': payload_urls}, trace_request_ctx=marks)
+        else: # Default to GET
+            request = session.get(url, trace_request_ctx=marks)
+        async with request as response:
+            response_bytes = len(await response.read())
+            status_code = response.status
+        success = status_code < 400
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        if verbose:
+            print(f"Request to {url} ({method}) failed: {e!r}")
+    except Exception as e:
+        # Anything else (e.g. a workload URL aiohttp cannot parse) still counts as a failed request;
+        # raised, it would only be logged by the event loop and the request would go unrecorded.
+        print(f"Request to {url} ({method}) failed unexpectedly: {e!r}")
+    end = time.perf_counter()
+    end_time = time.time()
+    latency = (end_time - start_time) * 1000 # Latency in ms
+    if verbose:
+        print(f"Request to {url} ({method}) - Status: {status_code}, Time: {latency:.2f} ms, Success: {success}")
+    phases, connection = trace_phases(marks, start, end if status_code is not None else None)
+    result = {"latency": latency, "status_code": status_code, "success": success, "start_time": start_time, "bytes": response_bytes,
+              "phases": phases, "connection": connection}
+    if intended_time is not None:
+        result["intended_time"] = intended_time
+        result["corrected_latency"] = (end_time - intended_time) * 1000
+    return result
+
+async def run_open_loop(url, method, rate, duration, payload_urls=None, max_in_flight=0, verbose=False, observers=(), connection_strategy="pool", pool_size=0,
+                        workload=None):
+    """
+    Sends requests at a constant arrival rate for the given duration.
+
+    Requests are scheduled at start + i / rate regardless of whether earlier requests have
+    completed, so a slow target builds up in-flight requests instead of slowing the generator.
+    Each request's scheduled time is its intended send time, so corrected latency also covers
+    any delay in the generator itself (a busy event loop or a late timer).
+    max_in_flight caps open connections (0 means unlimited); requests over the cap wait for a
+    connection and that wait is included in their latency. connection_strategy and pool_size
+    choose how connections are opened and reused (see connections.py). With a workload (see
+    workload.py), each request goes to an endpoint of the mix instead of url, which is then
+    the base URL. Every result is also passed to the record() method of each observer;
+    observers with a request_started() method are also told when each request is launched.
+
+    Returns the aggregated RunStats and the wall-clock duration of the run.
+    """
+    stage = {"name": None, "kind": "rate", "start": rate, "target": rate, "duration": duration, "transition": "step"}
+    return await run_profile(url, method, [stage], payload_urls, max_in_flight, verbose, observers, connection_strategy, pool_size, workload)
+
+async def run_profile(url, method, stages, payload_urls=None, max_in_flight=0, verbose=False, observers=(), connection_strategy="pool", pool_size=0,
+                      workload=None):
+    """
+    Runs a sequence of load profile stages (see load_profile.py) back to back on one session.
+
+    Rate stages are open-loop, as in run_open_loop(), with the arrival rate following the
+    stage's transition. Concurrency stages run that many virtual users in a closed loop, each
+    sending its next request as soon as the previous one completes; their results carry no
+    intended send time, since a closed loop has no schedule to fall behind. Stage boundaries
+    are fixed offsets from the start of the run, so a late stage never shifts the ones after it.
+    Results are tagged with their stage's name (unless it is None), which RunStats uses to keep
+    per-stage stats. With the "per-vu" connection strategy every virtual user keeps a
+    connection of its own; open-loop requests have no virtual user and share the pool.
+    With a workload, every request picks an endpoint of the mix by weight and is tagged with
+    its name, which RunStats uses to keep per-endpoint stats, and virtual users wait the
+    endpoint's think time before their next request.
+
+    Returns the aggregated RunStats and the wall-clock duration of the run.
+    """
+    stats = RunStats()
+    in_flight = set()
+    start_hooks = [observer.request_started for observer in observers if hasattr(observer, "request_started")]
+    rng = random.Random()
+    endpoints = {endpoint["name"]: endpoint for endpoint in workload["endpoints"]} if workload else {}
+
+    def record(result):
+        stats.record(result)
+        for observer in observers:
+            observer.record(result)
+
+    def on_done(task):
+        in_flight.discard(task)
+        record(task.result())
+
+    async def send(session, stage_name, intended_time=None):
+        for hook in start_hooks:
+            hook()
+        if workload:
+            endpoint, request_method, request_url, body = next_request(workload, url, rng)
+            result = await send_request_async(session, request_url, request_method, payload_urls, intended_time, verbose, body)
+            result["endpoint"] = endpoint["name"]
+        else:
+            result = await send_request_async(session, url, method, payload_urls, intended_time, verbose)
+        if stage_name is not None:
+            result["stage"] = stage_name
+        return result
+
+    async def run_rate_stage(session, stage, stage_start, stage_start_time):
+        # stage_start is on the event loop clock, stage_start_time the matching epoch time
+        loop = asyncio.get_running_loop()
+        sent = 0
+        next_offset = arrival_offset(0, stage["start"], stage["target"], stage["duration"])
+        while next_offset is not None:
+            # Launch every request that is due, so the schedule catches up after a late wake-up
+            elapsed = loop.time() - stage_start
+            while next_offset is not None and next_offset <= elapsed:
+                task = asyncio.ensure_future(send(session, stage["name"], stage_start_time + next_offset))
+                task.add_done_callback(on_done)
+                in_flight.add(task)
+                sent += 1
+                next_offset = arrival_offset(sent, stage["start"], stage["target"], stage["duration"])
+            if next_offset is not None:
+                await asyncio.sleep(max(0.0, stage_start + next_offset - loop.time()))
+        return sent
+
+    async def run_concurrency_stage(session, stage, stage_start):
+        loop = asyncio.get_running_loop()
+        stage_end = stage_start + stage["duration"]
+        users = [] # (task, stop event) per running virtual user
+        sent = 0
+
+        async def user_loop(user_session, stop):
+            nonlocal sent
+            while not stop.is_set() and loop.time() < stage_end:
+                sent += 1
+                result = await send(user_session, stage["name"])
+                record(result)
+                if workload:
+                    pause = min(think_time(endpoints[result["endpoint"]], rng), max(0.0, stage_end - loop.time()))
+                    if pause > 0:
+                        await asyncio.sleep(pause)
+
+        async def virtual_user(stop):
+            if connection_strategy == "per-vu":
+                async with create_virtual_user_session() as own_session:
+                    await user_loop(own_session, stop)
+            else:
+                await user_loop(session, stop)
+
+        while loop.time() < stage_end:
+            wanted = concurrency_at(stage, loop.time() - stage_start)
+            while len(users) < wanted:
+                stop = asyncio.Event()
+                task = asyncio.ensure_future(virtual_user(stop))
+                task.add_done_callback(in_flight.discard)
+                in_flight.add(task)
+                users.append((task, stop))
+            while len(users) > wanted:
+                # A stopped user finishes its current request, which still counts for this stage
+                users.pop()[1].set()
+            await asyncio.sleep(min(CONCURRENCY_ADJUST_INTERVAL_S, max(0.0, stage_end - loop.time())))
+        for _, stop in users:
+            stop.set()
+        return sent
+
+    async with create_client_session(connection_strategy, max_in_flight, pool_size) as session:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        start_test_time = time.time()
+        stage_offset = 0.0
+        for stage in stages:
+            stage_start = start + stage_offset
+            if loop.time() < stage_start:
+                await asyncio.sleep(stage_start - loop.time())
+            if stage["kind"] == "rate":
+                sent = await run_rate_stage(session, stage, stage_start, start_test_time + stage_offset)
+            else:
+                sent = await run_concurrency_stage(session, stage, stage_start)
+            if stage["name"] is not None:
+                print(f"Stage '{stage['name']}' done: {sent} requests started.")
+            stage_offset += stage["duration"]
+        print(f"All requests scheduled. Waiting for {len(in_flight)} in-flight requests...")
+        if in_flight:
+            await asyncio.wait(list(in_flight))
+        duration_s = time.time() - start_test_time
+
+    return stats, duration_s
+
+async def run_replay(base_url, schedule, speed=1.0, payload_urls=None, max_in_flight=0, verbose=False, observers=(), connection_strategy="pool", pool_size=0):
+    """
+    Replays (offset seconds, method, path) requests, such as access_log.replay_schedule() yields, against base_url.
+
+    Each request is sent at start + offset / speed, so speed 1 keeps the original timing and
+    speed 10 compresses it tenfold; speed 0 sends every request as fast as possible. The
+    schedule is consumed lazily. To keep memory bounded, no more than max_in_flight requests
+    (MAX_REPLAY_PENDING if unlimited) are pending at once; a request held back by that limit
+    keeps its scheduled time as intended send time, so corrected latency shows the delay.
+    POST requests carry payload_urls like every other POST; other methods are sent as GET.
+    A replay has no virtual users, so "per-vu" shares the pool like "pool".
+
+    Returns the aggregated RunStats and the wall-clock duration of the run.
+    """
+    max_pending = max_in_flight or MAX_REPLAY_PENDING
+    stats = RunStats()
+    in_flight = set()
+    start_hooks = [observer.request_started for observer in observers if hasattr(observer, "request_started")]
+    base_url = base_url.rstrip("/")
+
+    def on_done(task):
+        in_flight.discard(task)
+        result = task.result()
+        stats.record(result)
+        for observer in observers:
+            observer.record(result)
+
+    async with create_client_session(connection_strategy, max_in_flight, pool_size) as session:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        start_test_time = time.time()
+        sent = 0
+        for offset, method, path in schedule:
+            scheduled = offset / speed if speed > 0 else 0.0
+            delay = start + scheduled - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            while len(in_flight) >= max_pending:
+                await asyncio.wait(list(in_flight), return_when=asyncio.FIRST_COMPLETED)
+            intended_time = start_test_time + scheduled if speed > 0 else None
+            for hook in start_hooks:
+                hook()
+            task = asyncio.ensure_future(send_request_async(session, base_url + path, method, payload_urls, intended_time, verbose))
+            task.add_done_callback(on_done)
+            in_flight.add(task)
+            sent += 1
+        print(f"All {sent} requests replayed. Waiting for {len(in_flight)} in-flight requests...")
+        if in_flight:
+            await asyncio.wait(list(in_flight))
+        duration_s = time.time() - start_test_time
+
+    return stats, duration_s
+
+def run_open_loop_test(url, method, rate, duration, payload_urls=None, max_in_flight=0, verbose=False, observers=(), connection_strategy="pool", pool_size=0,
+                       workload=None):
+    """Runs run_open_loop() on a fresh event loop."""
+    raise_open_file_limit()
+    return asyncio.run(run_open_loop(url, method, rate, duration, payload_urls, max_in_flight, verbose, observers, connection_strategy, pool_size, workload))
+
+def run_profile_test(url, method, stages, payload_urls=None, max_in_flight=0, verbose=False, observers=(), connection_strategy="pool", pool_size=0,
+                     workload=None):
+    """Runs run_profile() on a fresh event loop."""
+    raise_open_file_limit()
+    return asyncio.run(run_profile(url, method, stages, payload_urls, max_in_flight, verbose, observers, connection_strategy, pool_size, workload))
+
+def run_replay_test(base_url, log_path, speed=1.0, payload_urls=None, max_in_flight=0, verbose=False, shard_index=0, shard_count=1, observers=(),
+                    connection_strategy="pool", pool_size=0):
+    """Replays the access log at log_path (file or directory) on a fresh event loop."""
+    raise_open_file_limit()
+    parse_stats = {}
+    schedule = replay_schedule(read_access_log(log_path, parse_stats), shard_index, shard_count)
+    result = asyncio.run(run_replay(base_url, schedule, speed, payload_urls, max_in_flight, verbose, observers, connection_strategy, pool_size))
+    if parse_stats.get("skipped_lines"):
+        print(f"Skipped {parse_stats['skipped_lines']} access log lines that could not be parsed.")
+    return result
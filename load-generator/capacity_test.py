@@ -0,0 +1,192 @@
+import argparse
+import os
+import time
+from local_tracker_client import LocalTrackerClient, get_session_id
+from async_engine import run_profile_test
+from load_profile import validate_stages, scale_stages
+from multiprocess_runner import run_in_processes, split_evenly
+
+def run_probe(url, method, rate, warmup_s, probe_s, payload_urls=None, max_in_flight=0, processes=1):
+    """
+    Sends a constant open-loop rate for warmup_s + probe_s seconds and returns the summary of the probe part.
+
+    The warmup stage lets connection pools and caches settle, and only results of the
+    steady-state "probe" stage are summarized.
+    """
+    stages = []
+    if warmup_s > 0:
+        stages.append({"name": "warmup", "rate": rate, "duration": warmup_s})
+    stages.append({"name": "probe", "rate": rate, "duration": probe_s})
+    stages = validate_stages(stages)
+
+    shard_kwargs = [
+        {
+            "url": url,
+            "method": method,
+            "stages": shard_stages,
+            "payload_urls": payload_urls,
+            "max_in_flight": max(1, shard_max_in_flight) if max_in_flight else 0,
+        }
+        for shard_stages, shard_max_in_flight in zip(scale_stages(stages, processes), split_evenly(max_in_flight, processes))
+    ]
+    if processes > 1:
+        stats, _ = run_in_processes(run_profile_test, shard_kwargs)
+    else:
+        stats, _ = run_profile_test(**shard_kwargs[0])
+    return stats.stage_summaries({"probe": probe_s})["probe"]
+
+def meets_slo(summary, slo_p99_ms, slo_error_rate):
+    """
+    Checks a probe summary against the SLO.
+
+    The p99 is the one corrected for coordinated omission, so a target that only keeps its
+    latency down by making the generator wait still fails.
+    """
+    return summary["corrected_p99_latency_ms"] <= slo_p99_ms and summary["error_rate"] <= slo_error_rate
+
+def find_capacity(probe, start_rate, max_rate, growth, precision, cooldown_s=0):
+    """
+    Searches for the highest rate for which probe(rate) passes.
+
+    The rate is multiplied by growth until a probe fails or max_rate passes; the last step is
+    capped at max_rate, so max_rate itself is always probed. Then the last passing and first
+    failing rates are bisected until they are within precision (a fraction of the failing
+    rate) of each other. Returns (highest passing rate or 0,
+    lowest failing rate or None, [(rate, passed), ...] in probe order). If the first probe
+    fails, the search stops there; rerun with a lower start_rate.
+    """
+    history = []
+
+    def check(rate):
+        if history and cooldown_s > 0:
+            time.sleep(cooldown_s) # Let the target drain before the next probe
+        passed = probe(rate)
+        history.append((rate, passed))
+        return passed
+
+    good, bad = 0, None
+    rate = start_rate
+    while True:
+        if check(rate):
+            good = rate
+            if rate >= max_rate:
+                break
+            rate = min(rate * growth, max_rate)
+        else:
+            bad = rate
+            break
+    if bad is None or good == 0:
+        # Either the SLO held all the way, or it failed at the starting rate and there is nothing to bisect
+        return good, bad, history
+
+    while bad - good > precision * bad:
+        rate = (good + bad) / 2
+        if check(rate):
+            good = rate
+        else:
+            bad = rate
+    return good, bad, history
+
+def main():
+    """Main function to parse arguments and search for the maximum sustainable request rate."""
+    parser = argparse.ArgumentParser(description="Find the highest request rate a target sustains within an SLO.")
+    parser.add_argument("url", nargs='?', default="http://url-anvil:8080", help="The URL to send requests to. Defaults to http://url-anvil:8080.")
+    parser.add_argument("--method", default=os.getenv('REQUEST_METHOD', 'GET'), help="HTTP method (GET or POST).")
+    parser.add_argument("--payload-urls", default=os.getenv('PAYLOAD_URLS', ''), help="Comma-separated URLs for POST request payload.")
+    parser.add_argument("--slo-p99-ms", type=float, default=200, help="A probe passes only if its p99 latency (corrected for coordinated omission) is at most this many ms.")
+    parser.add_argument("--slo-error-rate", type=float, default=1.0, help="A probe passes only if at most this percentage of requests fail.")
+    parser.add_argument("--start-rate", type=float, default=10, help="Rate of the first probe, in requests per second.")
+    parser.add_argument("--max-rate", type=float, default=10000, help="Stop growing the rate beyond this many requests per second.")
+    parser.add_argument("--growth", type=float, default=2, help="Factor the rate is multiplied by until a probe fails.")
+    parser.add_argument("--precision", type=float, default=0.05, help="Stop bisecting once the passing and failing rates are within this fraction of each other.")
+    parser.add_argument("--warmup", type=float, default=2, help="Seconds each probe runs before its results are counted.")
+    parser.add_argument("--probe-duration", type=float, default=10, help="Seconds of steady-state load measured per probe.")
+    parser.add_argument("--cooldown", type=float, default=2, help="Seconds to wait between probes.")
+    parser.add_argument("--max-in-flight", type=int, default=0, help="Maximum concurrent connections (0 for unlimited).")
+    parser.add_argument("--processes", type=int, default=1, help="Number of worker processes to shard each probe's rate across.")
+    parser.add_argument("--challenge-type", default="load-test", help="Type of challenge for tracking.")
+    parser.add_argument("--metric-name", default="capacity_test_metrics", help="Name of the metric for tracking.")
+    parser.add_argument("--commit-hash", help="The git commit hash for the capacity test run.")
+    args = parser.parse_args()
+
+    if args.start_rate <= 0 or args.max_rate < args.start_rate:
+        parser.error("--start-rate must be greater than zero and no more than --max-rate.")
+    if args.growth <= 1:
+        parser.error("--growth must be greater than 1.")
+    if not 0 < args.precision < 1:
+        parser.error("--precision must be between 0 and 1.")
+    if args.probe_duration <= 0 or args.warmup < 0:
+        parser.error("--probe-duration must be greater than zero and --warmup at least zero.")
+    if args.processes < 1:
+        parser.error("--processes must be at least 1.")
+
+    payload_urls = [url.strip() for url in args.payload_urls.split(',') if url.strip()]
+    if not payload_urls and args.method.upper() == 'POST':
+        print("Warning: POST method specified but no payload URLs provided. Using sample URLs.")
+        payload_urls = ["https://example.com", "https://google.com"]
+
+    print(f"Searching for the capacity of {args.url} under p99 <= {args.slo_p99_ms:g} ms and errors <= {args.slo_error_rate:g} %.")
+    probes = []
+
+    def probe(rate):
+        print(f"Probing {rate:.2f} RPS for {args.warmup:g} s warmup + {args.probe_duration:g} s...")
+        summary = run_probe(
+            args.url, args.method, rate, args.warmup, args.probe_duration,
+            payload_urls if args.method.upper() == 'POST' else None, args.max_in_flight, args.processes
+        )
+        passed = meets_slo(summary, args.slo_p99_ms, args.slo_error_rate)
+        probes.append({
+            "target_rate": rate,
+            "passed": passed,
+            "achieved_rps": summary["rps"],
+            "total_requests": summary["total_requests"],
+            "error_rate": summary["error_rate"],
+            "p50_latency_ms": summary["p50_latency_ms"],
+            "p90_latency_ms": summary["p90_latency_ms"],
+            "p99_latency_ms": summary["p99_latency_ms"],
+            "corrected_p99_latency_ms": summary["corrected_p99_latency_ms"],
+        })
+        print(f"  {'PASS' if passed else 'FAIL'}: {summary['rps']:.2f} RPS achieved, {summary['error_rate']:.2f} % errors, "
+              f"p99 {summary['p99_latency_ms']:.2f} ms, corrected p99 {summary['corrected_p99_latency_ms']:.2f} ms")
+        return passed
+
+    max_sustainable_rps, first_failing_rps, _ = find_capacity(
+        probe, args.start_rate, args.max_rate, args.growth, args.precision, args.cooldown
+    )
+
+    print("Capacity test finished.")
+    if first_failing_rps is None and max_sustainable_rps >= args.max_rate:
+        print(f"The SLO held up to --max-rate: {max_sustainable_rps:.2f} RPS sustained.")
+    elif max_sustainable_rps == 0:
+        print(f"The SLO was not met even at {first_failing_rps:.2f} RPS. Try a lower --start-rate.")
+    else:
+        print(f"Maximum sustainable rate: {max_sustainable_rps:.2f} RPS (first failing rate: {first_failing_rps:.2f} RPS).")
+    print("Latency curve:")
+    for point in sorted(probes, key=lambda point: point["target_rate"]):
+        print(f"  {point['target_rate']:10.2f} RPS  p50 {point['p50_latency_ms']:8.2f} ms  p99 {point['p99_latency_ms']:8.2f} ms  "
+              f"corrected p99 {point['corrected_p99_latency_ms']:8.2f} ms  errors {point['error_rate']:6.2f} %  {'PASS' if point['passed'] else 'FAIL'}")
+
+    metrics_data = {
+        "target_url": args.url,
+        "method": args.method,
+        "test_type": "capacity_test",
+        "slo_p99_latency_ms": args.slo_p99_ms,
+        "slo_error_rate": args.slo_error_rate,
+        "max_sustainable_rps": max_sustainable_rps,
+        "first_failing_rps": first_failing_rps,
+        "probe_duration_s": args.probe_duration,
+        "warmup_s": args.warmup,
+        "probes": probes,
+        "processes": args.processes,
+        "commit_hash": args.commit_hash
+    }
+    tracking_client = LocalTrackerClient()
+    tracking_client.send_metrics(
+        challenge_type=args.challenge_type,
+        metric_name=args.metric_name,
+        metrics_data=metrics_data,
+        session_id=get_session_id()
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import aiohttp
+
+from phase_timing import create_timing_session, create_trace_config
+
+# How the generator manages its connections to the target:
+#   new    - a new connection for every request (worst case: every request pays for the handshake)
+#   pool   - a keep-alive pool shared by everyone sending, bounded per host by pool_size
+#   per-vu - one keep-alive connection for each virtual user / worker thread
+STRATEGIES = ("new", "pool", "per-vu")
+
+class RequestsConnections:
+    """
+    Hands out requests sessions to worker threads according to a connection strategy.
+
+    session_for_worker() is called once per worker. It returns None under "new", which tells
+    the sender to open (and close) a fresh session for every request; the shared pooled
+    session under "pool"; and a worker-owned single-connection session under "per-vu".
+    With "pool", workers wait for a free connection rather than going over pool_size.
+    """
+
+    def __init__(self, strategy, pool_size=10):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown connection strategy '{strategy}'. Choose from {', '.join(STRATEGIES)}.")
+        self.strategy = strategy
+        self.shared = create_timing_session(pool_maxsize=pool_size, pool_block=True) if strategy == "pool" else None
+        self._owned = []
+
+    def session_for_worker(self):
+        if self.strategy == "pool":
+            return self.shared
+        if self.strategy == "per-vu":
+            session = create_timing_session(pool_maxsize=1)
+            self._owned.append(session)
+            return session
+        return None
+
+    def close(self):
+        for session in self._owned + ([self.shared] if self.shared else []):
+            session.close()
+
+def create_client_session(strategy="pool", max_in_flight=0, pool_size=0):
+    """
+    Creates the aiohttp session requests are sent on, with phase tracing.
+
+    "new" closes every connection after its response. "pool" keeps connections alive, at
+    most pool_size to the target (0 for no per-host limit). max_in_flight caps connections
+    overall (0 for unlimited). "per-vu" gets the same shared pool here, which the asyncio
+    engine only uses for open-loop requests; its virtual users get sessions of their own from
+    create_virtual_user_session().
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown connection strategy '{strategy}'. Choose from {', '.join(STRATEGIES)}.")
+    if strategy == "new":
+        connector = aiohttp.TCPConnector(limit=max_in_flight, limit_per_host=0, force_close=True)
+    else:
+        connector = aiohttp.TCPConnector(limit=max_in_flight, limit_per_host=pool_size)
+    return aiohttp.ClientSession(connector=connector, trace_configs=[create_trace_config()])
+
+def create_virtual_user_session():
+    """Creates a session holding the single keep-alive connection of one virtual user."""
+    return aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=1), trace_configs=[create_trace_config()])
@@ -0,0 +1,423 @@
+import argparse
+import json
+import os
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+from async_engine import run_open_loop_test, run_profile_test
+from connections import STRATEGIES
+from load_profile import load_profile, scale_stages, profile_duration, describe_stages
+from local_tracker_client import LocalTrackerClient, get_session_id
+from multiprocess_runner import split_evenly
+from run_stats import RunStats
+from workload import load_workload, describe_workload
+
+# The engines an agent can be asked to run, by the name used in the test plan
+RUN_FNS = {"open_loop": run_open_loop_test, "profile": run_profile_test}
+
+class Coordinator:
+    """
+    Hands a test plan to remote agents over HTTP and merges the stats they stream back.
+
+    Agents POST /register and then poll GET /plan. Once expected_agents have registered, each
+    gets its share of the load (see build_plans()) and one common start time, start_delay_s
+    in the future, so every agent begins sending at the same moment. While running, agents
+    POST /snapshot with the RunStats.to_dict() of the results since their last snapshot; these
+    compact histogram deltas are merged into one RunStats as they arrive, so the merged stats
+    are always complete up to the agents' last snapshots. Every snapshot carries a per-agent
+    sequence number, and one that was already applied (a retry whose first response was lost)
+    is acknowledged without being merged again. An agent's last snapshot is marked final and
+    carries its duration; an agent that never sends it counts as having run until its last
+    snapshot arrived.
+    """
+
+    def __init__(self, shard_plans, start_delay_s=5.0, port=8089, host="0.0.0.0"):
+        self.shard_plans = shard_plans
+        self.expected_agents = len(shard_plans)
+        self.start_delay_s = start_delay_s
+        self.stats = RunStats()
+        self.agents = {} # agent_id -> {"name", "index", "finished", "duration_s", "error", "applied"}
+        self.start_at = None
+        self.all_registered = threading.Event()
+        self.all_finished = threading.Event()
+        self._lock = threading.Lock()
+
+        coordinator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                path = urlparse(self.path).path
+                try:
+                    body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                except ValueError:
+                    self.reply(400, {"error": "Request body must be JSON."})
+                    return
+                if path == "/register":
+                    self.reply(*coordinator.register(body))
+                elif path == "/snapshot":
+                    self.reply(*coordinator.snapshot(body))
+                else:
+                    self.reply(404, {"error": "Not found."})
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == "/plan":
+                    self.reply(*coordinator.plan(parse_qs(url.query).get("agent_id", [""])[0]))
+                else:
+                    self.reply(404, {"error": "Not found."})
+
+            def reply(self, status, data=None):
+                body = json.dumps(data).encode() if data is not None else b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass # Keep agent polling out of the load test output
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, name="coordinator", daemon=True)
+        self._thread.start()
+        print(f"Coordinator listening on http://{host}:{self.server.server_address[1]}, waiting for {self.expected_agents} agents...")
+
+    def register(self, body):
+        with self._lock:
+            if len(self.agents) >= self.expected_agents:
+                return 409, {"error": f"All {self.expected_agents} agents have already registered."}
+            agent_id = f"agent-{len(self.agents)}"
+            self.agents[agent_id] = {"name": str(body.get("name", agent_id)), "index": len(self.agents), "finished": False, "duration_s": 0.0, "error": None,
+                                     "applied": set()}
+            print(f"Agent {self.agents[agent_id]['name']} registered as {agent_id} ({len(self.agents)}/{self.expected_agents}).")
+            if len(self.agents) == self.expected_agents:
+                self.start_at = time.time() + self.start_delay_s
+                self.all_registered.set()
+        return 200, {"agent_id": agent_id}
+
+    def plan(self, agent_id):
+        """Returns 204 until every agent has registered, then the agent's shard of the plan and the common start time."""
+        if agent_id not in self.agents:
+            return 404, {"error": f"Unknown agent '{agent_id}'. Register first."}
+        if not self.all_registered.is_set():
+            return 204, None
+        return 200, {**self.shard_plans[self.agents[agent_id]["index"]], "start_at": self.start_at, "server_time": time.time()}
+
+    def snapshot(self, body):
+        agent_id = body.get("agent_id")
+        if agent_id not in self.agents:
+            return 404, {"error": f"Unknown agent '{agent_id}'."}
+        delta = RunStats.from_dict(body["stats"]) if body.get("stats") else None
+        with self._lock:
+            agent = self.agents[agent_id]
+            sequence = body.get("sequence")
+            if sequence in agent["applied"]:
+                return 200, {"status": "duplicate"}
+            agent["applied"].add(sequence)
+            if delta is not None:
+                self.stats.merge(delta)
+            if not agent["finished"] and self.start_at is not None:
+                agent["duration_s"] = time.time() - self.start_at # Until the final snapshot says otherwise
+            if body.get("final") and not agent["finished"]:
+                agent["finished"] = True
+                agent["duration_s"] = float(body.get("duration_s") or 0)
+                agent["error"] = body.get("error")
+                if agent["error"]:
+                    print(f"Agent {agent['name']} failed:\n{agent['error']}")
+                else:
+                    print(f"Agent {agent['name']} finished in {agent['duration_s']:.2f} s.")
+                if all(agent["finished"] for agent in self.agents.values()):
+                    self.all_finished.set()
+        return 200, {"status": "ok"}
+
+    def progress(self):
+        with self._lock:
+            return self.stats.total_requests, sum(agent["finished"] for agent in self.agents.values())
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def build_plans(url, method, agents, payload_urls=None, rate=None, duration=None, stages=None, workload=None,
+                max_in_flight=0, connection_strategy="pool", pool_size=0):
+    """
+    Splits one test across agents and returns a JSON-serializable plan per agent.
+
+    Rates, virtual users and connection limits are divided as they are between worker
+    processes: each agent gets the full duration and its share of the load.
+    """
+    plans = []
+    stage_shards = scale_stages(stages, agents) if stages else [None] * agents
+    for stage_shard, max_in_flight_share, pool_share in zip(stage_shards, split_evenly(max_in_flight, agents), split_evenly(pool_size, agents)):
+        kwargs = {
+            "url": url,
+            "method": method,
+            "payload_urls": payload_urls,
+            "max_in_flight": max(1, max_in_flight_share) if max_in_flight else 0,
+            "connection_strategy": connection_strategy,
+            "pool_size": max(1, pool_share) if pool_size else 0,
+            "workload": workload,
+        }
+        if stage_shard:
+            plans.append({"run": "profile", "kwargs": {**kwargs, "stages": stage_shard}})
+        else:
+            plans.append({"run": "open_loop", "kwargs": {**kwargs, "rate": rate / agents, "duration": duration}})
+    return plans
+
+class SnapshotStreamer:
+    """
+    Result observer of an agent: streams the results since the last snapshot to the coordinator every interval_s.
+
+    Like WindowAggregator, record() only adds to the current RunStats under a short lock and a
+    timer thread does the sending. Snapshots are numbered, and one the coordinator does not
+    acknowledge is sent again, with the same number, before any newer one, so a brief network
+    problem loses no results and the coordinator can ignore a snapshot it already applied.
+    """
+
+    def __init__(self, coordinator_url, agent_id, interval_s=2.0, session=None):
+        self.snapshot_url = f"{coordinator_url.rstrip('/')}/snapshot"
+        self.agent_id = agent_id
+        self.interval_s = interval_s
+        self.session = session or requests.Session()
+        self._lock = threading.Lock()
+        self._pending = RunStats()
+        self._unacknowledged = [] # Snapshot bodies not yet acknowledged, oldest first
+        self._sequence = 0
+        self._send_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._timer = threading.Thread(target=self._run_timer, name="snapshot-streamer", daemon=True)
+        self._timer.start()
+
+    def record(self, result):
+        with self._lock:
+            self._pending.record(result)
+
+    def _run_timer(self):
+        while not self._stop.wait(self.interval_s):
+            self.flush()
+
+    def flush(self, final=False, duration_s=None, error=None, retries=1):
+        """Sends the results since the last snapshot, after any earlier snapshots still unacknowledged. Returns True if all got through."""
+        with self._send_lock:
+            with self._lock:
+                snapshot, self._pending = self._pending, RunStats()
+            if final or snapshot.total_requests:
+                self._unacknowledged.append({
+                    "agent_id": self.agent_id, "sequence": self._sequence, "stats": snapshot.to_dict() if snapshot.total_requests else None,
+                    "final": final, "duration_s": duration_s, "error": error
+                })
+                self._sequence += 1
+            while self._unacknowledged:
+                if not self._send(self._unacknowledged[0], retries):
+                    return False
+                self._unacknowledged.pop(0)
+            return True
+
+    def _send(self, body, retries):
+        for attempt in range(retries):
+            try:
+                response = self.session.post(self.snapshot_url, json=body, timeout=30)
+                response.raise_for_status()
+                return True
+            except requests.exceptions.RequestException as e:
+                if attempt == retries - 1:
+                    print(f"Could not send snapshot {body['sequence']} to the coordinator: {e}")
+                else:
+                    time.sleep(0.5 * 2 ** attempt)
+        return False
+
+    def close(self, duration_s=None, error=None):
+        """Stops the timer and sends the remaining results as the agent's final snapshot."""
+        self._stop.set()
+        self._timer.join()
+        self.flush(final=True, duration_s=duration_s, error=error, retries=5)
+
+def run_agent(coordinator_url, name, poll_interval_s=0.5, register_timeout_s=0):
+    """
+    Registers with the coordinator, waits for the plan and the common start, runs its shard and streams the results.
+
+    Registration is retried until the coordinator is up (for register_timeout_s seconds, or
+    forever if 0). The start time in the plan is on the coordinator's clock; the agent
+    estimates the offset to its own clock from the plan response, so agents on machines whose
+    clocks disagree still start together to within the network round-trip.
+    """
+    coordinator_url = coordinator_url.rstrip("/")
+    session = requests.Session()
+    deadline = time.time() + register_timeout_s if register_timeout_s else None
+    waiting_printed = False
+    while True:
+        try:
+            response = session.post(f"{coordinator_url}/register", json={"name": name}, timeout=10)
+            if response.status_code == 409:
+                raise RuntimeError(response.json()["error"])
+            response.raise_for_status()
+            agent_id = response.json()["agent_id"]
+            break
+        except requests.exceptions.RequestException as e:
+            if deadline is not None and time.time() > deadline:
+                raise RuntimeError(f"Could not register with the coordinator at {coordinator_url}: {e}")
+            if not waiting_printed:
+                print(f"Waiting for the coordinator at {coordinator_url}...")
+                waiting_printed = True
+            time.sleep(poll_interval_s)
+    print(f"Registered with {coordinator_url} as {agent_id}. Waiting for the test plan...")
+
+    while True:
+        sent_at = time.time()
+        response = session.get(f"{coordinator_url}/plan", params={"agent_id": agent_id}, timeout=10)
+        received_at = time.time()
+        response.raise_for_status()
+        if response.status_code == 200:
+            plan = response.json()
+            break
+        time.sleep(poll_interval_s)
+
+    clock_offset = plan["server_time"] - (sent_at + received_at) / 2
+    start = plan["start_at"] - clock_offset
+    streamer = SnapshotStreamer(coordinator_url, agent_id, plan.get("snapshot_interval_s", 2.0), session)
+    print(f"Got a {plan['run']} plan; starting in {max(0.0, start - time.time()):.2f} s (clock offset to the coordinator {clock_offset * 1000:.1f} ms).")
+    if start > time.time():
+        time.sleep(start - time.time())
+    try:
+        stats, duration_s = RUN_FNS[plan["run"]](**plan["kwargs"], observers=[streamer])
+    except Exception as e:
+        streamer.close(error=repr(e))
+        raise
+    streamer.close(duration_s=duration_s)
+    print(f"Done: {stats.total_requests} requests in {duration_s:.2f} s.")
+
+def main():
+    """Runs the coordinator or an agent of a distributed load test."""
+    parser = argparse.ArgumentParser(description="Distributed load testing: one coordinator and several agents.")
+    subparsers = parser.add_subparsers(dest="role", required=True)
+
+    coordinator_parser = subparsers.add_parser("coordinator", help="Plan the test, start the agents together and report the merged results.")
+    coordinator_parser.add_argument("url", nargs='?', default="http://url-anvil:8080", help="The URL (or, with --workload, base URL) the agents send requests to.")
+    coordinator_parser.add_argument("--agents", type=int, required=True, help="How many agents to wait for; the load is split evenly between them.")
+    coordinator_parser.add_argument("--rate", type=float, help="Total requests per second across all agents (open-loop).")
+    coordinator_parser.add_argument("--duration", type=float, help="How long to keep sending at --rate, in seconds.")
+    coordinator_parser.add_argument("--profile", help="JSON or YAML load profile to run instead of --rate/--duration; rates and virtual users are totals across agents.")
+    coordinator_parser.add_argument("--workload", help="JSON or YAML workload mix to send (see workload.py); its stages are used if no --rate or --profile is given.")
+    coordinator_parser.add_argument("--method", default=os.getenv('REQUEST_METHOD', 'GET'), help="HTTP method (GET or POST).")
+    coordinator_parser.add_argument("--payload-urls", default=os.getenv('PAYLOAD_URLS', ''), help="Comma-separated URLs for POST request payload.")
+    coordinator_parser.add_argument("--max-in-flight", type=int, default=0, help="Maximum concurrent connections across all agents (0 for unlimited).")
+    coordinator_parser.add_argument("--connections", choices=STRATEGIES, default="pool", help="Connection strategy of every agent (see load_test.py).")
+    coordinator_parser.add_argument("--pool-size", type=int, default=0, help="Maximum keep-alive connections across all agents with --connections pool (0 for no limit).")
+    coordinator_parser.add_argument("--port", type=int, default=8089, help="Port the coordinator listens on for agents.")
+    coordinator_parser.add_argument("--start-delay", type=float, default=5, help="Seconds between the last agent registering and the common start.")
+    coordinator_parser.add_argument("--snapshot-interval", type=float, default=2, help="How often agents send their results, in seconds.")
+    coordinator_parser.add_argument("--register-timeout", type=float, default=300, help="Give up if the agents have not all registered after this many seconds.")
+    coordinator_parser.add_argument("--finish-timeout", type=float, default=60, help="How long after the planned end to wait for slow agents before reporting without them.")
+    coordinator_parser.add_argument("--challenge-type", default="load-test", help="Type of challenge for tracking.")
+    coordinator_parser.add_argument("--metric-name", default="load_test_run_metrics", help="Name of the metric for tracking.")
+    coordinator_parser.add_argument("--commit-hash", help="The git commit hash for the load test run.")
+
+    agent_parser = subparsers.add_parser("agent", help="Register with a coordinator, run its share of the test and stream the results back.")
+    agent_parser.add_argument("coordinator_url", nargs='?', default="http://load-generator:8089", help="Base URL of the coordinator.")
+    agent_parser.add_argument("--name", default=f"{socket.gethostname()}-{os.getpid()}", help="Name to register under, shown by the coordinator.")
+    agent_parser.add_argument("--register-timeout", type=float, default=0, help="Give up if the coordinator cannot be reached for this many seconds (0 to keep trying).")
+    args = parser.parse_args()
+
+    if args.role == "agent":
+        run_agent(args.coordinator_url, args.name, register_timeout_s=args.register_timeout)
+        return
+
+    open_loop = args.rate is not None or args.duration is not None
+    if args.agents < 1:
+        parser.error("--agents must be at least 1.")
+    if args.profile and open_loop:
+        parser.error("--profile cannot be combined with --rate or --duration.")
+    if open_loop and (not args.rate or not args.duration or args.rate <= 0 or args.duration <= 0):
+        parser.error("--rate and --duration must both be given and greater than zero.")
+    workload = load_workload(args.workload) if args.workload else None
+    if not open_loop and not args.profile and not (workload and workload["stages"]):
+        parser.error("Give --rate and --duration, --profile, or a --workload with stages.")
+
+    payload_urls_list = [url.strip() for url in args.payload_urls.split(',') if url.strip()]
+    if not payload_urls_list and (args.method.upper() == 'POST' or workload):
+        payload_urls_list = ["https://example.com", "https://google.com"]
+    if workload:
+        print(f"Sending the workload mix {args.workload} to {args.url}:")
+        print("\n".join(describe_workload(workload)))
+    stages = None
+    if not open_loop:
+        stages = load_profile(args.profile) if args.profile else workload["stages"]
+        args.duration = profile_duration(stages)
+        print(f"Distributed load profile ({args.duration:g} s) across {args.agents} agents:")
+        print("\n".join(describe_stages(stages)))
+    else:
+        print(f"Distributed open-loop load test at {args.rate} RPS for {args.duration} s across {args.agents} agents.")
+
+    shard_plans = build_plans(
+        args.url, args.method, args.agents,
+        payload_urls=payload_urls_list if args.method.upper() == 'POST' or workload else None,
+        rate=args.rate, duration=args.duration, stages=stages, workload=workload,
+        max_in_flight=args.max_in_flight, connection_strategy=args.connections, pool_size=args.pool_size
+    )
+    for plan in shard_plans:
+        plan["snapshot_interval_s"] = args.snapshot_interval
+    session_id = get_session_id()
+    coordinator = Coordinator(shard_plans, args.start_delay, args.port)
+    try:
+        if not coordinator.all_registered.wait(args.register_timeout):
+            print(f"Only {len(coordinator.agents)} of {args.agents} agents registered within {args.register_timeout:g} s. Giving up.")
+            return
+        print(f"All agents registered. Starting in {args.start_delay:g} s.")
+        deadline = coordinator.start_at + args.duration + args.finish_timeout
+        while not coordinator.all_finished.wait(min(args.snapshot_interval, max(0.0, deadline - time.time()))):
+            if time.time() >= deadline:
+                print(f"Stopped waiting for agents {args.finish_timeout:g} s after the planned end; reporting without their remaining results.")
+                break
+            if time.time() >= coordinator.start_at:
+                requests_so_far, finished = coordinator.progress()
+                print(f"{requests_so_far} requests so far, {finished}/{args.agents} agents finished.")
+    finally:
+        coordinator.close()
+
+    stats = coordinator.stats
+    # Agents start together, so the run lasts as long as the slowest agent (up to its last snapshot if it never finished)
+    duration_s = max((agent["duration_s"] for agent in coordinator.agents.values()), default=0.0) or time.time() - coordinator.start_at
+    failed_agents = [agent["name"] for agent in coordinator.agents.values() if agent["error"] or not agent["finished"]]
+    print("Distributed load test finished. Merged metrics:")
+    summary = stats.print_summary(duration_s)
+    stage_summaries = None
+    if stages:
+        stage_summaries = stats.print_stage_summaries({stage["name"]: stage["duration"] for stage in stages})
+    endpoint_summaries = None
+    if workload:
+        endpoint_summaries = stats.print_endpoint_summaries(duration_s)
+
+    metrics_data = {
+        "target_url": args.url,
+        "request_count": stats.total_requests,
+        "method": args.method,
+        "payload_urls": payload_urls_list,
+        **summary,
+        "test_type": "distributed_load_test",
+        "target_rate": args.rate,
+        "profile": stages,
+        "stages": stage_summaries,
+        "workload": workload,
+        "endpoints": endpoint_summaries,
+        "agents": [agent["name"] for agent in coordinator.agents.values()],
+        "failed_agents": failed_agents,
+        "connection_strategy": args.connections,
+        "pool_size": args.pool_size,
+        "commit_hash": args.commit_hash
+    }
+    tracking_client = LocalTrackerClient()
+    tracking_client.send_metrics(
+        challenge_type=args.challenge_type,
+        metric_name=args.metric_name,
+        metrics_data=metrics_data,
+        session_id=session_id
+    )
+
+if __name__ == "__main__":
+    main()
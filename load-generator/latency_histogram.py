@@ -0,0 +1,122 @@
+class LatencyHistogram:
+    """
+    Constant-memory, log-bucketed latency histogram in the style of HdrHistogram.
+
+    Latencies are stored in microseconds. Values below 2**sub_bucket_bits get one bucket each;
+    above that, every power of two is split into 2**(sub_bucket_bits - 1) equal buckets, so the
+    relative error of any reported value is below 1 / 2**(sub_bucket_bits - 1) (under 0.8% with
+    the default of 8 bits). One hour fits in roughly 3,300 buckets, and only non-empty buckets are
+    stored, so memory is bounded no matter how many values are recorded.
+
+    Histograms with the same sub_bucket_bits can be merged, and to_dict()/from_dict() give a
+    JSON-serializable form that survives being sent through LocalTrackerClient.
+    """
+
+    def __init__(self, sub_bucket_bits=8):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.sub_bucket_count = 1 << sub_bucket_bits
+        self.sub_bucket_half = self.sub_bucket_count >> 1
+        self.counts = {}
+        self.total_count = 0
+        self.total_us = 0
+        self.min_us = None
+        self.max_us = None
+
+    def _bucket_index(self, value_us):
+        if value_us < self.sub_bucket_count:
+            return value_us
+        shift = value_us.bit_length() - self.sub_bucket_bits
+        return shift * self.sub_bucket_half + (value_us >> shift)
+
+    def _bucket_bounds(self, index):
+        """Returns the lowest and highest microsecond value that fall into the bucket."""
+        if index < self.sub_bucket_count:
+            return index, index
+        shift = index // self.sub_bucket_half - 1
+        sub_bucket = index - shift * self.sub_bucket_half
+        return sub_bucket << shift, ((sub_bucket + 1) << shift) - 1
+
+    def _bucket_value(self, index):
+        low, high = self._bucket_bounds(index)
+        return (low + high) // 2
+
+    def record(self, latency_ms, count=1):
+        """Records a latency given in milliseconds."""
+        value_us = max(0, int(round(latency_ms * 1000)))
+        index = self._bucket_index(value_us)
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.total_count += count
+        self.total_us += value_us * count
+        if self.min_us is None or value_us < self.min_us:
+            self.min_us = value_us
+        if self.max_us is None or value_us > self.max_us:
+            self.max_us = value_us
+
+    def merge(self, other):
+        """Adds the counts of another histogram into this one."""
+        if other.sub_bucket_bits != self.sub_bucket_bits:
+            raise ValueError("Cannot merge histograms with different sub_bucket_bits.")
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.total_count += other.total_count
+        self.total_us += other.total_us
+        if other.min_us is not None and (self.min_us is None or other.min_us < self.min_us):
+            self.min_us = other.min_us
+        if other.max_us is not None and (self.max_us is None or other.max_us > self.max_us):
+            self.max_us = other.max_us
+        return self
+
+    def percentile(self, percentile):
+        """Returns the latency in milliseconds at the given percentile (0-100)."""
+        if self.total_count == 0:
+            return 0
+        if percentile >= 100:
+            return self.max_us / 1000
+        # Rank of the value, rounded up, so p50 of [1, 2] is 1 and p99 of 100 values is the 99th
+        target = max(1, -(-percentile * self.total_count // 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                value_us = min(max(self._bucket_value(index), self.min_us), self.max_us)
+                return value_us / 1000
+        return self.max_us / 1000
+
+    def mean(self):
+        """Returns the exact mean latency in milliseconds."""
+        return self.total_us / self.total_count / 1000 if self.total_count > 0 else 0
+
+    def buckets(self):
+        """Yields (value_ms, count) pairs in ascending order, one per non-empty bucket."""
+        for index in sorted(self.counts):
+            yield self._bucket_value(index) / 1000, self.counts[index]
+
+    def summary(self, prefix=""):
+        """Returns the percentile fields reported in run summaries and runDetails."""
+        return {
+            f"{prefix}p50_latency_ms": self.percentile(50),
+            f"{prefix}p90_latency_ms": self.percentile(90),
+            f"{prefix}p99_latency_ms": self.percentile(99),
+            f"{prefix}p999_latency_ms": self.percentile(99.9),
+            f"{prefix}max_latency_ms": self.max_us / 1000 if self.max_us is not None else 0,
+        }
+
+    def to_dict(self):
+        return {
+            "sub_bucket_bits": self.sub_bucket_bits,
+            "total_count": self.total_count,
+            "total_us": self.total_us,
+            "min_us": self.min_us,
+            "max_us": self.max_us,
+            "counts": {str(index): count for index, count in sorted(self.counts.items())},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(data.get("sub_bucket_bits", 8))
+        histogram.counts = {int(index): count for index, count in data.get("counts", {}).items()}
+        histogram.total_count = data.get("total_count", sum(histogram.counts.values()))
+        histogram.total_us = data.get("total_us", 0)
+        histogram.min_us = data.get("min_us")
+        histogram.max_us = data.get("max_us")
+        return histogram
@@ -0,0 +1,140 @@
+import json
+import math
+
+try:
+    import yaml
+except ImportError: # PyYAML is only needed for .yaml/.yml profiles
+    yaml = None
+
+TRANSITIONS = ("step", "linear")
+
+def load_profile(path):
+    """
+    Reads a load profile from a JSON or YAML file and returns its validated list of stages.
+
+    The file holds a list of stages, either at the top level or under a "stages" key:
+
+        stages:
+          - {name: warmup, rate: 20, duration: 30}
+          - {name: ramp, rate: 200, duration: 120, transition: linear}
+          - {name: soak, rate: 200, duration: 600}
+          - {name: burst, concurrency: 100, duration: 30}
+
+    Each stage targets either a request rate (requests per second, open-loop) or a concurrency
+    (virtual users that each send their next request as soon as the previous one completes),
+    and runs for duration seconds. With transition "step" (the default) the target applies
+    from the first instant of the stage; with "linear" the stage ramps evenly to it from where
+    the previous stage ended (or from zero, if the previous stage targeted the other kind of load).
+    """
+    with open(path) as f:
+        if path.endswith((".yaml", ".yml")):
+            if yaml is None:
+                raise RuntimeError("YAML load profiles need the PyYAML package (pip install pyyaml).")
+            profile = yaml.safe_load(f)
+        else:
+            profile = json.load(f)
+    if isinstance(profile, dict):
+        profile = profile.get("stages")
+    return validate_stages(profile)
+
+def validate_stages(stages):
+    """Checks a list of stage dicts and returns normalized copies with start values filled in."""
+    if not isinstance(stages, list) or not stages:
+        raise ValueError("A load profile needs a non-empty list of stages.")
+    normalized = []
+    names = set()
+    previous = None
+    for i, stage in enumerate(stages):
+        if not isinstance(stage, dict):
+            raise ValueError(f"Stage {i} must be a mapping, got {stage!r}.")
+        name = str(stage.get("name", f"stage-{i}"))
+        if name in names:
+            raise ValueError(f"Stage name '{name}' is used more than once.")
+        names.add(name)
+        if ("rate" in stage) == ("concurrency" in stage):
+            raise ValueError(f"Stage '{name}' must set exactly one of rate or concurrency.")
+        kind = "rate" if "rate" in stage else "concurrency"
+        target = stage[kind]
+        duration = stage.get("duration")
+        transition = stage.get("transition", "step")
+        if not isinstance(target, (int, float)) or target < 0:
+            raise ValueError(f"Stage '{name}': {kind} must be a number of at least zero.")
+        if kind == "concurrency" and int(target) != target:
+            raise ValueError(f"Stage '{name}': concurrency must be a whole number.")
+        if not isinstance(duration, (int, float)) or duration <= 0:
+            raise ValueError(f"Stage '{name}': duration must be a number of seconds greater than zero.")
+        if transition not in TRANSITIONS:
+            raise ValueError(f"Stage '{name}': transition must be one of {', '.join(TRANSITIONS)}.")
+
+        start = target
+        if transition == "linear":
+            start = previous["target"] if previous and previous["kind"] == kind else 0
+        normalized.append({
+            "name": name,
+            "kind": kind,
+            "start": start,
+            "target": target,
+            "duration": float(duration),
+            "transition": transition,
+        })
+        previous = normalized[-1]
+    return normalized
+
+def scale_stages(stages, processes):
+    """Returns one copy of the stages per worker process, splitting every rate and concurrency."""
+    shards = [[] for _ in range(processes)]
+    for stage in stages:
+        for i, shard in enumerate(shards):
+            scaled = dict(stage)
+            if stage["kind"] == "rate":
+                scaled["start"] = stage["start"] / processes
+                scaled["target"] = stage["target"] / processes
+            else:
+                # Whole virtual users per process, differing by at most one
+                scaled["start"] = stage["start"] // processes + (1 if i < stage["start"] % processes else 0)
+                scaled["target"] = stage["target"] // processes + (1 if i < stage["target"] % processes else 0)
+            shard.append(scaled)
+    return shards
+
+def arrival_offset(index, start_rate, end_rate, duration):
+    """
+    Returns the time (s, from the start of the stage) at which the index-th request is due.
+
+    The rate changes linearly from start_rate to end_rate over the stage, so the number of
+    arrivals by time t is start_rate * t + (end_rate - start_rate) * t**2 / (2 * duration),
+    and this inverts it. Returns None if the stage never reaches that many requests.
+    """
+    a = (end_rate - start_rate) / (2 * duration)
+    b = start_rate
+    if a == 0:
+        if b == 0:
+            return None
+        offset = index / b
+    else:
+        discriminant = b * b + 4 * a * index
+        if discriminant < 0:
+            return None
+        offset = (math.sqrt(discriminant) - b) / (2 * a)
+    return offset if offset < duration else None
+
+def concurrency_at(stage, elapsed_s):
+    """Returns the number of virtual users a concurrency stage should have after elapsed_s seconds."""
+    if stage["transition"] == "step":
+        return int(stage["target"])
+    progress = min(1.0, max(0.0, elapsed_s / stage["duration"]))
+    return int(round(stage["start"] + (stage["target"] - stage["start"]) * progress))
+
+def profile_duration(stages):
+    return sum(stage["duration"] for stage in stages)
+
+def describe_stages(stages):
+    """Returns one human-readable line per stage, for the start-of-run banner."""
+    lines = []
+    for stage in stages:
+        unit = "RPS" if stage["kind"] == "rate" else "virtual users"
+        if stage["transition"] == "linear" and stage["start"] != stage["target"]:
+            load = f"{stage['start']:g} -> {stage['target']:g} {unit}"
+        else:
+            load = f"{stage['target']:g} {unit}"
+        lines.append(f"  {stage['name']}: {load} for {stage['duration']:g} s")
+    return lines
@@ -3,47 +3,133 @@ import argparse
 import time
 import os
 import json
-import datetime
-import uuid
-from local_tracker_client import LocalTrackerClient
+from local_tracker_client import LocalTrackerClient, get_session_id
+from async_engine import run_open_loop_test, run_profile_test, run_replay_test
+from load_profile import load_profile, scale_stages, profile_duration, describe_stages
+from run_stats import RunStats
+from multiprocess_runner import run_in_processes, split_evenly
+from result_log import ResultLogWriter, shard_result_log_path
+from window_aggregator import WindowAggregator
+from remote_write_client import RemoteWriteClient
+from metrics_exporter import MetricsExporter
+from phase_timing import create_timing_session, start_phases, finish_phases
+from connections import RequestsConnections, STRATEGIES
+from workload import load_workload, describe_workload
 
 print("Script started!")
 
-def get_session_id():
-    session_id_file = ".session_id"
-    if os.path.exists(session_id_file):
-        with open(session_id_file, "r") as f:
-            return f.read().strip()
-    else:
-        session_id = f"{datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
-        with open(session_id_file, "w") as f:
-            f.write(session_id)
-        return session_id
-
-def send_request(url, method, payload_urls=None):
-    """Sends a single HTTP request to the specified URL and returns metrics."""
+REQUEST_INTERVAL_S = 0.1 # Pacing of sequential requests, to avoid overwhelming the target
+
+def send_request(url, method, payload_urls=None, intended_time=None, verbose=False, session=None):
+    """
+    Sends a single HTTP request to the specified URL and returns metrics.
+
+    The request goes over session if one is given (see connections.py), otherwise over a new
+    connection that is closed afterwards.
+    If intended_time (epoch seconds) is given, the result also carries corrected_latency:
+    the time from when the request should have been sent until its response arrived.
+    The result's "phases" holds the time spent in each phase of the request and "connection"
+    whether a connection was opened, reused or failed to open (see phase_timing.py).
+    Per-request console output is only printed when verbose is set.
+    """
     start_time = time.time()
     status_code = None
     success = False
+    response_bytes = 0
+    own_session = session is None
+    if own_session:
+        session = create_timing_session()
+    phases = start_phases()
+    start = time.perf_counter()
+    headers_at = body_at = None
     try:
         if method.upper() == 'POST':
             headers = {'Content-Type': 'application/json'}
             data = json.dumps({'urls': payload_urls})
-            response = requests.post(url, headers=headers, data=data)
+            response = session.post(url, headers=headers, data=data, stream=True)
         else: # Default to GET
-            response = requests.get(url)
+            response = session.get(url, stream=True)
+        headers_at = time.perf_counter()
         status_code = response.status_code
+        response_bytes = len(response.content)
+        body_at = time.perf_counter()
         response.raise_for_status() # Raise an exception for HTTP errors (4xx or 5xx)
         success = True
     except requests.exceptions.RequestException as e:
-        print(f"Request to {url} ({method}) failed: {e}")
+        if verbose:
+            print(f"Request to {url} ({method}) failed: {e}")
         if hasattr(e, 'response') and e.response is not None:
             status_code = e.response.status_code
     finally:
         end_time = time.time()
+        if own_session:
+            session.close()
+        phases, connection = finish_phases(phases, start, headers_at, body_at)
         latency = (end_time - start_time) * 1000 # Latency in ms
-        print(f"Request to {url} ({method}) - Status: {status_code}, Time: {latency:.2f} ms, Success: {success}")
-        return {"latency": latency, "status_code": status_code, "success": success}
+        if verbose:
+            print(f"Request to {url} ({method}) - Status: {status_code}, Time: {latency:.2f} ms, Success: {success}")
+        result = {"latency": latency, "status_code": status_code, "success": success, "start_time": start_time, "bytes": response_bytes,
+                  "phases": phases, "connection": connection}
+        if intended_time is not None:
+            result["intended_time"] = intended_time
+            result["corrected_latency"] = (end_time - intended_time) * 1000
+        return result
+
+def run_sequential(url, method, request_count, payload_urls=None, verbose=False, observers=(), connection_strategy="new", pool_size=0, interval_s=REQUEST_INTERVAL_S):
+    """
+    Sends request_count requests one after another and returns (RunStats, duration_s).
+
+    Requests are paced on a fixed schedule of one every interval_s. When a slow
+    response pushes the loop behind schedule, the next request goes out immediately and its
+    corrected latency counts the time it spent waiting to be sent. With only one request in
+    flight, the "pool" and "per-vu" connection strategies both keep one connection open for
+    the whole run; "new" opens one per request. Every result is also passed to the record()
+    method of each observer; observers with a request_started() method are also told when
+    each request goes out.
+    """
+    stats = RunStats()
+    connections = RequestsConnections(connection_strategy, max(1, pool_size))
+    session = connections.session_for_worker()
+    start_hooks = [observer.request_started for observer in observers if hasattr(observer, "request_started")]
+    start_test_time = time.time()
+    for i in range(request_count):
+        intended_time = start_test_time + i * interval_s
+        delay = intended_time - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        for hook in start_hooks:
+            hook()
+        result = send_request(url, method, payload_urls, intended_time, verbose, session)
+        stats.record(result)
+        for observer in observers:
+            observer.record(result)
+        if verbose:
+            print(f"Request {i+1}/{request_count} sent.")
+    end_test_time = time.time()
+    connections.close()
+    return stats, end_test_time - start_test_time
+
+def run_shard(run_fn, run_kwargs, result_log=None, window_options=None, remote_write_options=None, metrics_options=None):
+    """
+    Runs one shard of the load test with its result observers and returns (RunStats, duration_s).
+
+    The observers (result log, live window tracking, remote_write push, /metrics endpoint) are created here rather than in main()
+    so that every worker process opens its own file and its own tracking client.
+    """
+    observers = []
+    if result_log:
+        observers.append(ResultLogWriter(result_log))
+    if window_options:
+        observers.append(WindowAggregator(**window_options))
+    if remote_write_options:
+        observers.append(RemoteWriteClient(**remote_write_options))
+    if metrics_options:
+        observers.append(MetricsExporter(**metrics_options))
+    try:
+        return run_fn(**run_kwargs, observers=observers)
+    finally:
+        for observer in observers:
+            observer.close()
 
 def main():
     """Main function to parse arguments and run the load test."""
@@ -51,15 +137,52 @@ def main():
         print("Entering main function.")
         parser = argparse.ArgumentParser(description="Simple load testing script.")
         parser.add_argument("url", nargs='?', default="http://url-anvil:8080", help="The URL to send requests to. Defaults to http://url-anvil:8080.")
-        parser.add_argument("request_count", type=int, help="The number of requests to send.")
+        parser.add_argument("request_count", type=int, nargs='?', help="The number of requests to send. Not used with --rate/--duration or --profile.")
         parser.add_argument("--method", default=os.getenv('REQUEST_METHOD', 'GET'), help="HTTP method (GET or POST).")
         parser.add_argument("--payload-urls", default=os.getenv('PAYLOAD_URLS', ''), help="Comma-separated URLs for POST request payload.")
         parser.add_argument("--challenge-type", default="load-test", help="Type of challenge for tracking.")
         parser.add_argument("--metric-name", default="load_test_run_metrics", help="Name of the metric for tracking.")
         parser.add_argument("--commit-hash", help="The git commit hash for the load test run.")
+        parser.add_argument("--rate", type=float, help="Open-loop mode: requests per second to schedule, regardless of how fast the target responds.")
+        parser.add_argument("--duration", type=float, help="Open-loop mode: how long to keep sending at --rate, in seconds.")
+        parser.add_argument("--profile", help="Profile mode: JSON or YAML file of load stages (rate or concurrency, duration, step or linear transition) to run back to back.")
+        parser.add_argument("--workload", help="Mix mode: JSON or YAML file of weighted endpoints (request templates, think times) to send to instead of url alone, which becomes the base URL. Use with --rate/--duration or --profile, or on its own if the workload has stages.")
+        parser.add_argument("--replay", help="Replay mode: nginx access log (plain or .gz) or directory of rotated logs whose requests are sent to url with their original relative timing.")
+        parser.add_argument("--speed", type=float, default=1.0, help="Replay mode: timing multiplier (1 = original timing, 10 = ten times faster, 0 = as fast as possible).")
+        parser.add_argument("--max-in-flight", type=int, default=0, help="Open-loop, profile and replay modes: maximum concurrent connections (0 for unlimited).")
+        parser.add_argument("--connections", choices=STRATEGIES, help="new: a new connection per request; pool: a shared keep-alive pool; per-vu: one keep-alive connection per virtual user. Defaults to new in the sequential mode and pool otherwise.")
+        parser.add_argument("--pool-size", type=int, default=0, help="Open-loop, profile and replay modes: maximum keep-alive connections to the target with --connections pool (0 for no limit besides --max-in-flight).")
+        parser.add_argument("--processes", type=int, default=1, help="Number of worker processes to shard the request count or rate across.")
+        parser.add_argument("--result-log", help="Stream every request's result to this binary file (one file per process, suffixed .0, .1, ... with --processes). Read it back with result_log.py.")
+        parser.add_argument("--verbose", action="store_true", help="Print a line for every request.")
+        parser.add_argument("--remote-write-url", default=os.getenv('REMOTE_WRITE_URL'), help="Push client-side request metrics to this Prometheus remote_write endpoint during the run (e.g. http://prometheus:9090/api/v1/write).")
+        parser.add_argument("--metrics-port", type=int, help="Serve the generator's own metrics on this port at /metrics for Prometheus to scrape (worker process N uses port + N).")
+        parser.add_argument("--window-interval", type=float, help="Track live metrics every N seconds during the run, each window as its own '<metric-name>_window' metric.")
         
         print("Parsing arguments...")
         args = parser.parse_args()
+        open_loop = args.rate is not None or args.duration is not None
+        if args.profile and (open_loop or args.request_count is not None):
+            parser.error("--profile cannot be combined with request_count, --rate or --duration.")
+        if args.replay and (args.profile or open_loop or args.request_count is not None or args.workload):
+            parser.error("--replay cannot be combined with request_count, --rate, --duration, --profile or --workload.")
+        if args.workload and args.request_count is not None:
+            parser.error("--workload needs --rate/--duration, --profile or stages in the workload file, not request_count.")
+        workload = load_workload(args.workload) if args.workload else None
+        if workload and not open_loop and not args.profile and not workload["stages"]:
+            parser.error("--workload needs --rate/--duration or --profile when the workload file has no stages.")
+        if args.speed < 0:
+            parser.error("--speed must be at least zero.")
+        if open_loop and (not args.rate or not args.duration or args.rate <= 0 or args.duration <= 0):
+            parser.error("--rate and --duration must both be given and greater than zero.")
+        if not open_loop and not args.profile and not args.replay and not args.workload and args.request_count is None:
+            parser.error("request_count is required unless --rate and --duration are given.")
+        if args.processes < 1:
+            parser.error("--processes must be at least 1.")
+        if args.window_interval is not None and args.window_interval <= 0:
+            parser.error("--window-interval must be greater than zero.")
+        if args.pool_size < 0:
+            parser.error("--pool-size must be at least zero.")
         session_id = get_session_id()
         print(f"Arguments parsed: {args}")
 
@@ -68,49 +191,133 @@ def main():
             print("Warning: POST method specified but no payload URLs provided. Using sample URLs.")
             payload_urls_list = ["https://example.com", "https://google.com"]
 
-        print(f"Starting load test with {args.request_count} requests to {args.url} using {args.method} method.")
+        # POST endpoints of a workload without a body of their own send the usual payload
+        request_payload_urls = payload_urls_list if args.method.upper() == 'POST' or workload else None
+        if workload:
+            print(f"Sending the workload mix {args.workload} to {args.url}:")
+            print("\n".join(describe_workload(workload)))
+        stages = None
+        if args.profile or (workload and not open_loop):
+            stages = load_profile(args.profile) if args.profile else workload["stages"]
+            args.duration = profile_duration(stages)
+            print(f"Starting load profile {args.profile or args.workload} ({args.duration:g} s) to {args.url} using {'the workload mix' if workload else args.method + ' method'}:")
+            print("\n".join(describe_stages(stages)))
+            run_fn = run_profile_test
+            shard_kwargs = [
+                {
+                    "url": args.url,
+                    "method": args.method,
+                    "stages": shard_stages,
+                    "payload_urls": request_payload_urls,
+                    "max_in_flight": max(1, max_in_flight) if args.max_in_flight else 0,
+                }
+                for shard_stages, max_in_flight in zip(scale_stages(stages, args.processes), split_evenly(args.max_in_flight, args.processes))
+            ]
+        elif args.replay:
+            pace = "as fast as possible" if args.speed == 0 else f"at {args.speed:g}x speed"
+            print(f"Replaying {args.replay} against {args.url} {pace}.")
+            run_fn = run_replay_test
+            shard_kwargs = [
+                {
+                    "base_url": args.url,
+                    "log_path": args.replay,
+                    "speed": args.speed,
+                    "payload_urls": payload_urls_list, # Access logs have no bodies; logged POSTs get the usual payload
+                    "max_in_flight": max(1, max_in_flight) if args.max_in_flight else 0,
+                    "shard_index": index,
+                    "shard_count": args.processes,
+                }
+                for index, max_in_flight in enumerate(split_evenly(args.max_in_flight, args.processes))
+            ]
+        elif open_loop:
+            args.request_count = int(args.rate * args.duration)
+            print(f"Starting open-loop load test at {args.rate} RPS for {args.duration} s ({args.request_count} requests) to {args.url} using {'the workload mix' if workload else args.method + ' method'}.")
+            run_fn = run_open_loop_test
+            shard_kwargs = [
+                {
+                    "url": args.url,
+                    "method": args.method,
+                    "rate": args.rate / args.processes,
+                    "duration": args.duration,
+                    "payload_urls": request_payload_urls,
+                    "max_in_flight": max(1, max_in_flight) if args.max_in_flight else 0,
+                }
+                for max_in_flight in split_evenly(args.max_in_flight, args.processes)
+            ]
+        else:
+            print(f"Starting load test with {args.request_count} requests to {args.url} using {args.method} method.")
+            run_fn = run_sequential
+            shard_kwargs = [
+                {"url": args.url, "method": args.method, "request_count": request_count, "payload_urls": request_payload_urls}
+                for request_count in split_evenly(args.request_count, args.processes)
+            ]
+
+        if args.connections is None:
+            args.connections = "new" if run_fn is run_sequential else "pool"
+        shards = []
+        for index, (kwargs, pool_size) in enumerate(zip(shard_kwargs, split_evenly(args.pool_size, args.processes))):
+            kwargs["verbose"] = args.verbose
+            kwargs["connection_strategy"] = args.connections
+            kwargs["pool_size"] = max(1, pool_size) if args.pool_size else 0
+            if workload:
+                kwargs["workload"] = workload
+            window_options = None
+            if args.window_interval:
+                window_options = {
+                    "interval_s": args.window_interval,
+                    "challenge_type": args.challenge_type,
+                    "metric_name": f"{args.metric_name}_window",
+                    "session_id": session_id,
+                    "base_metrics": {
+                        "target_url": args.url,
+                        "method": args.method,
+                        "commit_hash": args.commit_hash,
+                        "process_index": index,
+                    },
+                }
+            shards.append({
+                "run_fn": run_fn,
+                "run_kwargs": kwargs,
+                "result_log": shard_result_log_path(args.result_log, index, args.processes),
+                "window_options": window_options,
+                "remote_write_options": {"url": args.remote_write_url, "extra_labels": {"target": args.url}} if args.remote_write_url else None,
+                "metrics_options": {"port": args.metrics_port + index, "target_rps": kwargs.get("rate")} if args.metrics_port else None,
+            })
 
-        results = []
-        start_test_time = time.time()
-        for i in range(args.request_count):
-            result = send_request(args.url, args.method, payload_urls_list if args.method.upper() == 'POST' else None)
-            results.append(result)
-            print(f"Request {i+1}/{args.request_count} sent.")
-            time.sleep(0.1) # Small delay to avoid overwhelming the target
-        end_test_time = time.time()
-        duration_s = end_test_time - start_test_time
+        if args.processes > 1:
+            print(f"Sharding the load across {args.processes} worker processes.")
+            stats, duration_s = run_in_processes(run_shard, shards)
+        else:
+            stats, duration_s = run_shard(**shards[0])
 
         print("Load test finished. Aggregating metrics...")
 
-        total_requests = len(results)
-        successful_requests = sum(1 for r in results if r["success"])
-        failed_requests = total_requests - successful_requests
-        avg_latency_ms = sum(r["latency"] for r in results) / total_requests if total_requests > 0 else 0
-        error_rate = (failed_requests / total_requests) * 100 if total_requests > 0 else 0
-        rps = successful_requests / duration_s if duration_s > 0 else 0
-
-        print(f"Total Requests: {total_requests}")
-        print(f"Successful Requests: {successful_requests}")
-        print(f"Failed Requests: {failed_requests}")
-        print(f"Average Latency: {avg_latency_ms:.2f} ms")
-        print(f"Error Rate: {error_rate:.2f} %")
-        print(f"Requests Per Second (RPS): {rps:.2f}")
-        print(f"Duration: {duration_s:.2f} s")
+        summary = stats.print_summary(duration_s)
+        stage_summaries = None
+        if stages:
+            stage_summaries = stats.print_stage_summaries({stage["name"]: stage["duration"] for stage in stages})
+        endpoint_summaries = None
+        if workload:
+            endpoint_summaries = stats.print_endpoint_summaries(duration_s)
 
         # Prepare metrics for tracking service
         metrics_data = {
             "target_url": args.url,
-            "request_count": args.request_count,
+            "request_count": stats.total_requests if stages or args.replay else args.request_count,
             "method": args.method,
             "payload_urls": payload_urls_list,
-            "total_requests": total_requests,
-            "successful_requests": successful_requests,
-            "failed_requests": failed_requests,
-            "avg_latency_ms": avg_latency_ms,
-            "error_rate": error_rate,
-            "rps": rps,
-            "duration_s": duration_s,
-            "test_type": "manual_load_test", # Example label
+            **summary,
+            "test_type": "load_profile_test" if stages else "replay_load_test" if args.replay else "open_loop_load_test" if open_loop else "manual_load_test", # Example label
+            "replay_log": args.replay,
+            "replay_speed": args.speed if args.replay else None,
+            "target_rate": args.rate,
+            "profile": stages,
+            "stages": stage_summaries,
+            "workload": workload,
+            "endpoints": endpoint_summaries,
+            "processes": args.processes,
+            "connection_strategy": args.connections,
+            "pool_size": args.pool_size,
             "commit_hash": args.commit_hash
         }
 
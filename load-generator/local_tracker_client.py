@@ -3,13 +3,80 @@ import requests
 import json
 import time
 import datetime
+import uuid
+import queue
+import threading
+import atexit
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError: # Windows: the spool is only guarded within one process
+    fcntl = None
+
+# 4xx responses worth retrying; any other 4xx means the payload itself was rejected
+RETRYABLE_CLIENT_ERRORS = (408, 429)
+# Batch rejections that may not be the fault of every payload in it: no /batch endpoint (an older
+# service), a batch too large, or one invalid payload. Those payloads are resent one at a time.
+BATCH_FALLBACK_ERRORS = (400, 404, 413)
+
+@contextmanager
+def _file_lock(lock_path, blocking=True):
+    """Holds an exclusive lock on lock_path across processes; yields False if blocking is off and another process holds it."""
+    with open(lock_path, "a") as lock_file:
+        if fcntl:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+        try:
+            yield True
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+def _is_rejected(error):
+    """True if the service answered with a 4xx that retrying the same payload cannot fix."""
+    response = getattr(error, "response", None)
+    return response is not None and 400 <= response.status_code < 500 and response.status_code not in RETRYABLE_CLIENT_ERRORS
+
+def get_session_id():
+    session_id_file = ".session_id"
+    if os.path.exists(session_id_file):
+        with open(session_id_file, "r") as f:
+            return f.read().strip()
+    else:
+        session_id = f"{datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        with open(session_id_file, "w") as f:
+            f.write(session_id)
+        return session_id
 
 class LocalTrackerClient:
-    def __init__(self):
+    """
+    Sends load-test metrics to the local-tracker-service.
+
+    By default send_metrics() posts synchronously and retries with exponential backoff.
+    With background=True it returns immediately instead: payloads go onto a bounded in-memory
+    queue and a sender thread posts them in batches to the /batch endpoint over one pooled
+    session. Payloads that cannot be delivered (the queue is full, or the service is down
+    after all retries) are appended to a local spool file, one JSON payload per line, and
+    replayed the next time a client starts or a batch gets through. The spool may be shared by
+    several processes (e.g. --processes workers): appends and the hand-over of the spool to a
+    replay are guarded by a file lock, and only one process replays at a time. A batch the
+    service rejects with a 400, 404 or 413 is resent one payload at a time to the single-payload
+    endpoint. Payloads rejected on their own with a 4xx (a bad API key, a validation error), and
+    whole batches rejected with any other 4xx, are logged and dropped rather than retried or
+    spooled, since sending them again cannot succeed. Call close() (also run at interpreter
+    exit) to deliver or spool whatever is still queued.
+    """
+
+    def __init__(self, background=False, spool_path=None, queue_size=1000, batch_size=50, flush_interval=1.0):
         self.tracking_url = os.getenv("TRACKING_SERVICE_URL")
         self.api_key = os.getenv("LOCAL_TRACKER_API_KEY", os.getenv("API_KEY"))
         self.user_id = os.getenv("LOCAL_TRACKER_USER_ID") or os.getenv("INFLUENCER_USER")
         self.schema_version = "1.0"
+        self.session = requests.Session()
 
         if not self.tracking_url:
             print("Warning: TRACKING_SERVICE_URL environment variable not set. Tracking will be disabled.")
@@ -19,18 +86,30 @@ class LocalTrackerClient:
             print("Warning: LOCAL_TRACKER_USER_ID or INFLUENCER_USER environment variable not set. Defaulting user_id to 'anonymous'.")
             self.user_id = "anonymous"
 
-    def send_metrics(self, challenge_type: str, metric_name: str, metrics_data: dict, session_id: str, retries=3, backoff_factor=0.5):
-        if not self.tracking_url:
-            print("Tracking disabled due to missing TRACKING_SERVICE_URL.")
-            return False
+        self.background = background and bool(self.tracking_url)
+        self.spool_path = spool_path or os.getenv("LOCAL_TRACKER_SPOOL", ".tracker_spool.jsonl")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._spool_lock = threading.Lock()
+        self._replay_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sender = None
+        if self.background:
+            self._sender = threading.Thread(target=self._run_sender, name="local-tracker-sender", daemon=True)
+            self._sender.start()
+            atexit.register(self.close)
 
+    def _headers(self):
         headers = {
             "Content-Type": "application/json",
         }
         if self.api_key:
             headers["x-api-key"] = self.api_key
+        return headers
 
-        payload = {
+    def build_payload(self, challenge_type: str, metric_name: str, metrics_data: dict, session_id: str):
+        return {
             "schema_version": self.schema_version,
             "userId": self.user_id,
             "challengeType": challenge_type,
@@ -41,9 +120,24 @@ class LocalTrackerClient:
             "runDetails": {**metrics_data, "session_id": session_id} # Detailed metrics go here
         }
 
+    def send_metrics(self, challenge_type: str, metric_name: str, metrics_data: dict, session_id: str, retries=3, backoff_factor=0.5):
+        if not self.tracking_url:
+            print("Tracking disabled due to missing TRACKING_SERVICE_URL.")
+            return False
+
+        payload = self.build_payload(challenge_type, metric_name, metrics_data, session_id)
+
+        if self.background:
+            try:
+                self._queue.put_nowait(payload)
+            except queue.Full:
+                # Never block the caller: overflow goes straight to the spool file
+                self._spool([payload])
+            return True
+
         for i in range(retries):
             try:
-                response = requests.post(self.tracking_url, headers=headers, json=payload)
+                response = self.session.post(self.tracking_url, headers=self._headers(), json=payload)
                 response.raise_for_status() # Raise an exception for HTTP errors (4xx or 5xx)
                 print(f"Tracking data sent to {self.tracking_url} - Status: {response.status_code}")
                 try:
@@ -54,12 +148,147 @@ class LocalTrackerClient:
                 return True
             except requests.exceptions.RequestException as e:
                 print(f"Attempt {i+1}/{retries}: Failed to send tracking data to {self.tracking_url}: {e}")
+                if _is_rejected(e):
+                    print("The tracking service rejected the data. Not retrying.")
+                    return False
                 if i < retries - 1:
                     time.sleep(backoff_factor * (2 ** i)) # Exponential backoff
                 else:
                     print("Max retries reached. Tracking data not sent.")
         return False
 
+    def _post_batch(self, payloads, retries=3, backoff_factor=0.5):
+        """
+        Posts a batch of payloads in one round-trip, retrying with backoff.
+
+        Returns the payloads that could not be delivered and should be spooled; an empty list
+        once the batch is dealt with (delivered, or rejected with a 4xx and dropped).
+        """
+        batch_url = f"{self.tracking_url.rstrip('/')}/batch"
+        for i in range(retries):
+            try:
+                response = self.session.post(batch_url, headers=self._headers(), json=payloads)
+                response.raise_for_status() # Raise an exception for HTTP errors (4xx or 5xx)
+                print(f"Tracking data batch of {len(payloads)} sent to {self.tracking_url}.")
+                return []
+            except requests.exceptions.RequestException as e:
+                print(f"Attempt {i+1}/{retries}: Failed to send {len(payloads)} tracking payloads to {batch_url}: {e}")
+                if _is_rejected(e):
+                    if e.response.status_code in BATCH_FALLBACK_ERRORS:
+                        print(f"Sending the {len(payloads)} tracking payloads one at a time instead.")
+                        return self._post_each(payloads, retries, backoff_factor)
+                    print(f"The tracking service rejected the batch. Dropping {len(payloads)} tracking payloads.")
+                    return []
+                if i < retries - 1 and not self._stop.is_set():
+                    time.sleep(backoff_factor * (2 ** i)) # Exponential backoff
+        return payloads
+
+    def _post_each(self, payloads, retries=3, backoff_factor=0.5):
+        """
+        Posts payloads one at a time to the single-payload endpoint, dropping only those it rejects.
+
+        Returns the payloads that could not be delivered: the first one that failed after all
+        retries and every one after it, since the service is then most likely down.
+        """
+        sent = dropped = 0
+        for index, payload in enumerate(payloads):
+            for i in range(retries):
+                try:
+                    response = self.session.post(self.tracking_url, headers=self._headers(), json=payload)
+                    response.raise_for_status() # Raise an exception for HTTP errors (4xx or 5xx)
+                    sent += 1
+                    break
+                except requests.exceptions.RequestException as e:
+                    if _is_rejected(e):
+                        print(f"The tracking service rejected a tracking payload ({e}). Dropping it.")
+                        dropped += 1
+                        break
+                    if i < retries - 1 and not self._stop.is_set():
+                        time.sleep(backoff_factor * (2 ** i)) # Exponential backoff
+            else:
+                print(f"Sent {sent} and dropped {dropped} tracking payloads one at a time; {len(payloads) - index} could not be delivered.")
+                return payloads[index:]
+        print(f"Sent {sent} and dropped {dropped} tracking payloads one at a time.")
+        return []
+
+    def _spool(self, payloads):
+        """Appends undeliverable payloads to the spool file, one JSON document per line."""
+        with self._spool_lock, _file_lock(f"{self.spool_path}.lock"):
+            with open(self.spool_path, "a") as f:
+                f.write("".join(json.dumps(payload) + "\n" for payload in payloads))
+        print(f"Spooled {len(payloads)} tracking payloads to {self.spool_path}.")
+
+    def _replay_spool(self):
+        """Re-sends spooled payloads, unless another thread or process is already doing so. Whatever still cannot be delivered is spooled again."""
+        if not self._replay_lock.acquire(blocking=False):
+            return
+        try:
+            with _file_lock(f"{self.spool_path}.replay.lock", blocking=False) as acquired:
+                if acquired:
+                    self._replay_spool_locked()
+        except OSError as e:
+            print(f"Could not replay spooled tracking payloads from {self.spool_path}: {e}")
+        finally:
+            self._replay_lock.release()
+
+    def _replay_spool_locked(self):
+        replay_path = f"{self.spool_path}.replaying"
+        with self._spool_lock, _file_lock(f"{self.spool_path}.lock"):
+            # A leftover replay file means an earlier replay was interrupted; send it first
+            if not os.path.exists(replay_path):
+                if not os.path.exists(self.spool_path):
+                    return
+                os.replace(self.spool_path, replay_path)
+
+        payloads = []
+        with open(replay_path, "r") as f:
+            for line in f:
+                try:
+                    payloads.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A line cut short by a crash while spooling
+                    print(f"Skipping corrupt spooled tracking payload in {self.spool_path}.")
+        print(f"Replaying {len(payloads)} spooled tracking payloads from {self.spool_path}.")
+        for start in range(0, len(payloads), self.batch_size):
+            undelivered = self._post_batch(payloads[start:start + self.batch_size])
+            if undelivered:
+                self._spool(undelivered + payloads[start + self.batch_size:])
+                break
+        os.remove(replay_path)
+
+    def _run_sender(self):
+        self._replay_spool()
+        while not (self._stop.is_set() and self._queue.empty()):
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            undelivered = self._post_batch(batch)
+            if undelivered:
+                self._spool(undelivered)
+            elif os.path.exists(self.spool_path):
+                self._replay_spool()
+
+    def close(self, timeout=10):
+        """Stops the sender thread after it drains the queue; anything left after timeout is spooled."""
+        if not self._sender or self._stop.is_set():
+            return
+        self._stop.set()
+        self._sender.join(timeout)
+        leftover = []
+        while True:
+            try:
+                leftover.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if leftover:
+            self._spool(leftover)
+
 # Example Usage (for testing purposes, not part of the module itself)
 if __name__ == "__main__":
     # Set dummy environment variables for local testing
@@ -0,0 +1,159 @@
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from remote_write_client import LATENCY_BUCKETS_MS
+
+class _Shard:
+    """Counters owned by one thread. Only that thread writes them, so no lock is needed."""
+
+    __slots__ = ("started", "completed_by_status", "errors_by_status", "bucket_counts", "latency_sum_ms", "connections")
+
+    def __init__(self):
+        self.started = 0
+        self.completed_by_status = {}
+        self.errors_by_status = {}
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS_MS) + 1) # Last slot is +Inf
+        self.latency_sum_ms = 0.0
+        self.connections = {}
+
+class MetricsExporter:
+    """
+    Serves the load generator's own metrics on /metrics in the Prometheus text format.
+
+    The hot path never takes a lock: every thread that calls request_started() or record()
+    gets its own _Shard of counters (registered once, on first use), and a scrape sums the
+    shards. A scrape may therefore be a few requests behind, which Prometheus tolerates.
+    Published series:
+
+        loadgen_in_flight_requests              requests sent but not yet completed
+        loadgen_requests_started_total          offered load; rate() of it is the offered RPS
+        loadgen_requests_total{status}          completed requests; rate() is the achieved RPS
+        loadgen_request_errors_total{status}    failed requests (no response, 4xx or 5xx)
+        loadgen_request_duration_ms             latency histogram (_bucket, _sum, _count)
+        loadgen_connections_total{event}        connections opened, reused and failed to open
+        loadgen_target_rps                      configured arrival rate, when there is one
+    """
+
+    def __init__(self, port, host="0.0.0.0", target_rps=None):
+        self.target_rps = target_rps
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock() # Only taken when a new thread registers its shard
+
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = exporter.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass # Keep scrapes out of the load test output
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, name="metrics-exporter", daemon=True)
+        self._thread.start()
+        print(f"Serving load generator metrics on http://{host}:{self.server.server_address[1]}/metrics")
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def request_started(self):
+        self._shard().started += 1
+
+    def record(self, result):
+        shard = self._shard()
+        status = str(result["status_code"])
+        latency = result["latency"]
+        shard.completed_by_status[status] = shard.completed_by_status.get(status, 0) + 1
+        if not result["success"]:
+            shard.errors_by_status[status] = shard.errors_by_status.get(status, 0) + 1
+        shard.bucket_counts[bisect.bisect_left(LATENCY_BUCKETS_MS, latency)] += 1
+        shard.latency_sum_ms += latency
+        connection = result.get("connection")
+        if connection is not None:
+            shard.connections[connection] = shard.connections.get(connection, 0) + 1
+
+    def render(self):
+        """Sums every shard and formats the result as Prometheus text exposition."""
+        with self._shards_lock:
+            shards = list(self._shards)
+        started = 0
+        completed_by_status = {}
+        errors_by_status = {}
+        bucket_counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        latency_sum_ms = 0.0
+        connections = {}
+        for shard in shards:
+            started += shard.started
+            # dict.copy() and list() are atomic under the GIL, so a concurrent write cannot break them
+            for status, count in shard.completed_by_status.copy().items():
+                completed_by_status[status] = completed_by_status.get(status, 0) + count
+            for status, count in shard.errors_by_status.copy().items():
+                errors_by_status[status] = errors_by_status.get(status, 0) + count
+            for i, count in enumerate(list(shard.bucket_counts)):
+                bucket_counts[i] += count
+            latency_sum_ms += shard.latency_sum_ms
+            for event, count in shard.connections.copy().items():
+                connections[event] = connections.get(event, 0) + count
+        completed = sum(completed_by_status.values())
+
+        lines = [
+            "# HELP loadgen_in_flight_requests Requests sent but not yet completed.",
+            "# TYPE loadgen_in_flight_requests gauge",
+            f"loadgen_in_flight_requests {max(0, started - completed)}",
+            "# HELP loadgen_requests_started_total Requests the generator has started sending (offered load).",
+            "# TYPE loadgen_requests_started_total counter",
+            f"loadgen_requests_started_total {started}",
+            "# HELP loadgen_requests_total Completed requests by status code (achieved load).",
+            "# TYPE loadgen_requests_total counter",
+        ]
+        for status, count in sorted(completed_by_status.items()):
+            lines.append(f'loadgen_requests_total{{status="{status}"}} {count}')
+        lines += [
+            "# HELP loadgen_request_errors_total Failed requests by status code.",
+            "# TYPE loadgen_request_errors_total counter",
+        ]
+        for status, count in sorted(errors_by_status.items()):
+            lines.append(f'loadgen_request_errors_total{{status="{status}"}} {count}')
+        lines += [
+            "# HELP loadgen_request_duration_ms Client-observed request latency in ms.",
+            "# TYPE loadgen_request_duration_ms histogram",
+        ]
+        cumulative = 0
+        for upper_bound, count in zip(LATENCY_BUCKETS_MS + ["+Inf"], bucket_counts):
+            cumulative += count
+            lines.append(f'loadgen_request_duration_ms_bucket{{le="{upper_bound}"}} {cumulative}')
+        lines.append(f"loadgen_request_duration_ms_sum {latency_sum_ms}")
+        lines.append(f"loadgen_request_duration_ms_count {cumulative}")
+        lines += [
+            "# HELP loadgen_connections_total Connections to the target opened, reused and failed to open.",
+            "# TYPE loadgen_connections_total counter",
+        ]
+        for event, count in sorted(connections.items()):
+            lines.append(f'loadgen_connections_total{{event="{event}"}} {count}')
+        if self.target_rps is not None:
+            lines += [
+                "# HELP loadgen_target_rps Configured arrival rate of this generator process.",
+                "# TYPE loadgen_target_rps gauge",
+                f"loadgen_target_rps {self.target_rps}",
+            ]
+        return "\n".join(lines) + "\n"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
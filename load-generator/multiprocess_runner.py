@@ -0,0 +1,78 @@
+import multiprocessing
+import queue
+import threading
+import time
+import traceback
+
+from run_stats import RunStats
+
+START_TIMEOUT_S = 60
+
+def split_evenly(total, parts):
+    """Splits an integer budget into `parts` shares that differ by at most one."""
+    return [total // parts + (1 if i < total % parts else 0) for i in range(parts)]
+
+def _worker_main(run_fn, kwargs, start_barrier, result_queue):
+    """Entry point of a worker process: waits for every sibling, runs its shard and reports back."""
+    try:
+        start_barrier.wait(timeout=START_TIMEOUT_S)
+        stats, duration_s = run_fn(**kwargs)
+        result_queue.put((stats.to_dict(), duration_s, None))
+    except Exception:
+        result_queue.put((None, 0, traceback.format_exc()))
+
+def run_in_processes(run_fn, shard_kwargs):
+    """
+    Runs run_fn(**kwargs) once per entry of shard_kwargs, each in its own process.
+
+    run_fn must be a module-level function returning (RunStats, duration_s). All workers are
+    held on a barrier until every process has started, so they begin sending at the same moment.
+    Their stats are merged into one RunStats, and the returned duration is that of the slowest
+    worker as it measured it, so the time workers spend closing their observers after the run
+    is not counted. If a worker dies before every process reaches the barrier, the remaining
+    workers are stopped and the script exits with an error.
+    """
+    start_barrier = multiprocessing.Barrier(len(shard_kwargs) + 1)
+    result_queue = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=_worker_main, args=(run_fn, kwargs, start_barrier, result_queue))
+        for kwargs in shard_kwargs
+    ]
+    for process in processes:
+        process.start()
+
+    try:
+        start_barrier.wait(timeout=START_TIMEOUT_S)
+    except threading.BrokenBarrierError:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+        raise SystemExit(f"Not every worker process started within {START_TIMEOUT_S} s; the run was aborted.")
+    start_time = time.time()
+
+    stats = RunStats()
+    worker_durations = []
+    # Drain the queue before joining, otherwise a worker blocked on a full pipe never exits
+    reported = 0
+    while reported < len(processes):
+        try:
+            worker_stats, worker_duration_s, error = result_queue.get(timeout=1)
+        except queue.Empty:
+            if not any(process.is_alive() for process in processes) and result_queue.empty():
+                print(f"{len(processes) - reported} worker process(es) exited without reporting.")
+                break
+            continue
+        reported += 1
+        if error:
+            print(f"A worker process failed:\n{error}")
+            continue
+        stats.merge(RunStats.from_dict(worker_stats))
+        worker_durations.append(worker_duration_s)
+        print(f"Worker finished: {worker_stats['total_requests']} requests in {worker_duration_s:.2f} s")
+    # Fall back to the parent's clock only when no worker reported a duration
+    duration_s = max(worker_durations) if worker_durations else time.time() - start_time
+
+    for process in processes:
+        process.join()
+    return stats, duration_s
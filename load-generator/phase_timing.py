@@ -0,0 +1,198 @@
+import socket
+import threading
+import time
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError
+from urllib3.util.ssl_ import is_ipaddress
+
+# Phases of one request, in the order they happen. Each result's "phases" dict holds the ones
+# that actually took place: a request on a reused connection has no dns, connect or tls.
+#   queue   - waiting for a free connection under the engine's connection cap (asyncio only)
+#   dns     - resolving the host name
+#   connect - TCP handshake
+#   tls     - TLS handshake (counted under connect by the asyncio engine, which aiohttp does not split)
+#   ttfb    - from the request being sent to the response headers arriving: mostly server think time
+#   body    - reading the response body
+PHASES = ("queue", "dns", "connect", "tls", "ttfb", "body")
+
+# What happened to the connection of one request: a new one was opened, a pooled one was
+# reused, or opening one failed. None if the request never got as far as a connection.
+CONNECTION_EVENTS = ("opened", "reused", "failed")
+
+_local = threading.local()
+
+def _add_phase(phase, elapsed_s):
+    phases = getattr(_local, "phases", None)
+    if phases is not None:
+        phases[phase] = phases.get(phase, 0.0) + elapsed_s * 1000
+
+def _set_connection_event(event):
+    if getattr(_local, "phases", None) is not None:
+        _local.connection = event
+
+def start_phases():
+    """Starts collecting the connection phases of the calling thread's next request and returns the dict they go into."""
+    _local.phases = {}
+    _local.connection = None
+    return _local.phases
+
+def finish_phases(phases, start, headers_at, end):
+    """
+    Stops collecting for the calling thread and returns (phases, connection event) of its request.
+
+    See _complete_phases() for the phases. A request that got a response without opening a
+    connection was sent on a reused one.
+    """
+    _local.phases = None
+    event = _local.connection
+    if event is None and headers_at is not None:
+        event = "reused"
+    return _complete_phases(phases, start, headers_at, end), event
+
+def _complete_phases(phases, start, headers_at, end):
+    """
+    Adds ttfb and body (in ms) to a request's phases from perf_counter() readings.
+
+    ttfb is whatever part of start..headers_at was not spent on connection setup. Either
+    reading is None if the request failed before getting that far.
+    """
+    setup_ms = sum(phases.values())
+    if headers_at is not None:
+        phases["ttfb"] = max(0.0, (headers_at - start) * 1000 - setup_ms)
+        if end is not None:
+            phases["body"] = (end - headers_at) * 1000
+    return phases
+
+class _TimingConnectionMixin:
+    """Times DNS resolution and the TCP handshake of every new urllib3 connection separately."""
+
+    def _new_conn(self):
+        _set_connection_event("failed") # Until the socket is connected
+        sock = self._timed_new_conn()
+        _set_connection_event("opened")
+        return sock
+
+    def _timed_new_conn(self):
+        host = self._dns_host
+        if is_ipaddress(host):
+            start = time.perf_counter()
+            sock = super()._new_conn()
+            _add_phase("connect", time.perf_counter() - start)
+            return sock
+
+        start = time.perf_counter()
+        try:
+            addresses = list(dict.fromkeys(info[4][0] for info in socket.getaddrinfo(host, self.port, 0, socket.SOCK_STREAM)))
+        except socket.gaierror:
+            addresses = [] # Let urllib3 resolve again and raise its usual NameResolutionError
+        _add_phase("dns", time.perf_counter() - start)
+        if not addresses:
+            return super()._new_conn()
+
+        # Connect to the resolved addresses in order, as socket.create_connection would
+        start = time.perf_counter()
+        try:
+            for index, address in enumerate(addresses):
+                self._dns_host = address
+                try:
+                    return super()._new_conn()
+                except ConnectTimeoutError: # Also raised by urllib3 for refused connections
+                    if index == len(addresses) - 1:
+                        raise
+        finally:
+            self._dns_host = host
+            _add_phase("connect", time.perf_counter() - start)
+
+class TimingHTTPConnection(_TimingConnectionMixin, HTTPConnection):
+    pass
+
+class TimingHTTPSConnection(_TimingConnectionMixin, HTTPSConnection):
+    def connect(self):
+        phases = getattr(_local, "phases", None)
+        setup_before = (phases or {}).get("dns", 0.0) + (phases or {}).get("connect", 0.0)
+        start = time.perf_counter()
+        super().connect()
+        if phases is not None:
+            setup_ms = phases.get("dns", 0.0) + phases.get("connect", 0.0) - setup_before
+            phases["tls"] = phases.get("tls", 0.0) + max(0.0, (time.perf_counter() - start) * 1000 - setup_ms)
+
+class TimingHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimingHTTPConnection
+
+class TimingHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimingHTTPSConnection
+
+class TimingHTTPAdapter(HTTPAdapter):
+    """
+    requests adapter whose connections report their dns, connect and tls phases.
+
+    Phases are collected per thread between start_phases() and finish_phases(), so one adapter
+    can be shared by every worker thread.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": TimingHTTPConnectionPool, "https": TimingHTTPSConnectionPool}
+
+def create_timing_session(pool_maxsize=1, pool_block=False):
+    """
+    Creates a keep-alive requests session whose connections are timed by phase.
+
+    With pool_block, threads wait for one of the pool_maxsize connections to the host to be
+    free instead of opening (and afterwards discarding) extra ones.
+    """
+    session = requests.Session()
+    adapter = TimingHTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, pool_block=pool_block)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def create_trace_config():
+    """
+    Returns an aiohttp TraceConfig that fills the dict passed as trace_request_ctx with perf_counter() readings.
+
+    send_request_async() turns the readings into phases with trace_phases().
+    """
+    def mark(name):
+        async def on_signal(session, context, params):
+            if context.trace_request_ctx is not None:
+                context.trace_request_ctx[name] = time.perf_counter()
+        return on_signal
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_connection_queued_start.append(mark("queue_start"))
+    trace_config.on_connection_queued_end.append(mark("queue_end"))
+    trace_config.on_dns_resolvehost_start.append(mark("dns_start"))
+    trace_config.on_dns_resolvehost_end.append(mark("dns_end"))
+    trace_config.on_connection_create_start.append(mark("connect_start"))
+    trace_config.on_connection_create_end.append(mark("connect_end"))
+    trace_config.on_connection_reuseconn.append(mark("reused"))
+    trace_config.on_request_end.append(mark("headers_at"))
+    return trace_config
+
+def trace_phases(marks, start, end):
+    """Turns the readings collected by create_trace_config() for one request into (phases in ms, connection event)."""
+    if "connect_end" in marks:
+        event = "opened"
+    elif "connect_start" in marks:
+        event = "failed"
+    elif "reused" in marks:
+        event = "reused"
+    else:
+        event = None
+    phases = {}
+    if "queue_end" in marks:
+        phases["queue"] = (marks["queue_end"] - marks["queue_start"]) * 1000
+    dns_ms = 0.0
+    if "dns_end" in marks:
+        dns_ms = (marks["dns_end"] - marks["dns_start"]) * 1000
+        phases["dns"] = dns_ms
+    if "connect_end" in marks:
+        # aiohttp resolves the host inside connection creation, and does the TLS handshake there too
+        phases["connect"] = max(0.0, (marks["connect_end"] - marks["connect_start"]) * 1000 - dns_ms)
+    return _complete_phases(phases, start, marks.get("headers_at"), end if "headers_at" in marks else None), event
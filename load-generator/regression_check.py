@@ -0,0 +1,289 @@
+import argparse
+import os
+import sys
+
+import numpy as np
+import requests
+
+from latency_histogram import LatencyHistogram
+from result_log import HEADER, MAGIC, VERSION, RECORD
+
+# Field layout of result_log.RECORD, for decoding whole logs at once
+RESULT_LOG_DTYPE = np.dtype([
+    ("intended_time", "<f8"), ("start_time", "<f8"), ("latency", "<f4"), ("status_code", "<u2"), ("bytes", "<u4")
+])
+
+class Run:
+    """One load test run reduced to what is compared: its latency distribution as (values, counts) and its throughput."""
+
+    def __init__(self, label, values_ms, counts, rps):
+        self.label = label
+        self.values_ms = values_ms
+        self.counts = counts
+        self.rps = rps
+
+def run_from_histogram(label, histogram_data, rps):
+    """Builds a Run from a LatencyHistogram.to_dict(), as stored in tracked runDetails."""
+    buckets = list(LatencyHistogram.from_dict(histogram_data).buckets())
+    return Run(
+        label,
+        np.array([value for value, _ in buckets], dtype=float),
+        np.array([count for _, count in buckets], dtype=np.int64),
+        rps
+    )
+
+def run_from_result_logs(paths, corrected=False):
+    """
+    Builds a Run from the result log files of one run (one per process), using every raw latency.
+
+    Logs are decoded in one go with NumPy rather than record by record.
+    """
+    latencies = []
+    successes = 0
+    first_intended = None
+    last_end = None
+    for path in paths:
+        with open(path, "rb") as f:
+            data = f.read()
+        if len(data) <= HEADER.size:
+            continue
+        magic, version, record_size = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            raise ValueError(f"{path} is not a version {VERSION} result log.")
+        count = (len(data) - HEADER.size) // RECORD.size # Ignore a partly written trailing record
+        records = np.frombuffer(data, dtype=RESULT_LOG_DTYPE, count=count, offset=HEADER.size)
+        end_times = records["start_time"] + records["latency"] / 1000
+        latencies.append((end_times - records["intended_time"]) * 1000 if corrected else records["latency"].astype(float))
+        successes += int(np.count_nonzero((records["status_code"] > 0) & (records["status_code"] < 400)))
+        if count:
+            first_intended = min(first_intended, records["intended_time"].min()) if first_intended is not None else records["intended_time"].min()
+            last_end = max(last_end, end_times.max()) if last_end is not None else end_times.max()
+    if not latencies or first_intended is None:
+        raise ValueError(f"No results in {', '.join(paths)}.")
+    values_ms, counts = np.unique(np.concatenate(latencies), return_counts=True)
+    duration_s = last_end - first_intended
+    return Run(", ".join(paths), values_ms, counts, successes / duration_s if duration_s > 0 else 0)
+
+def fetch_tracked_runs(tracking_url, user_id, metric_name, target=None):
+    """
+    Returns the tracked runs of a user from the local-tracker-service, oldest first.
+
+    GET /api/track/:userId groups rows by target app and session; they are flattened here.
+    """
+    response = requests.get(f"{tracking_url.rstrip('/')}/{user_id}", timeout=30)
+    response.raise_for_status()
+    rows = [
+        row
+        for target_app, sessions in response.json().items()
+        if target is None or target_app == target
+        for session_rows in sessions.values()
+        for row in session_rows
+        if row.get("metric_name") == metric_name and row.get("run_details", {}).get("latency_histogram")
+    ]
+    rows.sort(key=lambda row: row.get("timestamp") or "")
+    return rows
+
+def select_rows(rows, commit=None, session=None):
+    return [
+        row for row in rows
+        if (commit is None or (row.get("commit_hash") or "").startswith(commit))
+        and (session is None or row.get("session_id") == session)
+    ]
+
+def run_from_row(row, corrected=False):
+    details = row["run_details"]
+    histogram = details.get("corrected_latency_histogram") if corrected else details["latency_histogram"]
+    label = f"{row.get('timestamp')} commit {(row.get('commit_hash') or '-')[:12]} session {row.get('session_id')}"
+    return run_from_histogram(label, histogram, float(details.get("rps") or 0))
+
+def aligned_counts(runs):
+    """Returns the sorted latency values seen in any of the runs and a (runs, values) matrix of each run's counts over them."""
+    values, inverse = np.unique(np.concatenate([run.values_ms for run in runs]), return_inverse=True)
+    run_counts = np.zeros((len(runs), len(values)), dtype=np.int64)
+    offset = 0
+    for index, run in enumerate(runs):
+        run_counts[index, inverse[offset:offset + len(run.counts)]] = run.counts
+        offset += len(run.counts)
+    return values, run_counts
+
+def percentile_of_counts(values, counts, percentile):
+    """
+    Returns the percentile of one or more distributions over the same sorted values, using the rank LatencyHistogram uses.
+
+    counts is 1-D for one distribution or (iterations, len(values)) for many, one per row.
+    """
+    counts = np.atleast_2d(counts)
+    cumulative = np.cumsum(counts, axis=1)
+    ranks = np.maximum(1, np.ceil(percentile * cumulative[:, -1] / 100))
+    return values[np.argmax(cumulative >= ranks[:, None], axis=1)]
+
+def bootstrap_percentile(values, run_counts, percentile, iterations, rng):
+    """
+    Bootstraps a latency percentile of the pooled runs: returns (point estimate, array of resampled estimates).
+
+    The bootstrap is hierarchical, so the interval covers run-to-run variance as well as
+    request-to-request variance: every iteration first resamples the runs with replacement,
+    then the requests within each chosen run. Resampling a run's n requests with replacement
+    is the same as drawing its per-value counts from a multinomial with its observed
+    frequencies, and a run chosen k times contributes one multinomial draw of k * n, so each
+    run is one vectorized draw across all iterations rather than a loop over requests. With
+    a single run the interval only reflects request-to-request variance.
+    """
+    runs = len(run_counts)
+    totals = run_counts.sum(axis=1)
+    picks = rng.multinomial(runs, np.full(runs, 1 / runs), size=iterations) # Times each run is chosen, per iteration
+    resampled = np.zeros((iterations, len(values)), dtype=np.int64)
+    for run in range(runs):
+        resampled += rng.multinomial(picks[:, run] * totals[run], run_counts[run] / totals[run])
+    return percentile_of_counts(values, run_counts.sum(axis=0), percentile)[0], percentile_of_counts(values, resampled, percentile)
+
+def bootstrap_mean(samples, iterations, rng):
+    """Bootstraps the mean of a few per-run values; returns (mean, resampled means), or (mean, None) with fewer than two runs."""
+    samples = np.asarray(samples, dtype=float)
+    if len(samples) < 2:
+        return samples.mean(), None
+    return samples.mean(), rng.choice(samples, size=(iterations, len(samples)), replace=True).mean(axis=1)
+
+def compare(baseline_runs, candidate_runs, iterations=2000, confidence=95.0, min_effect=5.0, seed=None):
+    """
+    Compares p50, p99 and throughput of two groups of runs and returns one result dict per metric.
+
+    Each result has the baseline and candidate estimates, the relative change in percent with
+    its bootstrap confidence interval, and a verdict: "regression" or "improvement" when the
+    whole interval lies on one side of zero and the change is larger than min_effect percent,
+    otherwise "noise". Throughput is compared across runs and needs at least two on each side;
+    latency intervals only cover run-to-run variance with at least two runs on each side.
+    Runs without any requests are left out.
+    """
+    rng = np.random.default_rng(seed)
+    tail = (100 - confidence) / 2
+    baseline_runs = [run for run in baseline_runs if run.counts.sum() > 0]
+    candidate_runs = [run for run in candidate_runs if run.counts.sum() > 0]
+    baseline_values, baseline_counts = aligned_counts(baseline_runs)
+    candidate_values, candidate_counts = aligned_counts(candidate_runs)
+
+    estimates = []
+    for percentile, name in ((50, "p50_latency_ms"), (99, "p99_latency_ms")):
+        baseline, baseline_boot = bootstrap_percentile(baseline_values, baseline_counts, percentile, iterations, rng)
+        candidate, candidate_boot = bootstrap_percentile(candidate_values, candidate_counts, percentile, iterations, rng)
+        estimates.append((name, True, baseline, candidate, baseline_boot, candidate_boot))
+    baseline, baseline_boot = bootstrap_mean([run.rps for run in baseline_runs], iterations, rng)
+    candidate, candidate_boot = bootstrap_mean([run.rps for run in candidate_runs], iterations, rng)
+    estimates.append(("rps", False, baseline, candidate, baseline_boot, candidate_boot))
+
+    results = []
+    for name, higher_is_worse, baseline, candidate, baseline_boot, candidate_boot in estimates:
+        change = (candidate / baseline - 1) * 100 if baseline > 0 else 0.0
+        result = {"metric": name, "baseline": float(baseline), "candidate": float(candidate), "change_percent": float(change),
+                  "ci_low_percent": None, "ci_high_percent": None, "verdict": "noise"}
+        if baseline_boot is not None and candidate_boot is not None:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                changes = (candidate_boot / baseline_boot - 1) * 100
+            changes = changes[np.isfinite(changes)]
+            if len(changes):
+                low, high = np.percentile(changes, [tail, 100 - tail])
+                result["ci_low_percent"], result["ci_high_percent"] = float(low), float(high)
+                worse = low > 0 and change > min_effect if higher_is_worse else high < 0 and change < -min_effect
+                better = high < 0 and change < -min_effect if higher_is_worse else low > 0 and change > min_effect
+                result["verdict"] = "regression" if worse else "improvement" if better else "noise"
+        results.append(result)
+    return results
+
+def overall_verdict(results):
+    verdicts = {result["verdict"] for result in results}
+    return "regression" if "regression" in verdicts else "improvement" if "improvement" in verdicts else "noise"
+
+def print_comparison(results, confidence):
+    ci_header = f"{confidence:g}% CI of change"
+    print(f"\n{'Metric':<16}{'Baseline':>12}{'Candidate':>12}{'Change':>10}  {ci_header:<26}Verdict")
+    for result in results:
+        ci = "n/a (needs 2+ runs each)"
+        if result["ci_low_percent"] is not None:
+            ci = f"[{result['ci_low_percent']:+.1f}%, {result['ci_high_percent']:+.1f}%]"
+        print(f"{result['metric']:<16}{result['baseline']:>12.2f}{result['candidate']:>12.2f}{result['change_percent']:>+9.1f}%  {ci:<26}{result['verdict'].upper()}")
+
+def main():
+    """Compares two sets of load test runs and exits with status 1 if the candidate is a regression."""
+    parser = argparse.ArgumentParser(description="Detect performance regressions between two commits, sessions or result logs.")
+    parser.add_argument("--commit", help="Candidate: tracked runs of this commit hash (a prefix is enough). Defaults to the commit of the most recent tracked run.")
+    parser.add_argument("--session", help="Candidate: tracked runs of this session ID.")
+    parser.add_argument("--baseline-commit", help="Baseline: tracked runs of this commit hash.")
+    parser.add_argument("--baseline-session", help="Baseline: tracked runs of this session ID.")
+    parser.add_argument("--baseline-last", type=int, help="Baseline: the N most recent tracked runs before the candidate's first run that are not part of the candidate.")
+    parser.add_argument("--candidate-logs", action="append", nargs="+", help="Candidate from result logs instead: the per-process files of one run. Repeat for several runs.")
+    parser.add_argument("--baseline-logs", action="append", nargs="+", help="Baseline from result logs instead. Repeat for several runs.")
+    parser.add_argument("--metric-name", default="load_test_run_metrics", help="Only compare tracked runs with this metric name.")
+    parser.add_argument("--target", help="Only compare tracked runs against this target URL.")
+    parser.add_argument("--user-id", default=os.getenv("LOCAL_TRACKER_USER_ID") or os.getenv("INFLUENCER_USER") or "anonymous", help="Whose tracked runs to read.")
+    parser.add_argument("--corrected", action="store_true", help="Compare latency corrected for coordinated omission instead of raw latency.")
+    parser.add_argument("--iterations", type=int, default=2000, help="Bootstrap resamples.")
+    parser.add_argument("--confidence", type=float, default=95, help="Confidence level of the intervals, in percent.")
+    parser.add_argument("--min-effect", type=float, default=5, help="Changes smaller than this many percent never count as a regression or improvement.")
+    parser.add_argument("--seed", type=int, help="Random seed, for reproducible intervals.")
+    args = parser.parse_args()
+
+    if args.iterations < 100 or not 50 < args.confidence < 100:
+        parser.error("--iterations must be at least 100 and --confidence between 50 and 100.")
+    if args.candidate_logs and (args.commit or args.session):
+        parser.error("Give the candidate as --commit/--session or as --candidate-logs, not both.")
+    if sum(bool(option) for option in (args.baseline_commit, args.baseline_session, args.baseline_last, args.baseline_logs)) != 1:
+        parser.error("Give exactly one of --baseline-commit, --baseline-session, --baseline-last or --baseline-logs.")
+
+    rows = None
+    if not args.candidate_logs or not args.baseline_logs:
+        tracking_url = os.getenv("TRACKING_SERVICE_URL")
+        if not tracking_url:
+            print("Error: TRACKING_SERVICE_URL environment variable is not set.")
+            sys.exit(2)
+        try:
+            rows = fetch_tracked_runs(tracking_url, args.user_id, args.metric_name, args.target)
+        except requests.exceptions.RequestException as e:
+            print(f"Error fetching tracked runs from {tracking_url}: {e}")
+            sys.exit(2)
+
+    if args.candidate_logs:
+        candidate_runs = [run_from_result_logs(paths, args.corrected) for paths in args.candidate_logs]
+        candidate_rows = []
+    else:
+        if not (args.commit or args.session) and rows:
+            args.commit = rows[-1].get("commit_hash")
+            if not args.commit:
+                print(f"Error: the most recent tracked run (session {rows[-1].get('session_id')}) has no commit hash. Give --commit or --session.")
+                sys.exit(2)
+            print(f"Candidate: commit {args.commit} of the most recent tracked run.")
+        candidate_rows = select_rows(rows, args.commit, args.session)
+        candidate_runs = [run_from_row(row, args.corrected) for row in candidate_rows]
+
+    if args.baseline_logs:
+        baseline_runs = [run_from_result_logs(paths, args.corrected) for paths in args.baseline_logs]
+    elif args.baseline_last:
+        candidate_ids = {row["id"] for row in candidate_rows}
+        first_candidate = min((row.get("timestamp") or "" for row in candidate_rows), default=None)
+        earlier = [row for row in rows if row["id"] not in candidate_ids and (first_candidate is None or (row.get("timestamp") or "") < first_candidate)]
+        baseline_runs = [run_from_row(row, args.corrected) for row in earlier[-args.baseline_last:]]
+    else:
+        baseline_runs = [run_from_row(row, args.corrected) for row in select_rows(rows, args.baseline_commit, args.baseline_session)]
+
+    if not candidate_runs or not baseline_runs:
+        print(f"Error: found {len(baseline_runs)} baseline and {len(candidate_runs)} candidate runs; both need at least one.")
+        sys.exit(2)
+
+    print(f"Baseline: {len(baseline_runs)} runs, {int(sum(run.counts.sum() for run in baseline_runs))} requests")
+    for run in baseline_runs:
+        print(f"  {run.label}")
+    print(f"Candidate: {len(candidate_runs)} runs, {int(sum(run.counts.sum() for run in candidate_runs))} requests")
+    for run in candidate_runs:
+        print(f"  {run.label}")
+
+    if len(baseline_runs) < 2 or len(candidate_runs) < 2:
+        print("Warning: with a single run on a side, the latency intervals cannot include run-to-run variance and may be too narrow. "
+              "Compare at least two runs on each side before trusting a verdict.")
+    results = compare(baseline_runs, candidate_runs, args.iterations, args.confidence, args.min_effect, args.seed)
+    print_comparison(results, args.confidence)
+    verdict = overall_verdict(results)
+    print(f"\nVerdict: {verdict.upper()}")
+    if verdict == "regression":
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
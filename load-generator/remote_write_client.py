@@ -0,0 +1,178 @@
+import bisect
+import os
+import socket
+import struct
+import threading
+import time
+
+import requests
+
+try:
+    import snappy
+except ImportError: # python-snappy is only needed when remote_write is enabled
+    snappy = None
+
+# Upper bounds (ms) of the client-side latency histogram. The url-anvil buckets are included so
+# client and server histograms can be compared bucket for bucket in Grafana.
+LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 200, 300, 400, 500, 750, 1000, 2000, 5000, 10000]
+
+# --- Minimal protobuf encoding of prometheus.WriteRequest (backend/src/proto/remote.proto) ---
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+def _length_delimited(field_number, payload):
+    return _varint((field_number << 3) | 2) + _varint(len(payload)) + payload
+
+def _encode_label(name, value):
+    return _length_delimited(1, name.encode()) + _length_delimited(2, value.encode())
+
+def _encode_sample(value, timestamp_ms):
+    # value: field 1, 64-bit double; timestamp: field 2, varint int64
+    return b"\x09" + struct.pack("<d", value) + b"\x10" + _varint(timestamp_ms)
+
+def encode_write_request(series):
+    """
+    Encodes [(labels_dict, [(value, timestamp_ms), ...]), ...] as a serialized WriteRequest.
+
+    Labels are written sorted by name, as remote_write receivers require.
+    """
+    body = bytearray()
+    for labels, samples in series:
+        encoded = bytearray()
+        for name in sorted(labels):
+            encoded += _length_delimited(1, _encode_label(name, labels[name]))
+        for value, timestamp_ms in samples:
+            encoded += _length_delimited(2, _encode_sample(value, timestamp_ms))
+        body += _length_delimited(1, bytes(encoded))
+    return bytes(body)
+
+class RemoteWriteClient:
+    """
+    Pushes client-observed request metrics to a Prometheus remote_write endpoint.
+
+    record() updates counters and a cumulative latency histogram. A background thread samples
+    every series each sample_interval_s and pushes the collected samples as one
+    snappy-compressed WriteRequest every push_interval_s, so the load generator's view of
+    latency lands next to the server-side metrics without waiting for a scrape. Series:
+
+        loadgen_requests_total{status}          requests completed, by status code
+        loadgen_request_errors_total{status}    failed requests (no response, 4xx or 5xx)
+        loadgen_request_duration_ms_bucket{le}  cumulative latency histogram, plus _sum and _count
+
+    All series carry job="load-generator" and an instance label. Samples that could not be
+    pushed are kept and retried with the next push, up to max_pending_samples.
+    """
+
+    def __init__(self, url, instance=None, extra_labels=None, sample_interval_s=1.0, push_interval_s=10.0, max_pending_samples=100000):
+        if snappy is None:
+            raise RuntimeError("remote_write needs the python-snappy package (pip install python-snappy).")
+        self.url = url
+        self.base_labels = {
+            "job": "load-generator",
+            "instance": instance or f"{socket.gethostname()}-{os.getpid()}",
+            **(extra_labels or {}),
+        }
+        self.sample_interval_s = sample_interval_s
+        self.push_interval_s = push_interval_s
+        self.max_pending_samples = max_pending_samples
+        self.session = requests.Session()
+        self._lock = threading.Lock()
+        self._requests_by_status = {}
+        self._errors_by_status = {}
+        self._bucket_counts = [0] * (len(LATENCY_BUCKETS_MS) + 1) # Last slot is +Inf
+        self._latency_sum_ms = 0.0
+        self._pending = {} # label tuple -> list of (value, timestamp_ms)
+        self._pending_count = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="remote-write", daemon=True)
+        self._thread.start()
+
+    def record(self, result):
+        status = str(result["status_code"])
+        latency = result["latency"]
+        with self._lock:
+            self._requests_by_status[status] = self._requests_by_status.get(status, 0) + 1
+            if not result["success"]:
+                self._errors_by_status[status] = self._errors_by_status.get(status, 0) + 1
+            self._bucket_counts[bisect.bisect_left(LATENCY_BUCKETS_MS, latency)] += 1
+            self._latency_sum_ms += latency
+
+    def _snapshot(self):
+        """Returns the current value of every series as (labels, value) pairs."""
+        with self._lock:
+            requests_by_status = dict(self._requests_by_status)
+            errors_by_status = dict(self._errors_by_status)
+            bucket_counts = list(self._bucket_counts)
+            latency_sum_ms = self._latency_sum_ms
+
+        series = []
+        for status, count in requests_by_status.items():
+            series.append(({"__name__": "loadgen_requests_total", "status": status}, count))
+        for status, count in errors_by_status.items():
+            series.append(({"__name__": "loadgen_request_errors_total", "status": status}, count))
+        cumulative = 0
+        for upper_bound, count in zip(LATENCY_BUCKETS_MS + ["+Inf"], bucket_counts):
+            cumulative += count
+            series.append(({"__name__": "loadgen_request_duration_ms_bucket", "le": str(upper_bound)}, cumulative))
+        series.append(({"__name__": "loadgen_request_duration_ms_sum"}, latency_sum_ms))
+        series.append(({"__name__": "loadgen_request_duration_ms_count"}, cumulative))
+        return series
+
+    def sample(self):
+        """Adds one sample of every series to the pending batch."""
+        timestamp_ms = int(time.time() * 1000)
+        for labels, value in self._snapshot():
+            key = tuple(sorted({**self.base_labels, **labels}.items()))
+            self._pending.setdefault(key, []).append((float(value), timestamp_ms))
+            self._pending_count += 1
+        while self._pending_count > self.max_pending_samples:
+            # Drop the oldest sample of every series until the backlog fits again
+            for samples in self._pending.values():
+                if samples:
+                    samples.pop(0)
+                    self._pending_count -= 1
+
+    def push(self):
+        """Sends every pending sample in one WriteRequest. Returns True on success."""
+        if not self._pending_count:
+            return True
+        series = [(dict(key), samples) for key, samples in self._pending.items() if samples]
+        body = snappy.compress(encode_write_request(series))
+        headers = {
+            "Content-Encoding": "snappy",
+            "Content-Type": "application/x-protobuf",
+            "X-Prometheus-Remote-Write-Version": "0.1.0",
+        }
+        try:
+            response = self.session.post(self.url, data=body, headers=headers, timeout=10)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            print(f"Failed to push {self._pending_count} samples to {self.url}: {e}")
+            return False
+        self._pending = {}
+        self._pending_count = 0
+        return True
+
+    def _run(self):
+        next_push = time.time() + self.push_interval_s
+        while not self._stop.wait(self.sample_interval_s):
+            self.sample()
+            if time.time() >= next_push:
+                self.push()
+                next_push += self.push_interval_s
+
+    def close(self):
+        """Stops the background thread, then takes and pushes a final sample."""
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+        self.push()
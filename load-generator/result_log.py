@@ -0,0 +1,109 @@
+import argparse
+import mmap
+import os
+import struct
+
+from run_stats import RunStats
+
+MAGIC = b"LGRL"
+VERSION = 1
+HEADER = struct.Struct("<4sHH") # magic, version, record size
+# intended send time (epoch s), actual send time (epoch s), latency (ms), status code (0 = no response), response bytes
+RECORD = struct.Struct("<ddfHI")
+
+class ResultLogWriter:
+    """
+    Streams one fixed-width binary record per request to a file through a large write buffer.
+
+    Each record is RECORD.size (26) bytes, so a million-request run is about 26 MB on disk and
+    nothing is kept in memory. Writes go through a BufferedWriter, which is safe to share
+    between threads. Like every result observer, it has record(result) and close().
+    """
+
+    def __init__(self, path, buffer_size=1024 * 1024):
+        self.path = path
+        self.file = open(path, "wb", buffering=buffer_size)
+        self.file.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+
+    def record(self, result):
+        """Appends a result dict as returned by send_request()."""
+        start_time = result["start_time"]
+        self.file.write(RECORD.pack(
+            result.get("intended_time") or start_time,
+            start_time,
+            result["latency"],
+            result["status_code"] or 0,
+            result.get("bytes", 0)
+        ))
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def shard_result_log_path(path, index, shard_count):
+    """Returns the result log path for one worker process, or None when no log was requested."""
+    if not path:
+        return None
+    return path if shard_count == 1 else f"{path}.{index}"
+
+def read_result_log(path):
+    """
+    Yields (intended_time, start_time, latency_ms, status_code, bytes) tuples from a result log.
+
+    The file is memory-mapped and decoded in place, so reading does not load it into memory.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size <= HEADER.size:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            magic, version, record_size = HEADER.unpack_from(mapped, 0)
+            if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+                raise ValueError(f"{path} is not a version {VERSION} result log.")
+            # Ignore a partly written trailing record from an interrupted run
+            end = HEADER.size + (len(mapped) - HEADER.size) // RECORD.size * RECORD.size
+            view = memoryview(mapped)[HEADER.size:end]
+            records = RECORD.iter_unpack(view)
+            try:
+                yield from records
+            finally:
+                # Drop every export of the mapping before it is closed
+                del records
+                view.release()
+
+def aggregate_result_logs(paths):
+    """Aggregates one or more result logs into a RunStats and the wall-clock span they cover."""
+    stats = RunStats()
+    first_intended = None
+    last_end = None
+    for path in paths:
+        for intended_time, start_time, latency, status_code, _ in read_result_log(path):
+            end_time = start_time + latency / 1000
+            stats.record({
+                "latency": latency,
+                "corrected_latency": (end_time - intended_time) * 1000,
+                "status_code": status_code or None,
+                "success": 0 < status_code < 400,
+            })
+            if first_intended is None or intended_time < first_intended:
+                first_intended = intended_time
+            if last_end is None or end_time > last_end:
+                last_end = end_time
+    duration_s = last_end - first_intended if stats.total_requests > 0 else 0
+    return stats, duration_s
+
+def main():
+    """Prints the summary of one or more result logs written with --result-log."""
+    parser = argparse.ArgumentParser(description="Aggregate binary result logs written by the load generator.")
+    parser.add_argument("paths", nargs='+', help="Result log files. Pass every per-process file of a --processes run.")
+    args = parser.parse_args()
+
+    stats, duration_s = aggregate_result_logs(args.paths)
+    stats.print_summary(duration_s)
+
+if __name__ == "__main__":
+    main()
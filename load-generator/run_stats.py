@@ -0,0 +1,250 @@
+from latency_histogram import LatencyHistogram
+from phase_timing import PHASES, CONNECTION_EVENTS
+
+class RunStats:
+    """
+    Aggregates per-request results into counters and a latency histogram.
+
+    Replaces keeping one dict per request: memory stays constant for any run length, and
+    stats from several workers can be combined with merge().
+
+    Two latency histograms are kept. `latency` is measured from when the request was actually
+    sent. `corrected_latency` is measured from when the request was supposed to be sent
+    according to the generator's schedule, so it includes the queueing delay a real user would
+    have seen while the generator was held up by a stalled target (coordinated omission).
+
+    Results tagged with a "stage" (see load_profile.py) are also counted in a RunStats of
+    their own under stages[stage name], so one run yields per-stage throughput and latency.
+    Likewise, results tagged with an "endpoint" (see workload.py) are counted under
+    endpoints[endpoint name], for per-endpoint throughput, latency and errors in a mixed workload.
+
+    The "phases" of each result (see phase_timing.py) go into one histogram per phase, so a
+    slowdown can be traced to name resolution, connection setup, the server or the transfer,
+    and its "connection" event is counted as connections opened, reused or failed.
+    """
+
+    def __init__(self):
+        self.total_requests = 0
+        self.successful_requests = 0
+        self.status_codes = {}
+        self.latency = LatencyHistogram()
+        self.corrected_latency = LatencyHistogram()
+        self.phases = {}
+        self.connections = {}
+        self.stages = {}
+        self.endpoints = {}
+
+    def record(self, result):
+        """Records a result dict as returned by send_request()."""
+        self._record_totals(result)
+        stage = result.get("stage")
+        if stage is not None:
+            if stage not in self.stages:
+                self.stages[stage] = RunStats()
+            self.stages[stage]._record_totals(result)
+        endpoint = result.get("endpoint")
+        if endpoint is not None:
+            if endpoint not in self.endpoints:
+                self.endpoints[endpoint] = RunStats()
+            self.endpoints[endpoint]._record_totals(result)
+
+    def _record_totals(self, result):
+        self.total_requests += 1
+        if result["success"]:
+            self.successful_requests += 1
+        status = str(result["status_code"])
+        self.status_codes[status] = self.status_codes.get(status, 0) + 1
+        self.latency.record(result["latency"])
+        self.corrected_latency.record(result.get("corrected_latency", result["latency"]))
+        for phase, latency in result.get("phases", {}).items():
+            if phase not in self.phases:
+                self.phases[phase] = LatencyHistogram()
+            self.phases[phase].record(latency)
+        connection = result.get("connection")
+        if connection is not None:
+            self.connections[connection] = self.connections.get(connection, 0) + 1
+
+    def merge(self, other):
+        self.total_requests += other.total_requests
+        self.successful_requests += other.successful_requests
+        for status, count in other.status_codes.items():
+            self.status_codes[status] = self.status_codes.get(status, 0) + count
+        self.latency.merge(other.latency)
+        self.corrected_latency.merge(other.corrected_latency)
+        for phase, histogram in other.phases.items():
+            self.phases.setdefault(phase, LatencyHistogram()).merge(histogram)
+        for connection, count in other.connections.items():
+            self.connections[connection] = self.connections.get(connection, 0) + count
+        for stage, stage_stats in other.stages.items():
+            self.stages.setdefault(stage, RunStats()).merge(stage_stats)
+        for endpoint, endpoint_stats in other.endpoints.items():
+            self.endpoints.setdefault(endpoint, RunStats()).merge(endpoint_stats)
+        return self
+
+    @property
+    def failed_requests(self):
+        return self.total_requests - self.successful_requests
+
+    def summary(self, duration_s):
+        """Returns the aggregate fields used in the console summary and in metrics_data."""
+        total_requests = self.total_requests
+        return {
+            "total_requests": total_requests,
+            "successful_requests": self.successful_requests,
+            "failed_requests": self.failed_requests,
+            "avg_latency_ms": self.latency.mean(),
+            **self.latency.summary(),
+            "corrected_avg_latency_ms": self.corrected_latency.mean(),
+            **self.corrected_latency.summary(prefix="corrected_"),
+            "error_rate": (self.failed_requests / total_requests) * 100 if total_requests > 0 else 0,
+            "rps": self.successful_requests / duration_s if duration_s > 0 else 0,
+            "duration_s": duration_s,
+            "status_codes": dict(self.status_codes),
+            "latency_histogram": self.latency.to_dict(),
+            "corrected_latency_histogram": self.corrected_latency.to_dict(),
+            "phases": self.phase_summaries(),
+            "connections": self.connection_counts(),
+        }
+
+    def error_counts(self):
+        """Returns {status code: count} of the failed requests ("None" for requests that got no response)."""
+        return {status: count for status, count in self.status_codes.items() if status == "None" or int(status) >= 400}
+
+    def connection_counts(self):
+        """Returns how many connections were opened, reused and failed to open, and the share of requests on a reused one."""
+        counts = {event: self.connections.get(event, 0) for event in CONNECTION_EVENTS}
+        counts["reuse_rate"] = (counts["reused"] / self.total_requests) * 100 if self.total_requests > 0 else 0
+        return counts
+
+    def phase_summaries(self, include_histograms=True):
+        """
+        Returns {phase: count, average and percentiles} in request order, for the phases that occurred.
+
+        count is how many requests went through the phase; for dns, connect and tls that is the
+        number of new connections, so count / total_requests shows how well connections were reused.
+        """
+        summaries = {}
+        for phase in sorted(self.phases, key=lambda phase: PHASES.index(phase) if phase in PHASES else len(PHASES)):
+            histogram = self.phases[phase]
+            summaries[phase] = {"count": histogram.total_count, "avg_latency_ms": histogram.mean(), **histogram.summary()}
+            if include_histograms:
+                summaries[phase]["histogram"] = histogram.to_dict()
+        return summaries
+
+    def print_phase_summaries(self):
+        summaries = self.phase_summaries(include_histograms=False)
+        if not summaries:
+            return summaries
+        print("Per-phase timing:")
+        print(f"  {'Phase':<9}{'Count':>9}{'Avg ms':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'Max ms':>10}")
+        for phase, summary in summaries.items():
+            print(f"  {phase:<9}{summary['count']:>9}{summary['avg_latency_ms']:>10.2f}{summary['p50_latency_ms']:>10.2f}"
+                  f"{summary['p90_latency_ms']:>10.2f}{summary['p99_latency_ms']:>10.2f}{summary['max_latency_ms']:>10.2f}")
+        return summaries
+
+    def print_summary(self, duration_s):
+        summary = self.summary(duration_s)
+        print(f"Total Requests: {summary['total_requests']}")
+        print(f"Successful Requests: {summary['successful_requests']}")
+        print(f"Failed Requests: {summary['failed_requests']}")
+        print(f"Average Latency: {summary['avg_latency_ms']:.2f} ms")
+        print(f"p50 Latency: {summary['p50_latency_ms']:.2f} ms")
+        print(f"p90 Latency: {summary['p90_latency_ms']:.2f} ms")
+        print(f"p99 Latency: {summary['p99_latency_ms']:.2f} ms")
+        print(f"p99.9 Latency: {summary['p999_latency_ms']:.2f} ms")
+        print(f"Max Latency: {summary['max_latency_ms']:.2f} ms")
+        print("Corrected for coordinated omission (measured from intended send time):")
+        print(f"  Average Latency: {summary['corrected_avg_latency_ms']:.2f} ms")
+        print(f"  p50 Latency: {summary['corrected_p50_latency_ms']:.2f} ms")
+        print(f"  p90 Latency: {summary['corrected_p90_latency_ms']:.2f} ms")
+        print(f"  p99 Latency: {summary['corrected_p99_latency_ms']:.2f} ms")
+        print(f"  p99.9 Latency: {summary['corrected_p999_latency_ms']:.2f} ms")
+        print(f"  Max Latency: {summary['corrected_max_latency_ms']:.2f} ms")
+        print(f"Error Rate: {summary['error_rate']:.2f} %")
+        print(f"Requests Per Second (RPS): {summary['rps']:.2f}")
+        print(f"Duration: {summary['duration_s']:.2f} s")
+        connections = summary["connections"]
+        print(f"Connections: {connections['opened']} opened, {connections['reused']} reused, {connections['failed']} failed "
+              f"({connections['reuse_rate']:.2f} % of requests on a reused connection)")
+        self.print_phase_summaries()
+        return summary
+
+    def stage_summaries(self, stage_durations):
+        """
+        Returns {stage name: summary} for every stage in stage_durations ({name: seconds}).
+
+        The latency histograms are left out; the run-level summary carries the full ones.
+        """
+        summaries = {}
+        for name, duration_s in stage_durations.items():
+            summary = self.stages.get(name, RunStats()).summary(duration_s)
+            summary.pop("latency_histogram")
+            summary.pop("corrected_latency_histogram")
+            summary["phases"] = self.stages.get(name, RunStats()).phase_summaries(include_histograms=False)
+            summaries[name] = summary
+        return summaries
+
+    def print_stage_summaries(self, stage_durations):
+        summaries = self.stage_summaries(stage_durations)
+        print("Per stage:")
+        for name, summary in summaries.items():
+            print(f"  {name}: {summary['total_requests']} requests, {summary['rps']:.2f} RPS, "
+                  f"{summary['error_rate']:.2f} % errors, p50 {summary['p50_latency_ms']:.2f} ms, "
+                  f"p99 {summary['p99_latency_ms']:.2f} ms, corrected p99 {summary['corrected_p99_latency_ms']:.2f} ms")
+        return summaries
+
+    def endpoint_summaries(self, duration_s):
+        """
+        Returns {endpoint name: summary} for every endpoint of a mixed workload, in the order first seen.
+
+        Every endpoint's RPS is over the whole run. Each summary also has its share of all
+        requests and its failed requests by status code in "errors"; the latency histograms are
+        left out, as for stages.
+        """
+        summaries = {}
+        for name, endpoint_stats in self.endpoints.items():
+            summary = endpoint_stats.summary(duration_s)
+            summary.pop("latency_histogram")
+            summary.pop("corrected_latency_histogram")
+            summary["phases"] = endpoint_stats.phase_summaries(include_histograms=False)
+            summary["share"] = (endpoint_stats.total_requests / self.total_requests) * 100 if self.total_requests > 0 else 0
+            summary["errors"] = endpoint_stats.error_counts()
+            summaries[name] = summary
+        return summaries
+
+    def print_endpoint_summaries(self, duration_s):
+        summaries = self.endpoint_summaries(duration_s)
+        print("Per endpoint:")
+        print(f"  {'Endpoint':<16}{'Requests':>10}{'Share %':>9}{'RPS':>10}{'Errors %':>10}{'p50 ms':>10}{'p99 ms':>10}  Errors by status")
+        for name, summary in summaries.items():
+            errors = ", ".join(f"{status}: {count}" for status, count in sorted(summary["errors"].items())) or "-"
+            print(f"  {name:<16}{summary['total_requests']:>10}{summary['share']:>9.1f}{summary['rps']:>10.2f}{summary['error_rate']:>10.2f}"
+                  f"{summary['p50_latency_ms']:>10.2f}{summary['p99_latency_ms']:>10.2f}  {errors}")
+        return summaries
+
+    def to_dict(self):
+        return {
+            "total_requests": self.total_requests,
+            "successful_requests": self.successful_requests,
+            "status_codes": dict(self.status_codes),
+            "latency_histogram": self.latency.to_dict(),
+            "corrected_latency_histogram": self.corrected_latency.to_dict(),
+            "phase_histograms": {phase: histogram.to_dict() for phase, histogram in self.phases.items()},
+            "connections": dict(self.connections),
+            "stages": {stage: stage_stats.to_dict() for stage, stage_stats in self.stages.items()},
+            "endpoints": {endpoint: endpoint_stats.to_dict() for endpoint, endpoint_stats in self.endpoints.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.total_requests = data["total_requests"]
+        stats.successful_requests = data["successful_requests"]
+        stats.status_codes = dict(data.get("status_codes", {}))
+        stats.latency = LatencyHistogram.from_dict(data["latency_histogram"])
+        stats.corrected_latency = LatencyHistogram.from_dict(data["corrected_latency_histogram"])
+        stats.phases = {phase: LatencyHistogram.from_dict(histogram) for phase, histogram in data.get("phase_histograms", {}).items()}
+        stats.connections = dict(data.get("connections", {}))
+        stats.stages = {stage: cls.from_dict(stage_data) for stage, stage_data in data.get("stages", {}).items()}
+        stats.endpoints = {endpoint: cls.from_dict(endpoint_data) for endpoint, endpoint_data in data.get("endpoints", {}).items()}
+        return stats
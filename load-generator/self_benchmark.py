@@ -0,0 +1,288 @@
+import argparse
+import asyncio
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import threading
+import time
+
+import load_test
+from async_engine import raise_open_file_limit, run_open_loop_test, run_profile_test
+from load_profile import validate_stages
+from stress_test import run_worker_pool
+
+HOLD_S = 1.0 # How long the stub delays responses on /hold, to keep requests in flight for the memory test
+RSS_SAMPLE_INTERVAL_S = 0.02
+STUB_RESPONSE = b"HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\nContent-Length: 2\r\n\r\nok"
+
+class _StubProtocol(asyncio.Protocol):
+    """Minimal keep-alive HTTP/1.1 server: answers every request with a fixed 200, after HOLD_S on /hold."""
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.buffer = b""
+
+    def data_received(self, data):
+        self.buffer += data
+        while True:
+            head_end = self.buffer.find(b"\r\n\r\n")
+            if head_end < 0:
+                return
+            head = self.buffer[:head_end].decode("latin-1")
+            body_length = 0
+            for header in head.split("\r\n")[1:]:
+                name, _, value = header.partition(":")
+                if name.strip().lower() == "content-length":
+                    body_length = int(value)
+            request_end = head_end + 4 + body_length
+            if len(self.buffer) < request_end:
+                return
+            self.buffer = self.buffer[request_end:]
+            path = head.split(" ", 2)[1] if " " in head else "/"
+            if path.startswith("/hold"):
+                asyncio.get_running_loop().call_later(HOLD_S, self._respond)
+            else:
+                self._respond()
+
+    def _respond(self):
+        if not self.transport.is_closing():
+            self.transport.write(STUB_RESPONSE)
+
+def _serve_stub(port_queue):
+    raise_open_file_limit()
+
+    async def serve():
+        server = await asyncio.get_running_loop().create_server(_StubProtocol, "127.0.0.1", 0, backlog=4096)
+        port_queue.put(server.sockets[0].getsockname()[1])
+        await server.serve_forever()
+    asyncio.run(serve())
+
+def start_stub():
+    """
+    Starts the stub server and returns (process, base URL).
+
+    The stub runs in a child process so that its CPU time is not counted against the generator
+    and it does not compete with the generator for the GIL.
+    """
+    port_queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve_stub, args=(port_queue,), daemon=True)
+    process.start()
+    return process, f"http://127.0.0.1:{port_queue.get(timeout=10)}"
+
+def read_rss_bytes():
+    """Returns this process's resident set size, or None where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+class InFlightTracker:
+    """Observer counting requests in flight and remembering the peak. Thread-safe."""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def request_started(self):
+        with self._lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+
+    def record(self, result):
+        with self._lock:
+            self.in_flight -= 1
+
+    def close(self):
+        pass
+
+class RssSampler:
+    """Samples the process RSS on a background thread and keeps the highest value seen."""
+
+    def __init__(self):
+        self.peak = read_rss_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(RSS_SAMPLE_INTERVAL_S):
+            rss = read_rss_bytes()
+            if rss is not None and rss > self.peak:
+                self.peak = rss
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.peak
+
+def measure_throughput(run):
+    """Calls run() -> (RunStats, duration_s) and returns its throughput, CPU cost and latency figures."""
+    cpu_start = time.process_time()
+    stats, duration_s = run()
+    cpu_s = time.process_time() - cpu_start
+    summary = stats.summary(duration_s)
+    total = stats.total_requests
+    return {
+        "requests": total,
+        "failed_requests": stats.failed_requests,
+        "duration_s": duration_s,
+        "max_rps": total / duration_s if duration_s > 0 else 0,
+        "cpu_ms_per_request": cpu_s * 1000 / total if total else None,
+        "cpu_utilization": cpu_s / duration_s if duration_s > 0 else 0,
+        "p50_latency_ms": summary["p50_latency_ms"],
+        "p99_latency_ms": summary["p99_latency_ms"],
+        "corrected_p99_latency_ms": summary["corrected_p99_latency_ms"],
+    }
+
+def measure_memory(run):
+    """
+    Calls run(observers) against the /hold endpoint and returns the RSS growth per in-flight request.
+
+    run must start requests through the observers' request_started() hooks.
+    """
+    rss_before = read_rss_bytes()
+    if rss_before is None:
+        return {"peak_in_flight": None, "memory_per_in_flight_kb": None}
+    tracker = InFlightTracker()
+    sampler = RssSampler()
+    try:
+        run([tracker])
+    finally:
+        peak_rss = sampler.stop()
+    return {
+        "peak_in_flight": tracker.peak,
+        "memory_per_in_flight_kb": (peak_rss - rss_before) / 1024 / tracker.peak if tracker.peak else None,
+    }
+
+def _hold_requests(mode, hold_url, in_flight, observers):
+    """Keeps about in_flight requests open against /hold using the given generator mode."""
+    if mode == "threaded":
+        run_worker_pool(hold_url, in_flight * 2, in_flight, observers=observers)
+    elif mode == "async_open_loop":
+        run_open_loop_test(hold_url, "GET", in_flight / HOLD_S, 2 * HOLD_S, observers=observers)
+    else:
+        stages = validate_stages([{"name": "benchmark", "concurrency": in_flight, "duration": 2 * HOLD_S}])
+        run_profile_test(hold_url, "GET", stages, observers=observers)
+
+def _memory_worker(mode, hold_url, in_flight, result_queue):
+    result_queue.put(measure_memory(lambda observers: _hold_requests(mode, hold_url, in_flight, observers)))
+
+def measure_memory_in_child(mode, hold_url, in_flight):
+    """
+    Runs the memory benchmark of one mode in a freshly spawned interpreter.
+
+    Memory freed by earlier benchmarks stays in this process's heap and would hide the growth,
+    so each mode starts from a clean process.
+    """
+    context = multiprocessing.get_context("spawn")
+    result_queue = context.Queue()
+    process = context.Process(target=_memory_worker, args=(mode, hold_url, in_flight, result_queue))
+    process.start()
+    try:
+        return result_queue.get(timeout=120)
+    finally:
+        process.join()
+
+def run_benchmarks(base_url, args):
+    """Benchmarks every generator mode against the stub and returns {mode: results}."""
+    url = f"{base_url}/"
+    hold_url = f"{base_url}/hold"
+    results = {}
+
+    print("Benchmarking load_test.py sequential mode...")
+    # Benchmark the engine, not the deliberate pacing between sequential requests
+    results["sequential"] = measure_throughput(lambda: load_test.run_sequential(url, "GET", args.requests, interval_s=0))
+    results["sequential"].update({"peak_in_flight": 1, "memory_per_in_flight_kb": None}) # Only ever one request in flight
+
+    print(f"Benchmarking stress_test.py worker pool ({args.threads} threads)...")
+    results["threaded"] = measure_throughput(lambda: run_worker_pool(url, args.requests, args.threads))
+    results["threaded"].update(measure_memory_in_child("threaded", hold_url, args.memory_threads))
+    results["threaded"]["concurrency"] = args.threads
+
+    print(f"Benchmarking asyncio open-loop engine ({args.open_loop_rate:g} RPS offered over {args.async_concurrency} connections)...")
+    results["async_open_loop"] = measure_throughput(
+        lambda: run_open_loop_test(url, "GET", args.open_loop_rate, args.duration, max_in_flight=args.async_concurrency)
+    )
+    results["async_open_loop"].update(measure_memory_in_child("async_open_loop", hold_url, args.memory_in_flight))
+    results["async_open_loop"]["offered_rps"] = args.open_loop_rate
+
+    print(f"Benchmarking asyncio closed-loop engine ({args.async_concurrency} virtual users)...")
+    stages = validate_stages([{"name": "benchmark", "concurrency": args.async_concurrency, "duration": args.duration}])
+    results["async_closed_loop"] = measure_throughput(lambda: run_profile_test(url, "GET", stages))
+    results["async_closed_loop"].update(measure_memory_in_child("async_closed_loop", hold_url, args.memory_in_flight))
+    results["async_closed_loop"]["concurrency"] = args.async_concurrency
+    return results
+
+def compare_to_baseline(results, baseline, tolerance):
+    """Returns a list of human-readable regressions of results against a previous benchmark file."""
+    regressions = []
+    for mode, current in results.items():
+        previous = baseline.get("modes", {}).get(mode)
+        if not previous:
+            continue
+        if previous.get("max_rps") and current["max_rps"] < previous["max_rps"] * (1 - tolerance):
+            regressions.append(f"{mode}: max RPS fell from {previous['max_rps']:.0f} to {current['max_rps']:.0f}")
+        for key, label in (("cpu_ms_per_request", "CPU per request"), ("memory_per_in_flight_kb", "memory per in-flight request")):
+            if previous.get(key) and current.get(key) and current[key] > previous[key] * (1 + tolerance):
+                regressions.append(f"{mode}: {label} rose from {previous[key]:.3f} to {current[key]:.3f}")
+    return regressions
+
+def main():
+    """Benchmarks the load generator itself against a local stub and writes the results as JSON."""
+    parser = argparse.ArgumentParser(description="Measure how fast the load generator itself can go, so it can be ruled out as the bottleneck.")
+    parser.add_argument("--output", default="self_benchmark.json", help="File to write the results to.")
+    parser.add_argument("--baseline", help="Earlier results file to compare against; exits with status 1 on a regression.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Fraction a figure may worsen against --baseline before it counts as a regression.")
+    parser.add_argument("--requests", type=int, default=5000, help="Requests sent by the sequential and threaded benchmarks.")
+    parser.add_argument("--threads", type=int, default=32, help="Worker threads in the threaded benchmark.")
+    parser.add_argument("--duration", type=float, default=5, help="Length of the asyncio benchmarks, in seconds.")
+    parser.add_argument("--open-loop-rate", type=float, default=20000, help="Rate offered in the open-loop benchmark; set it above what the machine can reach.")
+    parser.add_argument("--async-concurrency", type=int, default=256, help="Virtual users in the closed-loop benchmark, and the connection cap of the open-loop one.")
+    parser.add_argument("--memory-in-flight", type=int, default=1000, help="Requests held in flight by the asyncio memory benchmarks.")
+    parser.add_argument("--memory-threads", type=int, default=200, help="Requests (and threads) held in flight by the threaded memory benchmark.")
+    parser.add_argument("--commit-hash", help="The git commit hash being benchmarked, recorded in the results.")
+    args = parser.parse_args()
+
+    stub_process, base_url = start_stub()
+    print(f"Stub server listening on {base_url}")
+    try:
+        results = run_benchmarks(base_url, args)
+    finally:
+        stub_process.terminate()
+        stub_process.join()
+
+    report = {
+        "generated_at": datetime.datetime.utcnow().isoformat(),
+        "commit_hash": args.commit_hash,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "modes": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\n{'Mode':<20}{'Max RPS':>10}{'CPU ms/req':>12}{'p99 ms':>10}{'KB/in-flight':>14}")
+    for mode, result in results.items():
+        memory = f"{result['memory_per_in_flight_kb']:.1f}" if result["memory_per_in_flight_kb"] is not None else "-"
+        cpu = f"{result['cpu_ms_per_request']:.3f}" if result["cpu_ms_per_request"] is not None else "-"
+        print(f"{mode:<20}{result['max_rps']:>10.0f}{cpu:>12}{result['p99_latency_ms']:>10.2f}{memory:>14}")
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(results, json.load(f), args.tolerance)
+        if regressions:
+            print("Performance regressions against the baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("No performance regressions against the baseline.")
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,151 @@
+import os
 import requests
 import argparse
 import time
 import threading
+import queue
+from run_stats import RunStats
+from multiprocess_runner import run_in_processes, split_evenly
+from result_log import ResultLogWriter, shard_result_log_path
+from remote_write_client import RemoteWriteClient
+from metrics_exporter import MetricsExporter
+from phase_timing import create_timing_session, start_phases, finish_phases
+from connections import RequestsConnections, STRATEGIES
 
-def send_request(url):
-    """Sends a single GET request and prints the result."""
+STOP = object() # Work queue sentinel that tells a worker to exit
+REQUEST_TIMEOUT_S = 30 # Connect and read timeout, so a stalled target cannot hang a worker
+
+def send_request(session, url, intended_time=None, verbose=False):
+    """
+    Sends a single GET request over the worker's session and returns metrics, printing the result if verbose.
+
+    With session None, the request goes over a new connection that is closed afterwards.
+    """
+    start_time = time.time()
+    status_code = None
+    success = False
+    response_bytes = 0
+    own_session = session is None
+    if own_session:
+        session = create_timing_session()
+    phases = start_phases()
+    start = time.perf_counter()
+    headers_at = body_at = None
+    error = None
     try:
-        start_time = time.time()
-        response = requests.get(url)
-        end_time = time.time()
-        print(f"Request to {url} - Status: {response.status_code}, Time: {end_time - start_time:.4f} seconds")
+        response = session.get(url, stream=True, timeout=REQUEST_TIMEOUT_S)
+        headers_at = time.perf_counter()
+        status_code = response.status_code
+        response_bytes = len(response.content)
+        body_at = time.perf_counter()
+        success = response.ok
     except requests.exceptions.RequestException as e:
-        print(f"Request to {url} failed: {e}")
+        error = e
+    finally:
+        end_time = time.time()
+        if own_session:
+            session.close()
+        phases, connection = finish_phases(phases, start, headers_at, body_at)
+    if verbose:
+        if error is None:
+            print(f"Request to {url} - Status: {status_code}, Time: {end_time - start_time:.4f} seconds")
+        else:
+            print(f"Request to {url} failed: {error}")
+    result = {"latency": (end_time - start_time) * 1000, "status_code": status_code, "success": success, "start_time": start_time, "bytes": response_bytes,
+              "phases": phases, "connection": connection}
+    if intended_time is not None:
+        result["intended_time"] = intended_time
+        result["corrected_latency"] = (end_time - intended_time) * 1000
+    return result
+
+def worker(url, work_queue, stats, connections, verbose=False, observers=()):
+    """
+    Long-lived worker: pulls work items from the shared queue until it receives STOP.
+
+    A work item is the request's intended send time, or None when the run has no schedule.
+    Workers never send early; a request whose time has already passed is sent at once.
+    The worker's session comes from connections, which also closes it.
+    """
+    session = connections.session_for_worker()
+    start_hooks = [observer.request_started for observer in observers if hasattr(observer, "request_started")]
+    while True:
+        intended_time = work_queue.get()
+        if intended_time is STOP:
+            break
+        if intended_time is not None:
+            delay = intended_time - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        for hook in start_hooks:
+            hook()
+        start_time = time.time()
+        try:
+            result = send_request(session, url, intended_time, verbose)
+        except Exception as e:
+            # Count anything send_request does not handle (e.g. a body that fails to decode) as a
+            # failed request; a dead worker would leave main blocked on the bounded work queue.
+            print(f"Request to {url} failed unexpectedly: {e!r}")
+            end_time = time.time()
+            result = {"latency": (end_time - start_time) * 1000, "status_code": None, "success": False, "start_time": start_time, "bytes": 0}
+            if intended_time is not None:
+                result["intended_time"] = intended_time
+                result["corrected_latency"] = (end_time - intended_time) * 1000
+        stats.record(result)
+        for observer in observers:
+            observer.record(result)
+
+def run_worker_pool(url, request_count, concurrency, rate=None, verbose=False, observers=(), connection_strategy="per-vu", pool_size=0):
+    """
+    Runs request_count requests through a pool of `concurrency` workers and returns (RunStats, duration_s).
+
+    With a rate, request i is scheduled for start + i / rate, which gives the corrected latency
+    a reference point; without one, workers send back-to-back and both latencies are the same.
+    connection_strategy picks how workers get connections (see connections.py); the shared
+    "pool" holds pool_size connections, or one per worker if pool_size is 0.
+    Every result is also passed to the record() method of each observer, which must be thread-safe.
+    """
+    # A bounded queue keeps memory flat for large request counts; each worker keeps exactly
+    # one request in flight, so concurrency stays at N until the queue drains.
+    work_queue = queue.Queue(maxsize=concurrency * 2)
+    # Each worker records into its own RunStats, merged once the run is over
+    worker_stats = [RunStats() for _ in range(concurrency)]
+    connections = RequestsConnections(connection_strategy, pool_size or concurrency)
+    workers = [
+        threading.Thread(target=worker, args=(url, work_queue, stats, connections, verbose, observers), daemon=True)
+        for stats in worker_stats
+    ]
+
+    start_test_time = time.time()
+    for thread in workers:
+        thread.start()
+    for i in range(request_count):
+        work_queue.put(start_test_time + i / rate if rate else None)
+    for _ in workers:
+        work_queue.put(STOP)
+    for thread in workers:
+        thread.join()
+    duration_s = time.time() - start_test_time
+    connections.close()
+
+    stats = RunStats()
+    for partial in worker_stats:
+        stats.merge(partial)
+    return stats, duration_s
+
+def run_shard(run_kwargs, result_log=None, remote_write_url=None, metrics_port=None):
+    """Runs one shard of the stress test with its own result observers and returns (RunStats, duration_s)."""
+    observers = []
+    if result_log:
+        observers.append(ResultLogWriter(result_log))
+    if remote_write_url:
+        observers.append(RemoteWriteClient(remote_write_url, extra_labels={"target": run_kwargs["url"]}))
+    if metrics_port:
+        observers.append(MetricsExporter(metrics_port, target_rps=run_kwargs.get("rate")))
+    try:
+        return run_worker_pool(**run_kwargs, observers=observers)
+    finally:
+        for observer in observers:
+            observer.close()
 
 def main():
     """Main function to parse arguments and run the concurrent load test."""
@@ -19,27 +153,60 @@ def main():
     parser.add_argument("url", help="The URL to send requests to.")
     parser.add_argument("request_count", type=int, help="The total number of requests to send.")
     parser.add_argument("-c", "--concurrency", type=int, default=10, help="The number of concurrent requests to run.")
+    parser.add_argument("--rate", type=float, help="Target requests per second. Gives every request an intended send time so latency can be corrected for coordinated omission.")
+    parser.add_argument("--result-log", help="Stream every request's result to this binary file (one file per process, suffixed .0, .1, ... with --processes). Read it back with result_log.py.")
+    parser.add_argument("--remote-write-url", default=os.getenv('REMOTE_WRITE_URL'), help="Push client-side request metrics to this Prometheus remote_write endpoint during the run (e.g. http://prometheus:9090/api/v1/write).")
+    parser.add_argument("--metrics-port", type=int, help="Serve the generator's own metrics on this port at /metrics for Prometheus to scrape (worker process N uses port + N).")
+    parser.add_argument("--connections", choices=STRATEGIES, default="per-vu", help="new: a new connection per request; pool: a shared keep-alive pool of --pool-size connections; per-vu: one keep-alive connection per worker.")
+    parser.add_argument("--pool-size", type=int, default=0, help="Connections in the shared pool with --connections pool (default: one per worker).")
+    parser.add_argument("--verbose", action="store_true", help="Print a line for every request.")
+    parser.add_argument("--processes", type=int, default=1, help="Number of worker processes to split the requests and workers across.")
     args = parser.parse_args()
 
-    print(f"Starting load test with {args.request_count} requests to {args.url} using {args.concurrency} concurrent workers.")
-
-    threads = []
-    for _ in range(args.request_count):
-        thread = threading.Thread(target=send_request, args=(args.url,))
-        threads.append(thread)
-        thread.start()
+    if args.processes < 1 or args.concurrency < args.processes:
+        parser.error("--processes must be at least 1 and no more than --concurrency.")
+    if args.rate is not None and args.rate <= 0:
+        parser.error("--rate must be greater than zero.")
+    if args.pool_size < 0:
+        parser.error("--pool-size must be at least zero.")
 
-        # Limit the number of active threads to the specified concurrency level
-        if len(threads) % args.concurrency == 0:
-            for t in threads:
-                t.join() # Wait for the current batch of threads to finish
-            threads = []
+    print(f"Starting load test with {args.request_count} requests to {args.url} using {args.concurrency} concurrent workers.")
 
-    # Wait for any remaining threads
-    for thread in threads:
-        thread.join()
+    if args.processes > 1:
+        print(f"Sharding the load across {args.processes} worker processes.")
+        shards = [
+            {
+                "run_kwargs": {
+                    "url": args.url,
+                    "request_count": request_count,
+                    "concurrency": concurrency,
+                    "rate": args.rate / args.processes if args.rate else None,
+                    "verbose": args.verbose,
+                    "connection_strategy": args.connections,
+                    "pool_size": max(1, pool_size) if args.pool_size else 0,
+                },
+                "result_log": shard_result_log_path(args.result_log, index, args.processes),
+                "remote_write_url": args.remote_write_url,
+                "metrics_port": args.metrics_port + index if args.metrics_port else None,
+            }
+            for index, (request_count, concurrency, pool_size) in enumerate(zip(
+                split_evenly(args.request_count, args.processes),
+                split_evenly(args.concurrency, args.processes),
+                split_evenly(args.pool_size, args.processes)
+            ))
+        ]
+        stats, duration_s = run_in_processes(run_shard, shards)
+    else:
+        stats, duration_s = run_shard(
+            {"url": args.url, "request_count": args.request_count, "concurrency": args.concurrency, "rate": args.rate, "verbose": args.verbose,
+             "connection_strategy": args.connections, "pool_size": args.pool_size},
+            args.result_log,
+            args.remote_write_url,
+            args.metrics_port
+        )
 
     print("Load test finished.")
+    stats.print_summary(duration_s)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
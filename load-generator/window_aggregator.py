@@ -0,0 +1,80 @@
+import threading
+import time
+
+from local_tracker_client import LocalTrackerClient
+from run_stats import RunStats
+
+class WindowAggregator:
+    """
+    Rolls results into fixed, back-to-back time windows and tracks each window as it closes.
+
+    record() only adds to the current window's RunStats under a short lock, so it is cheap on
+    the request path and safe to call from worker threads. A timer thread swaps in a fresh
+    window every interval_s and hands the closed one to a background LocalTrackerClient, so a
+    slow or unavailable local-tracker-service never stalls request generation. Each window
+    is sent as its own metric, tagged with the run's session_id, which lets the degradation
+    curve of a long run be watched while it is still going and survive a crash.
+    """
+
+    def __init__(self, interval_s, challenge_type, metric_name, session_id, base_metrics=None, tracking_client=None):
+        self.interval_s = interval_s
+        self.challenge_type = challenge_type
+        self.metric_name = metric_name
+        self.session_id = session_id
+        self.base_metrics = base_metrics or {}
+        self.tracking_client = tracking_client or LocalTrackerClient(background=True)
+        self.window_index = 0
+        self._lock = threading.Lock()
+        self._window = RunStats()
+        self._window_start = time.time()
+        self._stop = threading.Event()
+        self._timer = threading.Thread(target=self._run_timer, name="window-aggregator", daemon=True)
+        self._timer.start()
+
+    def record(self, result):
+        with self._lock:
+            self._window.record(result)
+
+    def _run_timer(self):
+        next_flush = self._window_start + self.interval_s
+        while not self._stop.wait(max(0.0, next_flush - time.time())):
+            self.flush()
+            next_flush += self.interval_s
+
+    def flush(self):
+        """Closes the current window and sends its metrics."""
+        now = time.time()
+        with self._lock:
+            window, self._window = self._window, RunStats()
+            window_start, self._window_start = self._window_start, now
+        window_index = self.window_index
+        self.window_index += 1
+
+        summary = window.summary(now - window_start)
+        # The full histograms belong in the end-of-run report; windows only carry the percentiles
+        summary.pop("latency_histogram")
+        summary.pop("corrected_latency_histogram")
+        summary["phases"] = window.phase_summaries(include_histograms=False)
+        metrics_data = {
+            **self.base_metrics,
+            **summary,
+            "window_index": window_index,
+            "window_start": window_start,
+            "window_end": now,
+            "test_type": "load_test_window",
+        }
+        print(f"Window {window_index}: {summary['total_requests']} requests, {summary['rps']:.2f} RPS, "
+              f"{summary['error_rate']:.2f} % errors, p99 {summary['p99_latency_ms']:.2f} ms")
+        self.tracking_client.send_metrics(
+            challenge_type=self.challenge_type,
+            metric_name=self.metric_name,
+            metrics_data=metrics_data,
+            session_id=self.session_id
+        )
+
+    def close(self):
+        """Stops the timer, sends the final partial window and flushes the tracking client."""
+        self._stop.set()
+        self._timer.join()
+        self.flush()
+        self.tracking_client.close()
@@ -0,0 +1,208 @@
+import json
+import re
+
+from load_profile import validate_stages
+
+try:
+    import yaml
+except ImportError: # PyYAML is only needed for .yaml/.yml workloads
+    yaml = None
+
+METHODS = ("GET", "POST")
+THINK_TIME_DISTRIBUTIONS = ("constant", "uniform", "exponential", "normal")
+PLACEHOLDER = re.compile(r"\{(\w+)\}")
+
+def load_workload(path):
+    """
+    Reads a workload mix from a JSON or YAML file and returns it validated.
+
+    A workload lists the endpoints to send requests to, each picked at random in proportion
+    to its weight:
+
+        variables:
+          site: [https://example.com, https://github.com, https://www.wikipedia.org]
+        think_time: {distribution: exponential, mean: 2}
+        endpoints:
+          - {name: home, weight: 40, path: /}
+          - {name: history, weight: 30, path: /api/history}
+          - {name: sample-urls, weight: 25, path: /api/sample-urls}
+          - name: test
+            weight: 5
+            method: POST
+            path: /api/test
+            body: {urls: {$sample: site, count: [1, 3]}}
+            think_time: {distribution: uniform, min: 5, max: 10}
+        stages:
+          - {name: users, concurrency: 50, duration: 300}
+
+    path and body are request templates: "{name}" inside a string is replaced by a random
+    value of variables[name] on every request, and {$sample: name, count: n} becomes a list of
+    n distinct random values ([min, max] for a random n; never more than the variable has).
+    think_time is how long a virtual user waits after a request to that endpoint before its
+    next one (the workload-level think_time is the default; none means no wait): a number of
+    seconds, or a distribution that is constant (value), uniform (min, max), exponential
+    (mean) or normal (mean, stddev, never below zero). Think times only apply to virtual users, i.e. concurrency stages; open-loop
+    requests keep to their arrival schedule. The optional stages are a load profile (see
+    load_profile.py) to run the mix with when no other load is given on the command line.
+    """
+    with open(path) as f:
+        if path.endswith((".yaml", ".yml")):
+            if yaml is None:
+                raise RuntimeError("YAML workloads need the PyYAML package (pip install pyyaml).")
+            workload = yaml.safe_load(f)
+        else:
+            workload = json.load(f)
+    return validate_workload(workload)
+
+def validate_workload(workload):
+    """Checks a workload dict and returns a normalized copy with cumulative weights filled in."""
+    if not isinstance(workload, dict):
+        raise ValueError("A workload must be a mapping with an 'endpoints' list.")
+    variables = workload.get("variables") or {}
+    if not isinstance(variables, dict) or any(not isinstance(values, list) or not values for values in variables.values()):
+        raise ValueError("Workload variables must map names to non-empty lists of values.")
+    default_think_time = validate_think_time(workload.get("think_time"), "the workload")
+    endpoints = workload.get("endpoints")
+    if not isinstance(endpoints, list) or not endpoints:
+        raise ValueError("A workload needs a non-empty list of endpoints.")
+
+    normalized = []
+    names = set()
+    cumulative_weights = []
+    total_weight = 0.0
+    for i, endpoint in enumerate(endpoints):
+        if not isinstance(endpoint, dict):
+            raise ValueError(f"Endpoint {i} must be a mapping, got {endpoint!r}.")
+        name = str(endpoint.get("name", f"endpoint-{i}"))
+        if name in names:
+            raise ValueError(f"Endpoint name '{name}' is used more than once.")
+        names.add(name)
+        weight = endpoint.get("weight", 1)
+        if not isinstance(weight, (int, float)) or weight < 0:
+            raise ValueError(f"Endpoint '{name}': weight must be a number of at least zero.")
+        method = str(endpoint.get("method", "GET")).upper()
+        if method not in METHODS:
+            raise ValueError(f"Endpoint '{name}': method must be one of {', '.join(METHODS)}.")
+        path = endpoint.get("path")
+        if not isinstance(path, str) or not path.startswith("/"):
+            raise ValueError(f"Endpoint '{name}': path must be a string starting with '/'.")
+        body = endpoint.get("body")
+        for variable in template_variables(path) | template_variables(body):
+            if variable not in variables:
+                raise ValueError(f"Endpoint '{name}' uses variable '{variable}', which is not defined under variables.")
+        validate_samples(body, variables, f"Endpoint '{name}'")
+        think_time = validate_think_time(endpoint["think_time"], f"Endpoint '{name}'") if "think_time" in endpoint else default_think_time
+        total_weight += weight
+        cumulative_weights.append(total_weight)
+        normalized.append({"name": name, "weight": weight, "method": method, "path": path, "body": body, "think_time": think_time})
+    if total_weight <= 0:
+        raise ValueError("At least one endpoint needs a weight greater than zero.")
+
+    return {
+        "variables": variables,
+        "endpoints": normalized,
+        "cumulative_weights": cumulative_weights,
+        "stages": validate_stages(workload["stages"]) if workload.get("stages") is not None else None,
+    }
+
+def validate_think_time(think_time, owner):
+    """Returns a think time as a distribution dict (None for no think time)."""
+    if think_time is None:
+        return None
+    if isinstance(think_time, (int, float)):
+        think_time = {"distribution": "constant", "value": think_time}
+    if not isinstance(think_time, dict) or think_time.get("distribution") not in THINK_TIME_DISTRIBUTIONS:
+        raise ValueError(f"{owner}: think_time must be seconds or a distribution that is one of {', '.join(THINK_TIME_DISTRIBUTIONS)}.")
+    required = {"constant": ("value",), "uniform": ("min", "max"), "exponential": ("mean",), "normal": ("mean", "stddev")}
+    for parameter in required[think_time["distribution"]]:
+        value = think_time.get(parameter)
+        if not isinstance(value, (int, float)) or value < 0:
+            raise ValueError(f"{owner}: a {think_time['distribution']} think_time needs {parameter} of at least zero seconds.")
+    if think_time["distribution"] == "uniform" and think_time["min"] > think_time["max"]:
+        raise ValueError(f"{owner}: a uniform think_time needs min no greater than max.")
+    return dict(think_time)
+
+def template_variables(template):
+    """Returns the names of the variables a path or body template uses."""
+    if isinstance(template, str):
+        return set(PLACEHOLDER.findall(template))
+    if isinstance(template, list):
+        return set().union(*(template_variables(item) for item in template))
+    if isinstance(template, dict):
+        if "$sample" in template:
+            return {template["$sample"]}
+        return set().union(*(template_variables(value) for value in template.values()))
+    return set()
+
+def validate_samples(template, variables, owner):
+    """Checks that every $sample in a body template asks for between 0 and len(variables[name]) values."""
+    if isinstance(template, list):
+        for item in template:
+            validate_samples(item, variables, owner)
+    elif isinstance(template, dict):
+        if "$sample" not in template:
+            for value in template.values():
+                validate_samples(value, variables, owner)
+            return
+        available = len(variables[template["$sample"]])
+        count = template.get("count", 1)
+        if isinstance(count, int) and not isinstance(count, bool):
+            low = high = count
+        elif isinstance(count, list) and len(count) == 2 and all(isinstance(n, int) and not isinstance(n, bool) for n in count):
+            low, high = count
+        else:
+            raise ValueError(f"{owner}: $sample {template['$sample']} needs a count that is a whole number or a [min, max] pair of them.")
+        if low < 0 or low > high:
+            raise ValueError(f"{owner}: $sample {template['$sample']} needs a count of at least zero, with min no greater than max.")
+        if high > available:
+            raise ValueError(f"{owner}: $sample {template['$sample']} asks for up to {high} values, but the variable only has {available}.")
+
+def render_template(template, variables, rng):
+    """Fills in a path or body template with random variable values."""
+    if isinstance(template, str):
+        return PLACEHOLDER.sub(lambda match: str(rng.choice(variables[match.group(1)])), template)
+    if isinstance(template, list):
+        return [render_template(item, variables, rng) for item in template]
+    if isinstance(template, dict):
+        if "$sample" in template:
+            values = variables[template["$sample"]]
+            count = template.get("count", 1)
+            if isinstance(count, list):
+                count = rng.randint(count[0], count[1])
+            return rng.sample(values, count)
+        return {key: render_template(value, variables, rng) for key, value in template.items()}
+    return template
+
+def next_request(workload, base_url, rng):
+    """Picks an endpoint by weight and returns (endpoint, method, url, JSON body or None) for one request."""
+    endpoint = rng.choices(workload["endpoints"], cum_weights=workload["cumulative_weights"])[0]
+    url = base_url.rstrip("/") + render_template(endpoint["path"], workload["variables"], rng)
+    body = render_template(endpoint["body"], workload["variables"], rng) if endpoint["body"] is not None else None
+    return endpoint, endpoint["method"], url, body
+
+def think_time(endpoint, rng):
+    """Returns how long (s) a virtual user waits after a request to endpoint."""
+    distribution = endpoint["think_time"]
+    if distribution is None:
+        return 0.0
+    kind = distribution["distribution"]
+    if kind == "constant":
+        return float(distribution["value"])
+    if kind == "uniform":
+        return rng.uniform(distribution["min"], distribution["max"])
+    if kind == "exponential":
+        return rng.expovariate(1 / distribution["mean"]) if distribution["mean"] > 0 else 0.0
+    return max(0.0, rng.gauss(distribution["mean"], distribution["stddev"]))
+
+def describe_workload(workload):
+    """Returns one human-readable line per endpoint, for the start-of-run banner."""
+    total_weight = workload["cumulative_weights"][-1]
+    lines = []
+    for endpoint in workload["endpoints"]:
+        line = f"  {endpoint['name']}: {endpoint['method']} {endpoint['path']} ({endpoint['weight'] / total_weight * 100:.1f} %)"
+        distribution = endpoint["think_time"]
+        if distribution is not None:
+            parameters = ", ".join(f"{key} {value:g}" for key, value in distribution.items() if key != "distribution")
+            line += f", think time {distribution['distribution']} ({parameters} s)"
+        lines.append(line)
+    return lines
@@ -13,7 +13,7 @@ const { Pool } = require('pg');
 const app = express();
 const port = 3002; // Unique port for tracking service
 
-app.use(express.json()); // For parsing application/json
+app.use(express.json({ limit: '10mb' })); // For parsing application/json (batches with latency histograms can be large)
 
 // PostgreSQL Connection Pool
 const pool = new Pool({
@@ -56,29 +56,44 @@ const validateApiKey = (req, res, next) => {
     }
 };
 
-// Endpoint to receive tracking data from load-generator
-app.post('/api/track', validateApiKey, async (req, res) => {
-    const { schema_version, userId, challengeType, metricName, value, timestamp, labels, runDetails } = req.body;
-    const { session_id, commit_hash, target_url } = runDetails;
+// Returns an error message if a tracking payload is invalid, otherwise null
+const validateTrackingPayload = (body) => {
+    const { userId, challengeType, metricName, runDetails } = body || {};
 
     // Basic Validation
     if (!userId || !challengeType || !metricName || !runDetails) {
-        return res.status(400).json({ status: "error", message: "Missing required fields: userId, challengeType, metricName, runDetails." });
+        return "Missing required fields: userId, challengeType, metricName, runDetails.";
     }
     if (typeof userId !== 'string' || typeof challengeType !== 'string' || typeof metricName !== 'string') {
-        return res.status(400).json({ status: "error", message: "userId, challengeType, metricName must be strings." });
+        return "userId, challengeType, metricName must be strings.";
     }
     if (typeof runDetails !== 'object' || runDetails === null) {
-        return res.status(400).json({ status: "error", message: "runDetails must be an object." });
+        return "runDetails must be an object.";
     }
     // Optional: Add more specific validation for runDetails content if needed
+    return null;
+};
+
+// Inserts one tracking payload using the given client (the pool, or a client holding a transaction)
+const insertTrackingPayload = (client, body) => {
+    const { schema_version, userId, challengeType, metricName, value, timestamp, labels, runDetails } = body;
+    const { session_id, commit_hash, target_url } = runDetails;
+    return client.query(
+        `INSERT INTO load_test_runs (schema_version, user_id, challenge_type, metric_name, value, timestamp, labels, run_details, session_id, commit_hash, target_app)
+         VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)`,
+        [schema_version, userId, challengeType, metricName, value, timestamp, labels, runDetails, session_id, commit_hash, target_url]
+    );
+};
+
+// Endpoint to receive tracking data from load-generator
+app.post('/api/track', validateApiKey, async (req, res) => {
+    const validationError = validateTrackingPayload(req.body);
+    if (validationError) {
+        return res.status(400).json({ status: "error", message: validationError });
+    }
 
     try {
-        await pool.query(
-            `INSERT INTO load_test_runs (schema_version, user_id, challenge_type, metric_name, value, timestamp, labels, run_details, session_id, commit_hash, target_app)
-             VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)`,
-            [schema_version, userId, challengeType, metricName, value, timestamp, labels, runDetails, session_id, commit_hash, target_url]
-        );
+        await insertTrackingPayload(pool, req.body);
         res.status(200).json({ status: "ok", message: "Tracking data received and stored." });
     } catch (error) {
         console.error('Error storing tracking data:', error);
@@ -86,6 +101,42 @@ app.post('/api/track', validateApiKey, async (req, res) => {
     }
 });
 
+// Endpoint to receive many tracking payloads in one round-trip (used by the background LocalTrackerClient).
+// The batch is stored in a single transaction: either every payload is stored or none is.
+app.post('/api/track/batch', validateApiKey, async (req, res) => {
+    const payloads = req.body;
+    if (!Array.isArray(payloads) || payloads.length === 0) {
+        return res.status(400).json({ status: "error", message: "Request body must be a non-empty array of tracking payloads." });
+    }
+    for (let i = 0; i < payloads.length; i++) {
+        const validationError = validateTrackingPayload(payloads[i]);
+        if (validationError) {
+            return res.status(400).json({ status: "error", message: `Payload ${i}: ${validationError}` });
+        }
+    }
+
+    let client;
+    try {
+        client = await pool.connect();
+        await client.query('BEGIN');
+        for (const payload of payloads) {
+            await insertTrackingPayload(client, payload);
+        }
+        await client.query('COMMIT');
+        res.status(200).json({ status: "ok", message: `${payloads.length} tracking payloads received and stored.`, stored: payloads.length });
+    } catch (error) {
+        if (client) {
+            await client.query('ROLLBACK').catch(() => {});
+        }
+        console.error('Error storing tracking data batch:', error);
+        res.status(500).json({ status: "error", message: "Error storing tracking data batch." });
+    } finally {
+        if (client) {
+            client.release();
+        }
+    }
+});
+
 // Endpoint to retrieve tracking data for a specific user
 app.get('/api/track/:userId', async (req, res) => {
     const { userId } = req.params;
@@ -1,59 +1,169 @@
 import os
 import sys
+import csv
+import json
+import time
 import argparse
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
+from contributor_common import register_influencer
 
 load_dotenv() # Load environment variables from .env
 
+VALID_CHALLENGES = ['robust-service', 'graceful-degradation', 'longest-upkeep']
+CONTRIBUTORS_DIR = 'contributors'
+
+def load_api_keys(contributors_dir=CONTRIBUTORS_DIR):
+    """Reads every contributor's private/api_key.txt in one scan of contributors_dir and returns {username: api_key}."""
+    api_keys = {}
+    with os.scandir(contributors_dir) as entries:
+        for entry in entries:
+            if not entry.is_dir():
+                continue
+            try:
+                with open(os.path.join(entry.path, 'private', 'api_key.txt'), 'r') as f:
+                    api_keys[entry.name] = f.read().strip()
+            except FileNotFoundError:
+                continue # The contributor-app template and apps created elsewhere have no key
+    return api_keys
+
+def read_mapping(mapping_file, default_challenge=None):
+    """
+    Reads {username: challenge} from a mapping file.
+
+    A .json file holds one object mapping usernames to challenges. Anything else is read as
+    CSV with the username in the first column and the challenge in the second; lines without
+    a challenge use default_challenge. A header row, blank lines and lines starting with #
+    are skipped.
+    """
+    if mapping_file.endswith('.json'):
+        with open(mapping_file, 'r') as f:
+            return json.load(f)
+    mapping = {}
+    with open(mapping_file, newline='') as f:
+        for row in csv.reader(f):
+            row = [cell.strip() for cell in row]
+            if not row or not row[0] or row[0].startswith('#') or row[0].lower() in ('github_username', 'username', 'user'):
+                continue
+            mapping[row[0]] = row[1] if len(row) > 1 and row[1] else default_challenge
+    return mapping
+
+def switch_challenges(mapping, api_keys, backend_url, parallelism=8):
+    """
+    Switches every user in {username: challenge} concurrently and returns {username: (latency_s, error or None)}.
+
+    At most parallelism registrations are in flight, sharing one pooled session so
+    connections to the backend are reused. Users without an API key or with an unknown
+    challenge are reported without a request being sent. So are users mapped to the same
+    challenge as another user: the backend keeps one active influencer per challenge, so
+    concurrent registrations would leave an arbitrary one of them active.
+    """
+    users_by_challenge = {}
+    for username, challenge in mapping.items():
+        if challenge in VALID_CHALLENGES:
+            users_by_challenge.setdefault(challenge, []).append(username)
+
+    def switch(session, username, challenge):
+        if challenge not in VALID_CHALLENGES:
+            return None, f"invalid challenge type '{challenge}'"
+        if len(users_by_challenge[challenge]) > 1:
+            return None, f"'{challenge}' has one active influencer but {len(users_by_challenge[challenge]) - 1} other user(s) are mapped to it too"
+        if username not in api_keys:
+            return None, f"no API key at contributors/{username}/private/api_key.txt"
+        start = time.monotonic()
+        try:
+            register_influencer(session, backend_url, api_keys[username], challenge)
+            error = None
+        except requests.exceptions.RequestException as e:
+            error = str(e)
+        return time.monotonic() - start, error
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=parallelism)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        results = dict(zip(mapping, executor.map(lambda item: switch(session, *item), mapping.items())))
+    session.close()
+    return results
+
+def print_bulk_summary(mapping, results):
+    latencies = sorted(latency for latency, error in results.values() if latency is not None and error is None)
+    failed = {username: error for username, (_, error) in results.items() if error}
+    print("\n" + "="*60)
+    print("Bulk Challenge Switch Complete".center(60))
+    print("="*60)
+    for username, (latency, error) in results.items():
+        timing = f"{latency * 1000:8.1f} ms" if latency is not None else "       - ms"
+        print(f"  {username:<30} {str(mapping[username]):<22} {timing}  {'FAILED: ' + error if error else 'ok'}")
+    print("-"*60)
+    print(f"Switched: {len(results) - len(failed)}    Failed: {len(failed)}")
+    if latencies:
+        print(f"Latency: min {latencies[0] * 1000:.1f} ms, median {latencies[len(latencies) // 2] * 1000:.1f} ms, max {latencies[-1] * 1000:.1f} ms")
+    print("="*60 + "\n")
+
 def switch_challenge():
-    """Updates the challenge type for a given user by calling the backend API."""
-    parser = argparse.ArgumentParser(description="Switch the active challenge for a contributor.")
-    parser.add_argument("--user", required=True, help="The GitHub username of the contributor.")
-    parser.add_argument("--challenge", required=True, help="The new challenge to switch to (e.g., 'robust-service', 'graceful-degradation', 'longest-upkeep').")
+    """Updates the challenge type of one user, or of many with --mapping/--all, by calling the backend API."""
+    parser = argparse.ArgumentParser(description="Switch the active challenge for one or many contributors.")
+    parser.add_argument("--user", help="The GitHub username of the contributor.")
+    parser.add_argument("--challenge", help=f"The new challenge to switch to ({', '.join(VALID_CHALLENGES)}). With --mapping, the challenge for users the file gives none.")
+    parser.add_argument("--mapping", help="CSV (username,challenge) or JSON ({username: challenge}) file of users to switch at once.")
+    parser.add_argument("--all", action="store_true", help="Make the contributor with an API key under contributors/ the active influencer of --challenge. "
+                                                           "A challenge has one active influencer, so this fails if several contributors have keys.")
+    parser.add_argument("--parallelism", type=int, default=8, help="Maximum concurrent registrations in bulk mode.")
     args = parser.parse_args()
 
+    if sum(bool(option) for option in (args.user, args.mapping, args.all)) != 1:
+        parser.error("Give exactly one of --user, --mapping or --all.")
+    if (args.user or args.all) and not args.challenge:
+        parser.error("--challenge is required with --user and --all.")
+    if args.parallelism < 1:
+        parser.error("--parallelism must be at least 1.")
+
     github_username = args.user
     new_challenge_type = args.challenge
 
-    valid_challenges = ['robust-service', 'graceful-degradation', 'longest-upkeep'];
-    if new_challenge_type not in valid_challenges:
+    if new_challenge_type and new_challenge_type not in VALID_CHALLENGES:
         print(f"Error: Invalid challenge type '{new_challenge_type}'.")
-        print(f"Please choose from: {valid_challenges}")
+        print(f"Please choose from: {VALID_CHALLENGES}")
         sys.exit(1)
 
-    # Read API key from the contributor's private folder
-    api_key_path = os.path.join('contributors', github_username, 'private', 'api_key.txt')
-    if not os.path.exists(api_key_path):
-        print(f"Error: API key file not found for user '{github_username}' at '{api_key_path}'.")
-        sys.exit(1)
-
-    with open(api_key_path, 'r') as f:
-        api_key = f.read().strip()
-
     # Call the new backend API endpoint
     backend_url = os.getenv("BACKEND_URL")
     if not backend_url:
         print("Error: BACKEND_URL environment variable is not set.")
         sys.exit(1)
 
-    register_influencer_url = f"{backend_url}/api/v1/register-influencer"
+    if not github_username:
+        api_keys = load_api_keys()
+        mapping = read_mapping(args.mapping, new_challenge_type) if args.mapping else {username: new_challenge_type for username in sorted(api_keys)}
+        if not mapping:
+            print("No users to switch.")
+            sys.exit(1)
+        print(f"Switching {len(mapping)} users with up to {args.parallelism} concurrent requests...")
+        results = switch_challenges(mapping, api_keys, backend_url, args.parallelism)
+        print_bulk_summary(mapping, results)
+        if any(error for _, error in results.values()):
+            sys.exit(1)
+        return
+
+    # Read API key from the contributor's private folder
+    api_key_path = os.path.join(CONTRIBUTORS_DIR, github_username, 'private', 'api_key.txt')
+    if not os.path.exists(api_key_path):
+        print(f"Error: API key file not found for user '{github_username}' at '{api_key_path}'.")
+        sys.exit(1)
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "challenge_type": new_challenge_type
-    }
+    with open(api_key_path, 'r') as f:
+        api_key = f.read().strip()
 
     try:
-        response = requests.post(register_influencer_url, headers=headers, json=payload)
-        response.raise_for_status() # Raise an exception for HTTP errors
+        register_influencer(requests.Session(), backend_url, api_key, new_challenge_type)
         print(f"Successfully switched '{github_username}' to the '{new_challenge_type}' challenge.")
     except requests.exceptions.RequestException as e:
         print(f"Error calling backend API to register influencer: {e}")
         sys.exit(1)
 
 if __name__ == "__main__":
-    switch_challenge()
\ No newline at end of file
+    switch_challenge()
@@ -0,0 +1,238 @@
+import argparse
+import glob
+import json
+import os
+import re
+import zlib
+from contextlib import contextmanager
+
+from contributor_common import prometheus_target
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
+
+DEFAULT_TARGETS_FILE = os.path.join("prometheus", "targets.json")
+
+@contextmanager
+def _locked(lock_path):
+    """Holds an exclusive lock on lock_path for the duration of the block, across processes."""
+    with open(lock_path, "a+") as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+def target_instance(target):
+    """The key a file_sd target is indexed by: its instance label, or its first address if it has none."""
+    instance = target.get("labels", {}).get("instance")
+    if instance is None and target.get("targets"):
+        instance = target["targets"][0]
+    return instance
+
+class TargetRegistry:
+    """
+    Prometheus file_sd targets indexed by instance, with idempotent upserts and removals.
+
+    Every change holds an exclusive file lock while it reads, modifies and rewrites a targets
+    file, so concurrent onboardings cannot lose each other's updates. Files are replaced
+    atomically through a temporary file and os.replace, so Prometheus never reads a
+    half-written one, and a change that leaves the targets as they were writes nothing.
+
+    With shards > 1, targets are spread over targets-00.json, targets-01.json, ... next to
+    path by a hash of their instance, and a change only rewrites (and makes Prometheus
+    reload) the shards it touches. prometheus.yml picks the shards up with a glob. When the
+    shard count changes (including turning sharding on or off), targets left in a file their
+    instance no longer hashes to are read along with the rest, and the first change moves
+    them to the right file. The unsharded file is then left as an empty list, and shard files
+    beyond the new count are deleted, so no target is listed, and scraped, twice.
+    """
+
+    def __init__(self, path=DEFAULT_TARGETS_FILE, shards=1):
+        if shards < 1:
+            raise ValueError("shards must be at least 1")
+        self.path = path
+        self.shards = shards
+        self._cache = {} # shard path -> (mtime_ns, size, {instance: target})
+        self._placed = {} # path -> (mtime_ns, size) when every target in it was last seen in the right file
+
+    def shard_path(self, instance):
+        """The file that holds the target of instance."""
+        if self.shards == 1:
+            return self.path
+        base, extension = os.path.splitext(self.path)
+        return f"{base}-{zlib.crc32(instance.encode()) % self.shards:02d}{extension}"
+
+    def shard_paths(self):
+        if self.shards == 1:
+            return [self.path]
+        base, extension = os.path.splitext(self.path)
+        return [f"{base}-{shard:02d}{extension}" for shard in range(self.shards)]
+
+    def _existing_paths(self):
+        """The unsharded file and every shard file on disk, whatever shard count wrote them."""
+        base, extension = os.path.splitext(self.path)
+        shard_pattern = re.compile(re.escape(base) + r"-\d+" + re.escape(extension))
+        shards = sorted(path for path in glob.glob(f"{glob.escape(base)}-*{extension}") if shard_pattern.fullmatch(path))
+        return [path for path in [self.path] + shards if os.path.exists(path)]
+
+    def _load(self, path):
+        """Returns {instance: target} for one file, re-reading it only if it changed since the last read."""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return {}
+        cached = self._cache.get(path)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return dict(cached[2])
+        with open(path) as f:
+            content = f.read()
+        index = {}
+        for target in json.loads(content) if content.strip() else []:
+            index[target_instance(target)] = target
+        self._cache[path] = (stat.st_mtime_ns, stat.st_size, index)
+        return dict(index)
+
+    def _write(self, path, index):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary_file = f"{path}.tmp"
+        with open(temporary_file, "w") as f:
+            json.dump(list(index.values()), f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_file, path)
+        stat = os.stat(path)
+        self._cache[path] = (stat.st_mtime_ns, stat.st_size, dict(index))
+
+    def _update(self, changes):
+        """
+        Applies {instance: target or None} and returns the number of targets added, replaced or removed.
+
+        None removes the instance. Each affected shard is locked, rewritten and unlocked in turn.
+        """
+        self._rebalance()
+        return self._apply(changes)
+
+    def _misplaced(self):
+        """Returns {path: {instance: target}} of the targets sitting in a file other than their shard_path()."""
+        misplaced = {}
+        for path in self._existing_paths():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError: # Deleted by another process's rebalance
+                continue
+            index = self._load(path)
+            if self._placed.get(path) == (stat.st_mtime_ns, stat.st_size):
+                continue
+            wrong = {instance: target for instance, target in index.items() if self.shard_path(instance) != path}
+            if wrong:
+                misplaced[path] = wrong
+            else:
+                self._placed[path] = (stat.st_mtime_ns, stat.st_size)
+        return misplaced
+
+    def _rebalance(self):
+        """Moves targets left in the wrong file by a change of the shard count, keeping any newer copy the right file already has."""
+        if not self._misplaced():
+            return
+        # Its own lock: the rebalance takes the lock of every file it rewrites, self.path's included
+        with _locked(f"{self.path}.rebalance.lock"):
+            misplaced = self._misplaced() # Another process may have moved them meanwhile
+            if not misplaced:
+                return
+            placed = {}
+            for instance in {instance for targets in misplaced.values() for instance in targets}:
+                path = self.shard_path(instance)
+                if path not in placed:
+                    placed[path] = self._load(path)
+            moved = {}
+            for targets in misplaced.values():
+                for instance, target in targets.items():
+                    if instance not in placed[self.shard_path(instance)]:
+                        moved[instance] = target
+            self._apply(moved)
+            layout = set(self.shard_paths())
+            for path, targets in misplaced.items():
+                with _locked(f"{path}.lock"):
+                    index = self._load(path)
+                    for instance in targets:
+                        index.pop(instance, None)
+                    if index or path == self.path or path in layout:
+                        # The unsharded file is emptied rather than deleted, since prometheus.yml lists it
+                        self._write(path, index)
+                    else:
+                        os.remove(path)
+                        self._cache.pop(path, None)
+            print(f"Moved {sum(len(targets) for targets in misplaced.values())} targets to their file for {self.shards} shard(s).")
+
+    def _apply(self, changes):
+        by_shard = {}
+        for instance, target in changes.items():
+            by_shard.setdefault(self.shard_path(instance), {})[instance] = target
+        changed = 0
+        for path, shard_changes in by_shard.items():
+            with _locked(f"{path}.lock"):
+                index = self._load(path)
+                shard_changed = 0
+                for instance, target in shard_changes.items():
+                    if target is None:
+                        if index.pop(instance, None) is not None:
+                            shard_changed += 1
+                    elif index.get(instance) != target:
+                        index[instance] = target
+                        shard_changed += 1
+                if shard_changed:
+                    self._write(path, index)
+                changed += shard_changed
+        return changed
+
+    def upsert(self, targets):
+        """Adds or replaces targets (file_sd dicts), keyed by instance. Returns how many actually changed."""
+        return self._update({target_instance(target): target for target in targets})
+
+    def remove(self, instances):
+        """Removes the targets of instances, ignoring ones that are not registered. Returns how many were removed."""
+        return self._update({instance: None for instance in instances})
+
+    def targets(self):
+        """Returns {instance: target} across all shards, including any not yet moved to the right file."""
+        index = {}
+        layout = self.shard_paths()
+        # Files of the current layout last, so their copy of a target wins over a stray one
+        for path in [path for path in self._existing_paths() if path not in layout] + layout:
+            index.update(self._load(path))
+        return index
+
+def main():
+    """Lists, adds or removes contributor targets from the command line."""
+    parser = argparse.ArgumentParser(description="Manage the Prometheus file_sd targets of contributor apps.")
+    parser.add_argument("action", choices=["list", "add", "remove"], help="What to do.")
+    parser.add_argument("usernames", nargs="*", help="GitHub usernames to add or remove.")
+    parser.add_argument("--file", default=DEFAULT_TARGETS_FILE, help="The targets file (the base name of the shards when sharded).")
+    parser.add_argument("--shards", type=int, default=int(os.getenv("PROMETHEUS_TARGET_SHARDS", "1")), help="Number of files the targets are spread over.")
+    args = parser.parse_args()
+
+    registry = TargetRegistry(args.file, args.shards)
+    if args.action == "list":
+        for instance, target in sorted(registry.targets().items()):
+            print(f"{instance}: {', '.join(target.get('targets', []))}")
+    elif args.action == "add":
+        print(f"{registry.upsert(prometheus_target(username) for username in args.usernames)} targets added or updated.")
+    else:
+        print(f"{registry.remove(args.usernames)} targets removed.")
+
+if __name__ == "__main__":
+    main()
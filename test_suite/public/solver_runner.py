@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+
+import argparse
+import asyncio
+import time
+
+import aiohttp
+
+URL_ANVIL_URL = "http://localhost:8080"
+
+# Every challenge is scored from the same url-anvil traffic; the name labels the solver's output.
+CHALLENGES = ("robust-service", "graceful-degradation")
+
+class AimdController:
+    """
+    Adjusts a request rate with additive-increase/multiplicative-decrease (AIMD), as TCP does.
+
+    Results are collected over adjust_interval_s windows. At the end of a window the rate is
+    cut by decrease_factor if any request got a 5xx or failed outright, or if the window's
+    average latency went over latency_target_ms; otherwise it grows by increase_rps. Only one
+    decision is made per window, so a burst of errors cuts the rate once rather than once per
+    error, and the rate settles just under the highest level the service sustains.
+    """
+
+    def __init__(self, initial_rps=1.0, min_rps=0.2, max_rps=200.0, increase_rps=0.5, decrease_factor=0.5,
+                 latency_target_ms=1000, adjust_interval_s=2.0):
+        self.rate = initial_rps
+        self.min_rps = min_rps
+        self.max_rps = max_rps
+        self.increase_rps = increase_rps
+        self.decrease_factor = decrease_factor
+        self.latency_target_ms = latency_target_ms
+        self.adjust_interval_s = adjust_interval_s
+        self._reset_window(time.monotonic())
+
+    def _reset_window(self, now):
+        self.window_start = now
+        self.window_count = 0
+        self.window_errors = 0
+        self.window_latency_ms = 0.0
+
+    def record(self, latency_ms, status):
+        """Records one result; status is the HTTP status code, or None if the request failed."""
+        self.window_count += 1
+        self.window_latency_ms += latency_ms
+        if status is None or status >= 500:
+            self.window_errors += 1
+        now = time.monotonic()
+        if now - self.window_start >= self.adjust_interval_s:
+            self._adjust(now)
+
+    def _adjust(self, now):
+        average_ms = self.window_latency_ms / self.window_count if self.window_count else 0
+        if self.window_errors or average_ms > self.latency_target_ms:
+            self.rate = max(self.min_rps, self.rate * self.decrease_factor)
+        else:
+            self.rate = min(self.max_rps, self.rate + self.increase_rps)
+        self._reset_window(now)
+
+class SampleUrlCache:
+    """
+    Caches the URL list from /api/sample-urls and refreshes it once it is ttl_s old.
+
+    If a refresh fails, the stale list keeps being used until the next refresh succeeds.
+    """
+
+    def __init__(self, session, base_url, ttl_s=60):
+        self.session = session
+        self.base_url = base_url
+        self.ttl_s = ttl_s
+        self.urls = None
+        self.fetched_at = None
+        self._lock = asyncio.Lock()
+
+    async def get(self):
+        if self.urls is not None and time.monotonic() - self.fetched_at < self.ttl_s:
+            return self.urls
+        async with self._lock:
+            # Another task may have refreshed the list while this one waited for the lock
+            if self.urls is None or time.monotonic() - self.fetched_at >= self.ttl_s:
+                try:
+                    async with self.session.get(f"{self.base_url}/api/sample-urls") as response:
+                        response.raise_for_status()
+                        self.urls = await response.json()
+                    self.fetched_at = time.monotonic()
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    print(f"Error fetching sample URLs from {self.base_url}: {e}")
+                    if self.urls is None:
+                        return None
+                    self.fetched_at = time.monotonic() # Retry after another TTL, not on every request
+        return self.urls
+
+class Solver:
+    """Drives one challenge against one url-anvil target at the rate its AimdController allows."""
+
+    def __init__(self, challenge, base_url, session, controller, url_cache, max_in_flight=100, report_interval_s=10):
+        self.challenge = challenge
+        self.base_url = base_url
+        self.session = session
+        self.controller = controller
+        self.url_cache = url_cache
+        self.max_in_flight = max_in_flight
+        self.report_interval_s = report_interval_s
+        self.in_flight = set()
+        self.sent = 0
+        self.succeeded = 0
+        self.failed = 0
+
+    async def send_test(self):
+        start = time.monotonic()
+        status = None
+        try:
+            urls = await self.url_cache.get()
+            if urls is not None: # Without sample URLs the attempt counts as a failure, which slows the solver down
+                async with self.session.post(f"{self.base_url}/api/test", json={"urls": urls}) as response:
+                    await response.read()
+                    status = response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"[{self.challenge} @ {self.base_url}] Error sending request: {e}")
+        latency_ms = (time.monotonic() - start) * 1000
+        if status is not None and status < 400:
+            self.succeeded += 1
+        else:
+            self.failed += 1
+        self.controller.record(latency_ms, status)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        next_send = loop.time()
+        next_report = next_send + self.report_interval_s
+        while True:
+            if len(self.in_flight) >= self.max_in_flight:
+                # The service is not keeping up; treat the backlog as congestion instead of queueing more
+                self.controller.record(self.controller.latency_target_ms * 2, None)
+            else:
+                task = asyncio.ensure_future(self.send_test())
+                self.in_flight.add(task)
+                task.add_done_callback(self.in_flight.discard)
+                self.sent += 1
+            if loop.time() >= next_report:
+                print(f"[{self.challenge} @ {self.base_url}] rate {self.controller.rate:.2f} RPS, "
+                      f"{self.succeeded} succeeded, {self.failed} failed, {len(self.in_flight)} in flight")
+                next_report += self.report_interval_s
+            next_send += 1 / self.controller.rate
+            await asyncio.sleep(max(0.0, next_send - loop.time()))
+
+async def run_solvers(challenges, targets, max_connections=100, sample_ttl_s=60, duration_s=None, **controller_options):
+    """
+    Runs one Solver per (challenge, target) pair on a single pooled aiohttp session.
+
+    Solvers for the same target share one SampleUrlCache. Runs until cancelled, or for
+    duration_s seconds if given.
+    """
+    connector = aiohttp.TCPConnector(limit=max_connections)
+    timeout = aiohttp.ClientTimeout(total=30)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        caches = {target: SampleUrlCache(session, target, sample_ttl_s) for target in targets}
+        solvers = [
+            Solver(challenge, target, session, AimdController(**controller_options), caches[target], max_connections)
+            for challenge in challenges
+            for target in targets
+        ]
+        for solver in solvers:
+            print(f"--- Starting {solver.challenge} solver against {solver.base_url} ---")
+        tasks = [asyncio.ensure_future(solver.run()) for solver in solvers]
+        try:
+            await asyncio.wait_for(asyncio.gather(*tasks), duration_s)
+        except asyncio.TimeoutError:
+            pass # duration_s elapsed
+        finally:
+            for task in tasks:
+                task.cancel()
+            in_flight = [task for solver in solvers for task in solver.in_flight]
+            if in_flight:
+                await asyncio.wait(in_flight, timeout=5)
+
+def run_solver_daemon(challenges, targets, **options):
+    """Blocking entry point used by the solve_*.py scripts. Stops cleanly on Ctrl+C."""
+    try:
+        asyncio.run(run_solvers(challenges, targets, **options))
+    except KeyboardInterrupt:
+        print("Solver stopped.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive one or more challenges against one or more url-anvil targets with adaptive pacing.")
+    parser.add_argument("--challenge", action="append", choices=CHALLENGES, help="Challenge to solve. Repeat for several (default: all).")
+    parser.add_argument("--target", action="append", help=f"url-anvil base URL. Repeat for several (default: {URL_ANVIL_URL}).")
+    parser.add_argument("--initial-rps", type=float, default=1.0, help="Starting request rate per solver.")
+    parser.add_argument("--min-rps", type=float, default=0.2, help="The rate is never cut below this.")
+    parser.add_argument("--max-rps", type=float, default=200.0, help="The rate is never raised above this.")
+    parser.add_argument("--increase-rps", type=float, default=0.5, help="Added to the rate after every healthy adjustment window.")
+    parser.add_argument("--decrease-factor", type=float, default=0.5, help="The rate is multiplied by this after a window with 5xx responses or high latency.")
+    parser.add_argument("--latency-target-ms", type=float, default=1000, help="Average latency above which a window counts as overloaded.")
+    parser.add_argument("--adjust-interval", type=float, default=2.0, help="Length of an adjustment window, in seconds.")
+    parser.add_argument("--sample-ttl", type=float, default=60, help="Seconds before the list from /api/sample-urls is refreshed.")
+    parser.add_argument("--max-connections", type=int, default=100, help="Size of the shared connection pool, and the in-flight cap of each solver.")
+    parser.add_argument("--duration", type=float, help="Stop after this many seconds (default: run until interrupted).")
+    args = parser.parse_args()
+
+    if not 0 < args.min_rps <= args.initial_rps <= args.max_rps:
+        parser.error("Rates must satisfy 0 < --min-rps <= --initial-rps <= --max-rps.")
+    if not 0 < args.decrease_factor < 1:
+        parser.error("--decrease-factor must be between 0 and 1.")
+
+    run_solver_daemon(
+        args.challenge or list(CHALLENGES),
+        [target.rstrip("/") for target in args.target or [URL_ANVIL_URL]],
+        max_connections=args.max_connections,
+        sample_ttl_s=args.sample_ttl,
+        duration_s=args.duration,
+        initial_rps=args.initial_rps,
+        min_rps=args.min_rps,
+        max_rps=args.max_rps,
+        increase_rps=args.increase_rps,
+        decrease_factor=args.decrease_factor,
+        latency_target_ms=args.latency_target_ms,
+        adjust_interval_s=args.adjust_interval
+    )
+
+if __name__ == "__main__":
+    main()